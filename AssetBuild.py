@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Build step that rasterizes the vectorized/*.svg sources into PNG images.
+
+Every SVG is rendered at several scales into a content-addressed cache
+(.cache/img/<name>@<scale>x-<hash>.png); files whose source and settings are
+unchanged are skipped. Rendering is done by Inkscape (the program the SVGs
+were drawn with) and runs in parallel. A scale-1 image is as large as the
+hand-made img/<name>.png it replaces, SVGs without such a counterpart (e.g.
+decorative sprites) are rendered at Inkscape's 90 dpi.
+
+The editor and the game call scaledImagePaths() to get the cached images of
+the scale that best matches the display (see displayScale()).
+
+Usage: python AssetBuild.py [-s SCALE...] [-j JOBS] [--force]
+"""
+
+import argparse, hashlib, json, os, re, struct, subprocess, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+SVG_DIR   = os.path.join(SCRIPT_PATH, 'vectorized')
+IMG_DIR   = os.path.join(SCRIPT_PATH, 'img')
+CACHE_DIR = os.path.join(SCRIPT_PATH, '.cache', 'img')
+
+DEFAULT_SCALES = (1, 1.5, 2, 3)
+# Inkscape 0.x renders one user unit per pixel at 90 dpi
+BASE_DPI = 90.
+# Bump to invalidate all cached images (e.g. after changing render options)
+RASTER_VERSION = 1
+# The Inkscape executable
+INKSCAPE = os.environ.get('MAYDAY_INKSCAPE', 'inkscape')
+
+# Image names of the SVG sources. SVGs not listed here use their own name;
+# those mapped to None are not assets.
+SVG_TARGETS = {'addbuttonStraight':      'addstraight',
+               'addbuttonHelixArc':      'addhelixarc',
+               'addbuttonBezierArc':     'addbezierarc',
+               'appendbuttonStraight':   'appendstraight',
+               'changeActiveEndButton':  'changeActiveEnd',
+               'deleteObject':           'deleteobjects',
+               'exitbutton':             'exitProgram',
+               'flattenpathpiecebutton': 'flattenpathpiece',
+               'focusbutton':            'focus',
+               'loadscenebutton':        'loadScene',
+               'newscenebutton':         'newScene',
+               'savescenebutton':        'saveScene',
+               'undobutton':             'undo',
+               'button_template':        None}
+
+_inkscapeMajorVersion = []
+
+#_______________________________________________________________________
+
+
+def pngSize(path):
+  """(width, height) of a PNG file, read from its header"""
+  with open(path, 'rb') as f:
+    header = f.read(24)
+  if header[12:16] != b'IHDR':
+    raise ValueError('%s is not a PNG file' % path)
+  return struct.unpack('>II', header[16:24])
+
+
+def svgSources():
+  """All SVG sources that are assets, as {image name: svg path}"""
+  sources = {}
+  for filename in sorted(os.listdir(SVG_DIR)):
+    stem, ext = os.path.splitext(filename)
+    if ext.lower() != '.svg':
+      continue
+    name = SVG_TARGETS.get(stem, stem)
+    if name is not None:
+      sources[name] = os.path.join(SVG_DIR, filename)
+  return sources
+
+
+def baseSize(name):
+  """Pixel size of an image at scale 1, or None to render at BASE_DPI"""
+  path = os.path.join(IMG_DIR, name+'.png')
+  return pngSize(path) if os.path.isfile(path) else None
+
+
+def inkscapeMajorVersion():
+  if not _inkscapeMajorVersion:
+    output = subprocess.check_output([INKSCAPE, '--version'])
+    match = re.search(r'Inkscape (\d+)', output.decode('utf-8', 'replace'))
+    _inkscapeMajorVersion.append(int(match.group(1)) if match else 0)
+  return _inkscapeMajorVersion[0]
+
+
+def rasterizeCommand(svgPath, pngPath, size=None, dpi=BASE_DPI):
+  """Inkscape command line rendering the SVG's drawing area to a PNG"""
+  if inkscapeMajorVersion() >= 1:
+    command = [INKSCAPE, '--export-type=png', '--export-filename='+pngPath]
+  else:
+    command = [INKSCAPE, '--without-gui', '--export-png='+pngPath]
+  command.append('--export-area-drawing')
+  if size is not None:
+    command += ['--export-width=%d' % size[0], '--export-height=%d' % size[1]]
+  else:
+    command.append('--export-dpi=%g' % dpi)
+  return command + [svgPath]
+
+
+def cachedFileName(name, scale, svgPath, size):
+  """Content-addressed file name of a rendered image"""
+  digest = hashlib.sha1()
+  with open(svgPath, 'rb') as f:
+    digest.update(f.read())
+  digest.update(repr((scale, size, RASTER_VERSION)).encode('utf-8'))
+  return '%s@%gx-%s.png' % (name, scale, digest.hexdigest()[:12])
+
+
+def loadManifest():
+  """{image name: {scale (as string): cached file name}}"""
+  try:
+    with open(os.path.join(CACHE_DIR, 'index.json')) as f:
+      return json.load(f)
+  except (IOError, OSError, ValueError):
+    return {}
+
+
+def rasterize(name, svgPath, scale, force=False):
+  """Render one SVG at one scale unless the cache already has it.
+  Returns (name, scale, file name, seconds, whether it was rendered)."""
+  start = time.time()
+  size = baseSize(name)
+  if size is not None:
+    size = (int(round(size[0]*scale)), int(round(size[1]*scale)))
+  filename = cachedFileName(name, scale, svgPath, size)
+  path = os.path.join(CACHE_DIR, filename)
+  if os.path.isfile(path) and not force:
+    return name, scale, filename, time.time()-start, False
+  tmpPath = path + '.tmp.png'
+  try:
+    with open(os.devnull, 'w') as devnull:
+      subprocess.check_call(rasterizeCommand(svgPath, tmpPath, size,
+                                             BASE_DPI*scale),
+                            stdout=devnull, stderr=devnull)
+    os.rename(tmpPath, path)
+  finally:
+    if os.path.isfile(tmpPath):
+      os.remove(tmpPath)
+  return name, scale, filename, time.time()-start, True
+
+
+def buildAssets(scales=DEFAULT_SCALES, jobs=None, force=False, log=None):
+  """Bring the images of the given scales up to date. The cache keeps the
+  other scales rendered before; only images of SVGs that are gone and
+  older renders of a rebuilt (name, scale) are removed. An image Inkscape
+  fails to render keeps its previous render, if any.
+  Returns the new manifest and the (name, scale) pairs that failed."""
+  if not os.path.isdir(CACHE_DIR):
+    os.makedirs(CACHE_DIR)
+  sources = svgSources()
+  manifest = dict((name, entry) for name, entry in loadManifest().items()
+                  if name in sources)
+  failed = []
+  with ThreadPoolExecutor(max_workers=jobs or 4) as executor:
+    futures = [(name, scale,
+                executor.submit(rasterize, name, svgPath, scale, force))
+               for name, svgPath in sorted(sources.items())
+               for scale in scales]
+    for name, scale, future in futures:
+      try:
+        name, scale, filename, seconds, rendered = future.result()
+      except subprocess.CalledProcessError as e:
+        failed.append((name, scale))
+        if log is not None:
+          log('%-24s %4gx  FAILED (%s exited with status %d)' %
+              (name, scale, os.path.basename(sources[name]), e.returncode))
+        continue
+      manifest.setdefault(name, {})['%g' % scale] = filename
+      if log is not None:
+        log('%-24s %4gx  %s (%.1f ms)' % (name, scale,
+                                           'rendered' if rendered else 'unchanged',
+                                           1000.*seconds))
+  # Drop images that are no longer referenced
+  referenced = set(f for entry in manifest.values() for f in entry.values())
+  for filename in os.listdir(CACHE_DIR):
+    if filename.endswith('.png') and filename not in referenced:
+      os.remove(os.path.join(CACHE_DIR, filename))
+  with open(os.path.join(CACHE_DIR, 'index.json'), 'w') as f:
+    json.dump(manifest, f, indent=1, sort_keys=True)
+  return manifest, failed
+
+
+def bestScale(available, wanted):
+  """The smallest available scale that is at least the wanted one (images
+  are rather scaled down than up), else the largest available one"""
+  available = sorted(available)
+  for scale in available:
+    if scale >= wanted:
+      return scale
+  return available[-1]
+
+
+def scaledImagePaths(wanted, manifest=None):
+  """Paths of the cached images best matching a display scale, by name"""
+  if manifest is None:
+    manifest = loadManifest()
+  paths = {}
+  for name, entry in manifest.items():
+    scale = bestScale([float(s) for s in entry], wanted)
+    path = os.path.join(CACHE_DIR, entry['%g' % scale])
+    if os.path.isfile(path):
+      paths[str(name)] = path
+  return paths
+
+
+def displayScale(screenHeight=None):
+  """UI scale for a screen: MAYDAY_UI_SCALE if set, else derived from the
+  screen height in pixels (1 up to 1200 lines, then in steps of 0.5)"""
+  if os.environ.get('MAYDAY_UI_SCALE'):
+    return float(os.environ['MAYDAY_UI_SCALE'])
+  if not screenHeight:
+    return 1.
+  return max(1., round(screenHeight/1200.*2.)/2.)
+
+#_______________________________________________________________________
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+             description='Rasterize the vectorized/*.svg sources')
+  parser.add_argument('-s', '--scales', type=float, nargs='+',
+                      default=list(DEFAULT_SCALES),
+                      help='scales to render (default: %(default)s)')
+  parser.add_argument('-j', '--jobs', type=int, default=None,
+                      help='number of parallel renders (default: 4)')
+  parser.add_argument('--force', action='store_true',
+                      help='render even if the cache is up to date')
+  args = parser.parse_args(argv)
+  def log(line):
+    print(line)
+  start = time.time()
+  try:
+    manifest, failed = buildAssets(args.scales, args.jobs, args.force, log)
+  except OSError as e:
+    print('Cannot run %s: %s' % (INKSCAPE, e))
+    return 1
+  print('%d image(s) at %d scale(s), %d failed render(s), %.2f s total' %
+        (len(manifest), len(args.scales), len(failed), time.time()-start))
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,225 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Clearance between PathPieces.
+
+A ClearanceChecker finds the places where two PathPieces come closer than a
+minimum clearance (e.g. a HelixArc coiling past a BezierArc). Each piece gets
+a bounding volume hierarchy over the segments between its points3dHD samples
+(PathIndex.SegmentBVH); pairs of pieces whose bounding boxes are close are
+compared by descending both hierarchies together, skipping all branches that
+are farther apart than the closest pair found so far.
+
+The hierarchies are those of a PathIndex, which may be shared with other
+users such as snapping. Like PathGraph, the checker listens to its pieces and
+only re-examines changed ones, against the pieces the index's PieceTree finds
+near them.
+
+Where two pieces are joined (see PathNetwork.PathGraph), they of course meet;
+segments within a few clearances of the joined ends are not compared.
+"""
+
+from math import sqrt
+from PathGeometry import Point3D
+from PathIndex import PathIndex
+
+# Pieces closer than this are reported
+MIN_CLEARANCE = 20.
+# Segments this many clearances (of arc length) from joined ends are ignored
+JOINT_MARGIN = 2.
+
+#_______________________________________________________________________
+
+
+def segmentDistance(p1, q1, p2, q2):
+  """Distance between the segments p1-q1 and p2-q2 (coordinate tuples) and
+  the closest points on each. (Ericson, Real-Time Collision Detection 5.1.9)"""
+  d1 = (q1[0]-p1[0], q1[1]-p1[1], q1[2]-p1[2])
+  d2 = (q2[0]-p2[0], q2[1]-p2[1], q2[2]-p2[2])
+  r  = (p1[0]-p2[0], p1[1]-p2[1], p1[2]-p2[2])
+  a = d1[0]*d1[0] + d1[1]*d1[1] + d1[2]*d1[2]
+  e = d2[0]*d2[0] + d2[1]*d2[1] + d2[2]*d2[2]
+  f = d2[0]*r[0] + d2[1]*r[1] + d2[2]*r[2]
+  if a <= 1e-12 and e <= 1e-12:
+    s = t = 0.
+  elif a <= 1e-12:
+    s = 0.
+    t = max(0., min(1., f/e))
+  else:
+    c = d1[0]*r[0] + d1[1]*r[1] + d1[2]*r[2]
+    if e <= 1e-12:
+      t = 0.
+      s = max(0., min(1., -c/a))
+    else:
+      b = d1[0]*d2[0] + d1[1]*d2[1] + d1[2]*d2[2]
+      denom = a*e - b*b
+      s = max(0., min(1., (b*f - c*e)/denom)) if denom > 1e-12 else 0.
+      t = (b*s + f)/e
+      if t < 0.:
+        t = 0.
+        s = max(0., min(1., -c/a))
+      elif t > 1.:
+        t = 1.
+        s = max(0., min(1., (b-c)/a))
+  c1 = (p1[0]+d1[0]*s, p1[1]+d1[1]*s, p1[2]+d1[2]*s)
+  c2 = (p2[0]+d2[0]*t, p2[1]+d2[1]*t, p2[2]+d2[2]*t)
+  dx, dy, dz = c1[0]-c2[0], c1[1]-c2[1], c1[2]-c2[2]
+  return sqrt(dx*dx + dy*dy + dz*dz), c1, c2
+
+
+def boxGap(a, offsetA, b, offsetB):
+  """Squared distance between two BVH node boxes, shifted by offsets"""
+  gap = 0.
+  for k in range(3):
+    d = (b[2+k]+offsetB[k]) - (a[5+k]+offsetA[k])
+    if d <= 0.:
+      d = (a[2+k]+offsetA[k]) - (b[5+k]+offsetB[k])
+    if d > 0.:
+      gap += d*d
+  return gap
+
+
+def closestSegments(bvhA, offsetA, bvhB, offsetB, limit, skip=None):
+  """Closest pair of segments of two hierarchies (shifted by offsets) that
+  is nearer than limit: (distance, point on A, point on B), or None.
+  skip(i, j) may exclude segment pairs."""
+  if not bvhA.nodes or not bvhB.nodes:
+    return None
+  best = None
+  bestDistance = limit
+  stack = [(0, 0)]
+  while stack:
+    ia, ib = stack.pop()
+    a, b = bvhA.nodes[ia], bvhB.nodes[ib]
+    if boxGap(a, offsetA, b, offsetB) >= bestDistance*bestDistance:
+      continue
+    if a[8] < 0 and b[8] < 0:
+      pa, pb = bvhA.points, bvhB.points
+      for i in range(a[0], a[1]):
+        p1 = (pa[i][0]+offsetA[0], pa[i][1]+offsetA[1], pa[i][2]+offsetA[2])
+        q1 = (pa[i+1][0]+offsetA[0], pa[i+1][1]+offsetA[1],
+              pa[i+1][2]+offsetA[2])
+        for j in range(b[0], b[1]):
+          if skip is not None and skip(i, j):
+            continue
+          p2 = (pb[j][0]+offsetB[0], pb[j][1]+offsetB[1], pb[j][2]+offsetB[2])
+          q2 = (pb[j+1][0]+offsetB[0], pb[j+1][1]+offsetB[1],
+                pb[j+1][2]+offsetB[2])
+          d, c1, c2 = segmentDistance(p1, q1, p2, q2)
+          if d < bestDistance:
+            bestDistance = d
+            best = (d, Point3D(*c1), Point3D(*c2))
+    # Descend into the larger (or the only inner) node first
+    elif b[8] < 0 or (a[8] >= 0 and a[1]-a[0] >= b[1]-b[0]):
+      stack.append((a[8], ib))
+      stack.append((a[9], ib))
+    else:
+      stack.append((ia, b[8]))
+      stack.append((ia, b[9]))
+  return best
+
+
+class ClearanceChecker(object):
+  """@class ClearanceChecker
+  Pairs of PathPieces closer than a clearance, kept up to date as the
+  pieces change. violations() lists them as tuples
+    (piece A, piece B, distance, closest point on A, closest point on B)
+  with world coordinates.
+  """
+  def __init__(self, graph=None, clearance=MIN_CLEARANCE, index=None):
+    self.graph = graph
+    self.clearance = clearance
+    self.index = PathIndex() if index is None else index
+    self.pieces = set()
+    self.changed = set()
+    # Violations by pair of pieces
+    self.pairViolations = {}
+
+  def addPiece(self, piece):
+    if piece in self.pieces:
+      return
+    self.pieces.add(piece)
+    self.index.addPiece(piece)
+    piece.observers.append(self.pieceChanged)
+    self.changed.add(piece)
+
+  def removePiece(self, piece):
+    if piece not in self.pieces:
+      return
+    piece.observers.remove(self.pieceChanged)
+    self.pieces.remove(piece)
+    self.index.removePiece(piece)
+    self.changed.discard(piece)
+    self.forgetViolations(piece)
+
+  def setPieces(self, pieces):
+    """Make the checker contain exactly the given pieces"""
+    pieces = set(pieces)
+    for piece in self.pieces - pieces:
+      self.removePiece(piece)
+    for piece in pieces - self.pieces:
+      self.addPiece(piece)
+
+  def pieceChanged(self, piece):
+    """Observer callback"""
+    self.changed.add(piece)
+
+  def forgetViolations(self, piece):
+    for pair in [pair for pair in self.pairViolations if piece in pair]:
+      del self.pairViolations[pair]
+
+  def jointFilter(self, a, b):
+    """skip() for closestSegments(): segment pairs next to ends of a and b
+    that are joined to each other"""
+    if self.graph is None:
+      return None
+    margin = JOINT_MARGIN*self.clearance
+    joints = [(endA, endB) for endA in (0, 1)
+                           for piece, endB in self.graph.joinedEnds((a, endA))
+                           if piece is b]
+    if not joints:
+      return None
+    tableA, tableB = a.arcLengths(), b.arcLengths()
+    def nearEnd(table, i, end):
+      return table[i] < margin if end == 0 else table[-1]-table[i+1] < margin
+    def skip(i, j):
+      for endA, endB in joints:
+        if nearEnd(tableA, i, endA) and nearEnd(tableB, j, endB):
+          return True
+      return False
+    return skip
+
+  def checkPair(self, a, b):
+    ca, cb = a.center, b.center
+    found = closestSegments(self.index.bvh(a), (ca.x, ca.y, ca.z),
+                            self.index.bvh(b), (cb.x, cb.y, cb.z),
+                            self.clearance, self.jointFilter(a, b))
+    if found is None:
+      return None
+    return (a, b) + found
+
+  def update(self):
+    """Re-examine all changed pieces against all others"""
+    if not self.changed:
+      return
+    for piece in self.changed:
+      self.forgetViolations(piece)
+    tree = self.index.pieceTree()
+    done = set()
+    for a in self.changed:
+      done.add(a)
+      box = self.index.worldBox(a)
+      if box is None:
+        continue
+      for b in tree.overlapping(box, self.clearance):
+        # The index may be shared with pieces the checker does not have
+        if b in done or b not in self.pieces:
+          continue
+        violation = self.checkPair(a, b)
+        if violation is not None:
+          self.pairViolations[(a, b)] = violation
+    self.changed = set()
+
+  def violations(self):
+    self.update()
+    return list(self.pairViolations.values())
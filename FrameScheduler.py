@@ -0,0 +1,161 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Per-frame updates of changed PathPieces, and deferred work run in the spare
+time of frames.
+
+Editing a piece in the editor used to recompute and render it right away,
+once per mutator call: a drag that changes an end and then snaps it, or a
+button that edits several parameters, paid for several recomputes and HD
+renders within one frame, most of them never shown. Instead, mutators now
+only mark what became outdated, and an UpdateScheduler brings each marked
+piece up to date once, at the end of the update phase:
+
+  geometry    the shape parameters were edited: recompute the samples
+              (see PathPieceGeometry.invalidateGeometry()), notify the
+              observers, render
+  position    the piece was moved: notify the observers and move the
+              handles; its surface does not depend on its position
+  appearance  only the surface is outdated (e.g. (de)selected): render
+
+Reading the samples of a piece with outdated geometry still recomputes them
+first, so code between a mutation and the flush never sees stale samples.
+
+While the user drags something, the editor flushes in low definition (the
+coarse level of detail, see LevelEditor.projectSamples()); refine() then
+renders the pieces drawn that way once more, in HD, after the release.
+
+Work that need not be done in a particular frame (e.g. rendering all pieces
+in HD once the camera stopped moving) goes to a TaskScheduler instead: each
+frame runs the due tasks, most urgent first, only until a time budget is
+spent, so that a lot of such work is spread over several frames instead of
+stalling one.
+
+Like PathGeometry, this module imports neither pygame nor gtk.
+"""
+
+import time
+from heapq import heappush, heappop
+
+#_______________________________________________________________________
+
+
+class UpdateScheduler(object):
+  """@class UpdateScheduler
+  The pieces marked since the last flush(), by what became outdated.
+  """
+  def __init__(self):
+    self.reshaped = set()
+    self.moved = set()
+    self.restyled = set()
+    # Pieces whose last render by flush() was in low definition
+    self.sketched = set()
+
+  def markGeometry(self, piece):
+    self.reshaped.add(piece)
+
+  def markPosition(self, piece):
+    self.moved.add(piece)
+
+  def markAppearance(self, piece):
+    self.restyled.add(piece)
+
+  def refine(self):
+    """Have the next flush() render the pieces it last rendered in low
+    definition again"""
+    self.restyled |= self.sketched
+    self.sketched = set()
+
+  def __len__(self):
+    return len(self.reshaped | self.moved | self.restyled)
+
+  def flush(self, onScene, highdefinition=True, render=True):
+    """Update the marked pieces that are in onScene (pieces deleted since
+    they were marked are dropped), each once. With render False, the
+    caller renders all pieces itself (e.g. after the camera changed).
+    Returns the pieces rendered."""
+    onScene = set(onScene)
+    reshaped = self.reshaped & onScene
+    changed = (reshaped | self.moved) & onScene
+    restyled = (reshaped | self.restyled) & onScene if render else set()
+    self.reshaped, self.moved, self.restyled = set(), set(), set()
+    for piece in reshaped:
+      piece.updateGeometry()
+    for piece in changed:
+      piece.notifyObservers()
+      if piece not in restyled:
+        piece.updatePixelPositions()
+    for piece in restyled:
+      piece.render(highdefinition)
+    if highdefinition:
+      self.sketched -= restyled
+    else:
+      self.sketched |= restyled
+    return restyled
+
+
+class TaskScheduler(object):
+  """@class TaskScheduler
+  Deferred tasks: callables submitted with a priority (lower runs first)
+  and optionally a key and a number of frames to wait. A task submitted
+  under the key of a pending one replaces it. A task that returns True is
+  not done yet and runs again in a later frame (so long work can be split
+  into steps).
+  """
+  def __init__(self, clock=time.time):
+    self.clock = clock
+    self.frame = 0
+    # Pending tasks by key: (serial number, task, priority). The tasks that
+    # are due wait in the ready heap as (priority, serial number, key), the
+    # others in the delayed heap as (first frame, serial number, key); both
+    # may hold entries of replaced or cancelled tasks, which are skipped.
+    self.tasks = {}
+    self.ready = []
+    self.delayed = []
+    self.submitted = 0
+
+  def __len__(self):
+    return len(self.tasks)
+
+  def submit(self, task, priority=0, key=None, delay=0):
+    """Run task() in a frame delay or more frames from now"""
+    self.submitted += 1
+    if key is None:
+      key = ('task', self.submitted)
+    self.tasks[key] = (self.submitted, task, priority)
+    if delay > 0:
+      heappush(self.delayed, (self.frame+delay, self.submitted, key))
+    else:
+      heappush(self.ready, (priority, self.submitted, key))
+
+  def cancel(self, key):
+    self.tasks.pop(key, None)
+
+  def isPending(self, key, serial):
+    pending = self.tasks.get(key)
+    return pending is not None and pending[0] == serial
+
+  def run(self, budget):
+    """Start the next frame: run the due tasks in order of priority until
+    budget seconds are spent, but at least one. Returns the number of
+    tasks run."""
+    self.frame += 1
+    while self.delayed and self.delayed[0][0] <= self.frame:
+      frame, serial, key = heappop(self.delayed)
+      if self.isPending(key, serial):
+        heappush(self.ready, (self.tasks[key][2], serial, key))
+    start = self.clock()
+    again = []
+    count = 0
+    while self.ready and (not count or self.clock()-start < budget):
+      priority, serial, key = heappop(self.ready)
+      if not self.isPending(key, serial):
+        continue
+      task = self.tasks.pop(key)[1]
+      count += 1
+      if task() and key not in self.tasks:
+        again.append((key, serial, task, priority))
+    for key, serial, task, priority in again:
+      self.tasks[key] = (serial, task, priority)
+      heappush(self.delayed, (self.frame+1, serial, key))
+    return count
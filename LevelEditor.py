@@ -42,17 +42,47 @@
 ########################################################################
 
 import pygame
-from math import pi, sin, cos
-import logging, sys, os, pickle, shelve
+from math import pi, sin, cos, ceil
+import logging, sys, os, copy
 from collections import deque
-from math import sqrt
-import gtk
-
-SCRIPT_PATH = os.path.dirname(__file__)
+import TextureAtlas, AssetBuild, PathNetwork, PathIndex, Clearance, \
+       FrameScheduler
+from PathGeometry import Point3D, PathPieceGeometry, StraightGeometry, \
+                         HelixArcGeometry, BezierArcGeometry, Path, \
+                         serializeObjects, unshelveObjects, \
+                         readScene, writeShelvedScene, dot, \
+                         transformPieces
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Size of the GUI relative to the original 50 pixel buttons; set in main()
+# from the display resolution (see AssetBuild.displayScale())
+UI_SCALE    = 1.
+BUTTON_SIZE = 50
+
+# All GUI images packed into one surface, loaded by loadImage()
+imageAtlas = None
+
+def loadImage(name):
+  """The image img/<name>.png at UI_SCALE, as a part of the (cached) image
+  atlas. Where AssetBuild has rasterized the SVG source of an image at a
+  higher resolution, that rendering is used instead of a scaled PNG."""
+  global imageAtlas
+  if imageAtlas is None:
+    sources = TextureAtlas.imageSources('{}/img'.format(SCRIPT_PATH))
+    renderings = {}
+    if UI_SCALE != 1.:
+      renderings = dict((n, p) for n, p in
+                        AssetBuild.scaledImagePaths(UI_SCALE).items()
+                        if n in sources)
+    imageAtlas = TextureAtlas.loadAtlas(sources,
+                                        '{}/.cache'.format(SCRIPT_PATH),
+                                        UI_SCALE, renderings)
+  return imageAtlas.image(name)
 
 WINDOW_SIZE = [800, 600]
 ORIGIN      = [WINDOW_SIZE[0]//2, WINDOW_SIZE[1]//2]
-CAMERA_POSITION = [0., 0., 0.]
+CAMERA_POSITION = Point3D(0., 0., 0.)
 AZIMUTH_ANGULAR_SPEED         = 0.05
 ELEVATION_ANGULAR_SPEED       = 0.05
 ZOOM_IN_SPEED                 = 1.05
@@ -65,12 +95,38 @@ MOUSE_ZOOM_OUT_SPEED          = 0.1
 # Frames to wait until rendering objects in higher resolution
 HQ_FRAME_DELAY = 3
 
+# Seconds per frame spent on deferred tasks (see idleTasks), and the
+# priorities of these tasks (lower runs first)
+IDLE_TASK_BUDGET = .01
+HD_RENDER_PRIORITY = 0
+
 # Visually indicate paths below the (z=0)-plane by rendering sparsely
 UNDERGROUND_POINT_SKIP = 5
 
+# Path pieces are rendered from the level of detail that has about one sample
+# per pixel, or (while not rendering in HD) one per this many pixels
+LOW_DEFINITION_PIXELS = 8.
+
 # Don't have to keep the mouse perfectly still for "clicks" (vs dragging)
 DRAGGING_DISTANCE_THRESHOLD = 5
 
+# SHIFT+CTRL-dragging a HelixArc's end shrinks its radius down to this
+MIN_HELIX_RADIUS = 1.
+
+# Keyboard transformations of the selection: distance moved per frame by the
+# arrow and page keys, degrees turned per R, factor scaled per [ or ]
+KEYBOARD_MOVE_STEP = 10.
+KEYBOARD_TURN_STEP = 15.
+KEYBOARD_SCALE_STEP = 1.1
+
+# Offer to close a path into a loop if its open ends are at most this far apart
+CLOSE_PATH_DISTANCE = 100.
+
+# CTRL-dragged ends snap onto paths within this many pixels of the cursor
+# (and onto their ends if these are that close along the path), else to the
+# ground grid
+SNAP_PIXELS = 10.
+
 # Camera parameters
 azimuth   = 315.*(pi/180.)
 elevation = -66.*(pi/180.)
@@ -84,29 +140,39 @@ zoom  = 1.
 # Instead, all pixels within a disk around the cursor are checked.
 # WARNING: Do not set this radius to 0!
 CLICK_TOLERANCE_RADIUS  = 5
+# The offset tables are filled by computeOffsetTables()
 CLICK_TOLERANCE_OFFSETS = []
 MARK_RING_OFFSETS = []
 MARK_DOT_OFFSETS  = []
-for y in range(-CLICK_TOLERANCE_RADIUS,CLICK_TOLERANCE_RADIUS+1):
-  for x in range(-CLICK_TOLERANCE_RADIUS,CLICK_TOLERANCE_RADIUS+1):
-    if x**2+y**2 <= CLICK_TOLERANCE_RADIUS**2+1:
-      CLICK_TOLERANCE_OFFSETS.append((x, y))
-    if CLICK_TOLERANCE_RADIUS**2-8 <= x**2+y**2 <= CLICK_TOLERANCE_RADIUS**2+1:
-      MARK_RING_OFFSETS.append((x, y))
-    if x**2+y**2 <= CLICK_TOLERANCE_RADIUS**2-16:
-      MARK_DOT_OFFSETS.append((x,y))
-
-markring      = pygame.Surface((2*CLICK_TOLERANCE_RADIUS+1,
-                                2*CLICK_TOLERANCE_RADIUS+1))
-markdot       = pygame.Surface((2*CLICK_TOLERANCE_RADIUS+1,
-                                2*CLICK_TOLERANCE_RADIUS+1))
-markrectangle = pygame.Surface((2*CLICK_TOLERANCE_RADIUS+1,
-                                2*CLICK_TOLERANCE_RADIUS+1))
+
+# Markers for path piece ends and Bezier control points; created by
+# prerenderMarkers() once the display has been set up
+markring = markdot = markrectangle = None
 
 # A list of all on-screen objects (including buttons!)
 objectsList = []
 # The currently selected objects
 selectedObjects = []
+# Set by scenePiecesChanged() when PathPieces are added to or removed from
+# objectsList; the main loop then syncs the indexes below with the scene
+scenePiecesDirty = True
+# Joins between the ends of the scene's PathPieces; kept in sync with
+# objectsList by syncSceneIndexes()
+pathGraph = PathNetwork.PathGraph()
+# Nearest-point queries on the PathPieces' samples, e.g. for snapping;
+# synced like pathGraph
+pathIndex = PathIndex.PathIndex()
+# Ends of the PathPieces, to find one to snap a dragged end to; synced like
+# pathGraph
+endIndex = PathNetwork.EndIndex()
+# Places where PathPieces come too close to each other; shares pathIndex
+clearanceChecker = Clearance.ClearanceChecker(pathGraph, index=pathIndex)
+# PathPieces changed during this frame, updated once before it is drawn (see
+# FrameScheduler and the main loop)
+updateScheduler = FrameScheduler.UpdateScheduler()
+# Work deferred to the spare time of later frames, run once per frame by the
+# main loop
+idleTasks = FrameScheduler.TaskScheduler()
 # Holds the strings added by infoMessage(), read by drawHelpDebugInfoMessages()
 messageQueue = deque()
 messageQueueChange = False
@@ -184,117 +250,6 @@ def causesUnsavedChange(function):
   return wrapper
 
 
-class Point3D(object):
-  def __init__(self, _x=0., _y=0., _z=0.):
-    """Constructor"""
-    self.x, self.y, self.z = _x, _y, _z
-
-  @classmethod
-  def copy(cls, other):
-    """Copy 'constructor'"""
-    if not isinstance(other, Point3D):
-      raise TypeError
-    return Point3D(other.x, other.y, other.z)
-
-  @classmethod
-  def fromList(cls, other):
-    """Create Point3D from (x,y,z) or [x,y,z]"""
-    if not isinstance(other, (list, tuple)):
-      raise TypeError
-    if not len(other)==3:
-      raise TypeError
-    return Point3D(other[0], other[1], other[2])
-
-  def xy(self):
-    """Point projected to the (z=0)-plane"""
-    return Point3D(self.x, self.y, 0)
-
-  def norm(self):
-		"""L2-Norm from origin to point"""
-		return sqrt(self.x**2 + self.y**2 + self.z**2)
-
-  def toRGB(self):
-    """Convert a Point3D to an RGB color triple.
-    Channel values are integer numbers clamped to a range of [0, 255]"""
-    r, g, b = self.x, self.y, self.z
-    r = max(0, min(255, int(r)))
-    g = max(0, min(255, int(g)))
-    b = max(0, min(255, int(b)))
-    return [r, g, b]
-
-  def snapToNearestGridPoint(self):
-    """Round the Point3D to the nearest grid crossing"""
-    self.x = round(self.x/50)*50
-    self.y = round(self.y/50)*50
-
-  def __add__(self, other):
-    """self + other"""
-    if not isinstance(other, Point3D):
-      raise TypeError
-    return Point3D(self.x + other.x,
-                   self.y + other.y,
-                   self.z + other.z)
-
-  def __sub__(self, other):
-    """self - other"""
-    if not isinstance(other, Point3D):
-      raise TypeError
-    return Point3D(self.x - other.x,
-                   self.y - other.y,
-                   self.z - other.z)
-
-  def __iadd__(self, other):
-    """self += other"""
-    if not isinstance(other, Point3D):
-      raise TypeError
-    self.x += other.x
-    self.y += other.y
-    self.z += other.z
-    return self
-
-  def __isub__(self, other):
-    """self -= other"""
-    if not isinstance(other, Point3D):
-      raise TypeError
-    self.x -= other.x
-    self.y -= other.y
-    self.z -= other.z
-    return self
-
-  def __mul__(self, other):
-    """self * other"""
-    if not isinstance(other, (int, long, float)):
-      raise TypeError
-    if isinstance(other, float):
-      return Point3D(self.x * other,
-                     self.y * other,
-                     self.z * other)
-    else:
-      return Point3D(self.x * float(other),
-                     self.y * float(other),
-                     self.z * float(other))
-
-  def __rmul__(self, other):
-    """other * self"""
-    return self.__mul__(other)
-
-  def __div__(self, other):
-    """self / other"""
-    if not isinstance(other, (int, long, float)):
-      raise TypeError
-    if isinstance(other, float):
-      return Point3D(self.x / other,
-                     self.y / other,
-                     self.z / other)
-    else:
-      return Point3D(self.x / float(other),
-                     self.y / float(other),
-                     self.z / float(other))
-
-  def __str__(self):
-    return "(%f, %f, %f)" % (self.x, self.y, self.z)
-
-
 class DisplayedObject(object):
   def __init__(self):
     self.surfaceObj = None
@@ -315,9 +270,6 @@ class DisplayedObject(object):
   def moveByOffset(self, offset):
     self.center += offset
 
-  def getEndPoint3d(self, getActiveEnd):
-    return Point3D()
-
   def moveByPixelOffset(self, relativePixelMotion):
     z = self.center.z
     ppos = project3dToPixelPosition(self.center)
@@ -347,6 +299,7 @@ class ClickRegisteringObject(DisplayedObject):
       mousePos = pygame.mouse.get_pos()
     if not self.rect.collidepoint(mousePos):
       return False
+    computeOffsetTables()
     for x,y in CLICK_TOLERANCE_OFFSETS:
       try:
         if self.surfaceObj.get_at((mousePos[0]-self.rect.topleft[0]+x,
@@ -360,16 +313,16 @@ class ClickRegisteringObject(DisplayedObject):
 
 
 class Button(ClickRegisteringObject):
-  def __init__(self, name="", buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0)),
-               buttonHighlightedSurfaceObj=pygame.Surface((0,0))):
+  # A button's images img/<imageName>.png, img/<imageName>Clicked.png and
+  # img/<imageName>Highlighted.png are taken from the image atlas when needed
+  imageName = None
+
+  def __init__(self, name="", buttonRect=None):
     self.name = name
-    # .convert() enables surface alpha on PNG images (for "button disabled" transparency)
-    self.surfaceObj = buttonSurfaceObj.convert()
-    self.clickedSurfaceObj = buttonClickedSurfaceObj
-    self.highlightedSurfaceObj = buttonHighlightedSurfaceObj
-    self.rect = buttonRect
+    self._surfaceObj = None
+    self._clickedSurfaceObj = None
+    self._highlightedSurfaceObj = None
+    self.rect = buttonRect if buttonRect is not None else pygame.Rect(0,0,0,0)
     # Button function activated
     self.active = False
     # Cursor on button
@@ -378,6 +331,26 @@ class Button(ClickRegisteringObject):
     self.enabled = True
     # TODO call super.constructor?
 
+  @property
+  def surfaceObj(self):
+    if self._surfaceObj is None:
+      # .convert() enables surface alpha on PNG images (for "button disabled"
+      # transparency); it also copies the image, so the atlas stays untouched
+      self._surfaceObj = loadImage(self.imageName).convert()
+    return self._surfaceObj
+
+  @property
+  def clickedSurfaceObj(self):
+    if self._clickedSurfaceObj is None:
+      self._clickedSurfaceObj = loadImage(self.imageName+'Clicked')
+    return self._clickedSurfaceObj
+
+  @property
+  def highlightedSurfaceObj(self):
+    if self._highlightedSurfaceObj is None:
+      self._highlightedSurfaceObj = loadImage(self.imageName+'Highlighted')
+    return self._highlightedSurfaceObj
+
   def clickAction(self):
     global idleClick
     idleClick = False
@@ -430,17 +403,7 @@ class Button(ClickRegisteringObject):
 
 
 class AddStraightButton(Button):
-  def __init__(self, name="AddStraightButton", buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/addstraight.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/addstraightClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/addstraightHighlighted.png'.format(SCRIPT_PATH))
-    super(AddStraightButton, self).__init__(name,
-                                            buttonRect,
-                                            img,
-                                            clickedImg,
-                                            highlightedImg)
+  imageName = 'addstraight'
 
   @causesUnsavedChange
   def clickAction(self):
@@ -453,6 +416,7 @@ class AddStraightButton(Button):
     global objectsList
     objectsList.append(Straight(Point3D(-20,-20,-20),
                                 Point3D(20,50,20)))
+    scenePiecesChanged()
     infoMessage("Straight object added.")
 
   def tooltip(self, screen, mousePos=None):
@@ -461,18 +425,7 @@ class AddStraightButton(Button):
 
 
 class AppendStraightButton(Button):
-  def __init__(self, name="AppendStraightButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/appendstraight.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/appendstraightClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/appendstraightHighlighted.png'.format(SCRIPT_PATH))
-    super(AppendStraightButton, self).__init__(name,
-                                               buttonRect,
-                                               img,
-                                               clickedImg,
-                                               highlightedImg)
+  imageName = 'appendstraight'
 
   @causesUnsavedChange
   def clickAction(self):
@@ -494,17 +447,7 @@ class AppendStraightButton(Button):
 
 
 class AddHelixArcButton(Button):
-  def __init__(self, name="AddHelixArcButton", buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/addhelixarc.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/addhelixarcClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/addhelixarcHighlighted.png'.format(SCRIPT_PATH))
-    super(AddHelixArcButton, self).__init__(name,
-                                            buttonRect,
-                                            img,
-                                            clickedImg,
-                                            highlightedImg)
+  imageName = 'addhelixarc'
 
   @causesUnsavedChange
   def clickAction(self):
@@ -516,7 +459,7 @@ class AddHelixArcButton(Button):
     createUndoHistory()
     global objectsList
     objectsList.append(HelixArc())
-    objectsList[-1].render(True)
+    scenePiecesChanged()
     infoMessage("HelixArc object added.")
 
   def tooltip(self, screen, mousePos=None):
@@ -524,18 +467,7 @@ class AddHelixArcButton(Button):
 
 
 class AppendHelixArcButton(Button):
-  def __init__(self, name="AppendHelixArcButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/appendhelixarc.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/appendhelixarcClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/appendhelixarcHighlighted.png'.format(SCRIPT_PATH))
-    super(AppendHelixArcButton, self).__init__(name,
-                                               buttonRect,
-                                               img,
-                                               clickedImg,
-                                               highlightedImg)
+  imageName = 'appendhelixarc'
 
   @causesUnsavedChange
   def clickAction(self):
@@ -557,17 +489,7 @@ class AppendHelixArcButton(Button):
 
 
 class AddBezierArcButton(Button):
-  def __init__(self, name="AddBezierArcButton", buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/addbezierarc.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/addbezierarcClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/addbezierarcHighlighted.png'.format(SCRIPT_PATH))
-    super(AddBezierArcButton, self).__init__(name,
-                                             buttonRect,
-                                             img,
-                                             clickedImg,
-                                             highlightedImg)
+  imageName = 'addbezierarc'
 
   @causesUnsavedChange
   def clickAction(self):
@@ -579,7 +501,7 @@ class AddBezierArcButton(Button):
     createUndoHistory()
     global objectsList
     objectsList.append(BezierArc())
-    objectsList[-1].render(True)
+    scenePiecesChanged()
     infoMessage("BezierArc object added.")
 
   def tooltip(self, screen, mousePos=None):
@@ -587,18 +509,7 @@ class AddBezierArcButton(Button):
 
 
 class AppendBezierArcButton(Button):
-  def __init__(self, name="AppendBezierArcButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/appendbezierarc.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/appendbezierarcClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/appendbezierarcHighlighted.png'.format(SCRIPT_PATH))
-    super(AppendBezierArcButton, self).__init__(name,
-                                                buttonRect,
-                                                img,
-                                                clickedImg,
-                                                highlightedImg)
+  imageName = 'appendbezierarc'
 
   @causesUnsavedChange
   def clickAction(self):
@@ -620,18 +531,7 @@ class AppendBezierArcButton(Button):
 
 
 class ChangeActiveEndButton(Button):
-  def __init__(self, name="ChangeActiveEndButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/changeActiveEnd.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/changeActiveEndClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/changeActiveEndHighlighted.png'.format(SCRIPT_PATH))
-    super(ChangeActiveEndButton, self).__init__(name,
-                                                buttonRect,
-                                                img,
-                                                clickedImg,
-                                                highlightedImg)
+  imageName = 'changeActiveEnd'
 
   def clickAction(self):
     # Check if the button is enabled
@@ -641,25 +541,14 @@ class ChangeActiveEndButton(Button):
       return None
     so = selectedObjects[0]
     so.activeEnd = 1 - so.activeEnd
-    so.render(True)
+    updateScheduler.markAppearance(so)
 
   def tooltip(self, screen, mousePos=None):
     super(ChangeActiveEndButton, self).tooltip(screen, mousePos, "ChangeActiveEndButton")
 
 
 class FlattenPathPieceButton(Button):
-  def __init__(self, name="FlattenPathPieceButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/flattenpathpiece.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/flattenpathpieceClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/flattenpathpieceHighlighted.png'.format(SCRIPT_PATH))
-    super(FlattenPathPieceButton, self).__init__(name,
-                                                buttonRect,
-                                                img,
-                                                clickedImg,
-                                                highlightedImg)
+  imageName = 'flattenpathpiece'
 
   @causesUnsavedChange
   def clickAction(self):
@@ -679,26 +568,14 @@ class FlattenPathPieceButton(Button):
 			so.startHeight = 0
 			so.endHeight = 0
     so.center.z = 0
-    so.recompute()
-    so.render(True)
+    so.geometryChanged()
 
   def tooltip(self, screen, mousePos=None):
     super(FlattenPathPieceButton, self).tooltip(screen, mousePos, "FlattenPathPieceButton")
 
 
 class DeleteObjectsButton(Button):
-  def __init__(self, name="DeleteObjectsButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/deleteobjects.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/deleteobjectsClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/deleteobjectsHighlighted.png'.format(SCRIPT_PATH))
-    super(DeleteObjectsButton, self).__init__(name,
-                                              buttonRect,
-                                              img,
-                                              clickedImg,
-                                              highlightedImg)
+  imageName = 'deleteobjects'
 
   @causesUnsavedChange
   def clickAction(self, override=False):
@@ -719,18 +596,7 @@ class DeleteObjectsButton(Button):
 
 
 class NewSceneButton(Button):
-  def __init__(self, name="NewSceneButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/newScene.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/newSceneClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/newSceneHighlighted.png'.format(SCRIPT_PATH))
-    super(NewSceneButton, self).__init__(name,
-                                         buttonRect,
-                                         img,
-                                         clickedImg,
-                                         highlightedImg)
+  imageName = 'newScene'
 
   def clickAction(self, override=False):
     # Check if the button is enabled
@@ -754,18 +620,10 @@ class NewSceneButton(Button):
 
 
 class LoadSceneButton(Button):
-  def __init__(self, name="LoadSceneButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/loadScene.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/loadSceneClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/loadSceneHighlighted.png'.format(SCRIPT_PATH))
-    super(LoadSceneButton, self).__init__(name,
-                                          buttonRect,
-                                          img,
-                                          clickedImg,
-                                          highlightedImg)
+  imageName = 'loadScene'
+
+  def __init__(self, name="LoadSceneButton", buttonRect=None):
+    super(LoadSceneButton, self).__init__(name, buttonRect)
     self.lastFile = ''
     self.lastDir  = ''
 
@@ -776,7 +634,8 @@ class LoadSceneButton(Button):
         super(LoadSceneButton, self).clickAction()
       except:
         return None
-    # GTK
+    # GTK (imported on demand so that headless tools never load it)
+    import gtk
     chooser = gtk.FileChooserDialog(title='Mayday Level Editor - Load scene',
                                     action=gtk.FILE_CHOOSER_ACTION_OPEN,
                                     buttons=(gtk.STOCK_CANCEL,
@@ -797,11 +656,9 @@ class LoadSceneButton(Button):
         # Delete current scene
         purgeScene()
         self.lastDir, self.lastFile = os.path.split(filename)
-        db = shelve.open(filename)
-        sceneData = db['objectslist']
+        sceneData = readScene(filename)
         # Reconstruct scene
         deserializeScene(sceneData)
-        db.close()
         # Clear the undo and redo history
         undoHistory.clear()
         getObjectByName('undoButton').disable()
@@ -820,18 +677,10 @@ class LoadSceneButton(Button):
 
 
 class SaveSceneButton(Button):
-  def __init__(self, name="SaveSceneButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/saveScene.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/saveSceneClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/saveSceneHighlighted.png'.format(SCRIPT_PATH))
-    super(SaveSceneButton, self).__init__(name,
-                                          buttonRect,
-                                          img,
-                                          clickedImg,
-                                          highlightedImg)
+  imageName = 'saveScene'
+
+  def __init__(self, name="SaveSceneButton", buttonRect=None):
+    super(SaveSceneButton, self).__init__(name, buttonRect)
     self.lastFile = ''
     self.lastDir  = ''
 
@@ -842,7 +691,8 @@ class SaveSceneButton(Button):
         super(SaveSceneButton, self).clickAction()
       except:
         return None
-    # GTK
+    # GTK (imported on demand so that headless tools never load it)
+    import gtk
     chooser = gtk.FileChooserDialog(title='Mayday Level Editor - Save scene',
                                     action=gtk.FILE_CHOOSER_ACTION_SAVE,
                                     buttons=(gtk.STOCK_CANCEL,
@@ -867,9 +717,7 @@ class SaveSceneButton(Button):
          areYouSure('Overwrite file %s?' % filename):
         self.lastDir, self.lastFile = os.path.split(filename)
         # TODO confirm overwrite?
-        db = shelve.open(filename)
-        db['objectslist'] = serializeScene()
-        db.close()
+        writeShelvedScene(filename, serializeScene())
         setWindowTitle(filename, False)
         infoMessage('%s saved' % filename)
     chooser.destroy()
@@ -883,18 +731,7 @@ class SaveSceneButton(Button):
 
 
 class ExitProgramButton(Button):
-  def __init__(self, name="ExitProgramButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/exitProgram.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/exitProgramClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/exitProgramHighlighted.png'.format(SCRIPT_PATH))
-    super(ExitProgramButton, self).__init__(name,
-                                            buttonRect,
-                                            img,
-                                            clickedImg,
-                                            highlightedImg)
+  imageName = 'exitProgram'
 
   def clickAction(self, override=False):
     # Check if the button is enabled
@@ -913,18 +750,7 @@ class ExitProgramButton(Button):
 
 
 class UndoButton(Button):
-  def __init__(self, name="UndoButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/undo.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/undoClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/undoHighlighted.png'.format(SCRIPT_PATH))
-    super(UndoButton, self).__init__(name,
-                                     buttonRect,
-                                     img,
-                                     clickedImg,
-                                     highlightedImg)
+  imageName = 'undo'
 
   def clickAction(self):
     # Check if the button is enabled
@@ -940,18 +766,7 @@ class UndoButton(Button):
 
 
 class RedoButton(Button):
-  def __init__(self, name="RedoButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/redo.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/redoClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/redoHighlighted.png'.format(SCRIPT_PATH))
-    super(RedoButton, self).__init__(name,
-                                     buttonRect,
-                                     img,
-                                     clickedImg,
-                                     highlightedImg)
+  imageName = 'redo'
 
   def clickAction(self):
     # Check if the button is enabled
@@ -967,18 +782,7 @@ class RedoButton(Button):
 
 
 class FocusButton(Button):
-  def __init__(self, name="FocusButton",
-               buttonRect=pygame.Rect(0,0,0,0),
-               buttonSurfaceObj=pygame.Surface((0,0)),
-               buttonClickedSurfaceObj=pygame.Surface((0,0))):
-    img = pygame.image.load('{}/img/focus.png'.format(SCRIPT_PATH))
-    clickedImg = pygame.image.load('{}/img/focusClicked.png'.format(SCRIPT_PATH))
-    highlightedImg = pygame.image.load('{}/img/focusHighlighted.png'.format(SCRIPT_PATH))
-    super(FocusButton, self).__init__(name,
-                                      buttonRect,
-                                      img,
-                                      clickedImg,
-                                      highlightedImg)
+  imageName = 'focus'
 
   def clickAction(self):
     # Check if the button is enabled
@@ -993,21 +797,48 @@ class FocusButton(Button):
 
 
 
-class PathPiece(ClickRegisteringObject):
+class PathPiece(ClickRegisteringObject, PathPieceGeometry):
+  """On-screen PathPiece. The shape itself is handled by the *Geometry
+  classes in PathGeometry, which concrete PathPieces derive from first."""
   def __init__(self):
     self.activeEndPixelPos = (0,0)
     self.inactiveEndPixelPos = (0,0)
     super(PathPiece, self).__init__()
+    PathPieceGeometry.__init__(self)
+
+  # The mutators only mark the piece; updateScheduler recomputes, notifies
+  # the observers and renders once per frame
 
   def select(self):
     super(PathPiece, self).select()
-    self.render(True)
+    updateScheduler.markAppearance(self)
   def deselect(self):
     super(PathPiece, self).deselect()
-    self.render(True)
+    updateScheduler.markAppearance(self)
 
-  def shelve(self):
-    pass
+  def geometryChanged(self):
+    self.invalidateGeometry()
+    updateScheduler.markGeometry(self)
+
+  def moveTo(self, newPos):
+    self.center = Point3D.copy(newPos)
+    updateScheduler.markPosition(self)
+
+  def moveByOffset(self, offset):
+    self.center += offset
+    updateScheduler.markPosition(self)
+
+  def updatePixelPositions(self):
+    """Screen positions of the draggable handles (the ends). They move with
+    the piece, its surface does not have to be rendered again for that."""
+    pos  = self.points3d[0] if self.activeEnd == 0 else self.points3d[-1]
+    ppos = project3dToPixelPosition(pos + self.center)
+    self.activeEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
+                              int(ppos[1])-CLICK_TOLERANCE_RADIUS)
+    pos  = self.points3d[-1] if self.activeEnd == 0 else self.points3d[0]
+    ppos = project3dToPixelPosition(pos + self.center)
+    self.inactiveEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
+                                int(ppos[1])-CLICK_TOLERANCE_RADIUS)
 
   def cursorOnEnd(self, mousePos=None, activeEnd=True):
     if mousePos is None:
@@ -1025,109 +856,25 @@ class PathPiece(ClickRegisteringObject):
   #    self.center = [i for i in self.center]
 
 
-class Straight(PathPiece):
+class Straight(StraightGeometry, PathPiece):
   def __init__(self,
                startPoint3D=Point3D(50,0,0),
                endPoint3D=Point3D(-50,0,0),
                color=(0,0,0)):
-    """Bezier Points are OFFSETS to the respective point!"""
-    super(Straight, self).__init__()
+    super(Straight, self).__init__(startPoint3D, endPoint3D, color)
     self.centershift = [0,0]
-    self.color = color
-    self.startPoint = Point3D.copy(startPoint3D)
-    self.endPoint = Point3D.copy(endPoint3D)
     self.activeEndPixelPos = [0,0]
     self.inactiveEndPixelPos = [0,0]
-    self.activeEnd = 0
-    self.center = (self.startPoint+self.endPoint)/2
-    self.points3d = []
-    self.points3dHD = []
-    self.recompute()
-    self.render(True)
-
-  def shelve(self):
-    """Save a Straight instance to file"""
-    d = [self.center,
-         self.color[:],
-         self.startPoint,
-         self.endPoint,
-         self.activeEnd]
-    return d
-
-  def unshelve(self, shelvedData):
-    """Load a Straight instance from file"""
-    self.center,                  \
-    self.color,                   \
-    self.startPoint,              \
-    self.endPoint,                \
-    self.activeEnd = shelvedData
-    self.recompute()
-
-  def recompute(self):
-    self.points3d = []
-    self.points3dHD = []
-    step = 0
-    # The number of samples depends directly on the Path length
-    steps = int((self.endPoint - self.startPoint).norm())
-    # Avoid nasty divide-by-zero errors
-    steps = max(100, steps)
-    # Limit the number of samples to avoid lag
-    steps = min(1000, steps)
-    # Bezier curve computation
-    self.points3d = []
-    self.points3dHD = []
-    increment_vector = (self.endPoint-self.startPoint)/steps
-    for step in range(steps+1):
-      B = self.startPoint + step*increment_vector
-      # Enable drawing in low and high resolution
-      self.points3dHD.append(B)
-      # Ensure that the first and last point are in the low res samples
-      if step % 10 == 0 or step == steps:
-        self.points3d.append(B)
-
-  def getEndPoint3d(self, getActiveEnd):
-    return self.points3d[0] if (self.activeEnd==0 and getActiveEnd) or  \
-                               (self.activeEnd==1 and not getActiveEnd) \
-                            else self.points3d[-1]
-
-  def setEndPos3d(self, newPos, setActiveEnd):
-    endIndexInPoints3d = 0 if (self.activeEnd==0 and setActiveEnd) or  \
-                              (self.activeEnd==1 and not setActiveEnd) \
-                           else -1
-    delta = newPos - self.points3d[endIndexInPoints3d]
-    if (self.activeEnd==0 and setActiveEnd) or  \
-       (self.activeEnd==1 and not setActiveEnd):
-      self.startPoint += .5 * delta
-      self.endPoint   -= .5  * delta
-      self.center     += .5  * delta
-    else:
-      self.startPoint -= .5  * delta
-      self.endPoint   += .5 * delta
-      self.center     += .5  * delta
-    self.recompute()
-    self.render(True)
-
-  def moveTo(self, newPos):
-    super(Straight, self).moveTo(newPos)
     self.render(True)
 
   def render(self, highdefinition=False):
     """
-    If highdefinition is FALSE, the HelixArc will be rendered using 100 sample
-    points. If highdefinition is TRUE, 1000 points will be used instead.
+    The samples are taken from the level of detail that fits the zoom (see
+    projectSamples()): if highdefinition is TRUE about one per pixel, else
+    one per LOW_DEFINITION_PIXELS pixels.
     """
-    minx, miny, maxx, maxy = 9999.,9999.,-9999.,-9999.
-    points = self.points3dHD if highdefinition else self.points3d
-    pixels = []
-    for p in points:
-      px, py = project3dToPixelPosition(p, (0,0))
-      pixels.append(((px,py), p.z+self.center.z))
-      minx=min(minx,px)
-      miny=min(miny,py)
-      maxx=max(maxx,px)
-      maxy=max(maxy,py)
-    # The Bezier control points should not be drawn as points, so take them out
-    pixels[-2:] = []
+    minx, miny, maxx, maxy = pixelBounds(self)
+    pixels = projectSamples(self, highdefinition)
     # Padding the image avoids clipping pixels
     pad = CLICK_TOLERANCE_RADIUS+2
     self.centershift = [(maxx+minx)/2,(maxy+miny)/2]
@@ -1137,14 +884,7 @@ class Straight(PathPiece):
     sfsize=sf.get_size()
     self.surfaceObj = sf
 
-    pos  = self.points3d[0] if self.activeEnd == 0 else self.points3d[-1]
-    ppos = project3dToPixelPosition(pos + self.center)
-    self.activeEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
-                              int(ppos[1])-CLICK_TOLERANCE_RADIUS)
-    pos  = self.points3d[-1] if self.activeEnd == 0 else self.points3d[0]
-    ppos = project3dToPixelPosition(pos + self.center)
-    self.inactiveEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
-                                int(ppos[1])-CLICK_TOLERANCE_RADIUS)
+    self.updatePixelPositions()
 
     # Draw sample points, using Wu-style antialiasing
     drawcolor = SELECTED_OBJECT_COLOR if self.selected else self.color
@@ -1336,170 +1076,30 @@ class Straight2(PathPiece):
     super(Straight2, self).draw(screen)
 
 
-class HelixArc(PathPiece):
+class HelixArc(HelixArcGeometry, PathPiece):
   def __init__(self,
                startHeight=-40., endHeight=40.,
                startAngle=0., endAngle=360.,
                radius=50., center=Point3D(),
                rightHanded=True, color=(0,0,0),
                gamma=1.):
-    super(HelixArc, self).__init__()
-    self.center = Point3D.copy(center)
-    self.centershift = [0,0]
-    self.color = color
-    self.startAngle, self.endAngle = startAngle, endAngle
-    self.startHeight, self.endHeight = startHeight, endHeight
-    self.rightHanded = rightHanded
-    self.radius = radius
+    super(HelixArc, self).__init__(startHeight, endHeight,
+                                   startAngle, endAngle,
+                                   radius, center,
+                                   rightHanded, color,
+                                   gamma)
     self.activeEndPixelPos = [0,0]
     self.inactiveEndPixelPos = [0,0]
-    ## The gamma value controls the gradient of the HelixArc's steepness
-    #  It's called "gamma" because it follows a gamma correction-style curve
-    self.gamma = gamma
-    self.activeEnd = 0
-    self.points3d = []
-    self.points3dHD = []
-    self.recompute()
-    self.render(True)
-
-  def shelve(self):
-    """Save a HelixArc instance to file"""
-    d = [self.center,
-         self.centershift[:],
-         self.color[:],
-         self.startAngle,
-         self.endAngle,
-         self.startHeight,
-         self.endHeight,
-         self.rightHanded,
-         self.radius,
-         self.activeEnd,
-         self.gamma]
-    return d
-
-  def unshelve(self, shelvedData):
-    """Load a HelixArc instance from file"""
-    self.center,                  \
-    self.centershift,             \
-    self.color,                   \
-    self.startAngle,              \
-    self.endAngle,                \
-    self.startHeight,             \
-    self.endHeight,               \
-    self.rightHanded,             \
-    self.radius,                  \
-    self.activeEnd,               \
-    self.gamma = shelvedData
-    self.recompute()
-
-  def recompute(self):
-    height, angle = self.startHeight, self.startAngle
-    self.points3d = []
-    self.points3dHD = []
-    step = 0
-    steps = int((self.endAngle - self.startAngle) * abs(self.radius)/50)
-    # Avoid nasty divide-by-zero errors
-    steps = max(100, steps)
-    # Limit the number of samples to avoid lag
-    steps = min(1000, steps)
-    heightstep = (self.endHeight-self.startHeight)/steps
-    anglestep = (self.endAngle-self.startAngle)/steps
-    # Sample points along the curve
-    for step in range(steps):
-      a = angle if self.rightHanded else (360.-angle)
-      x = cos(a*(pi/180.))*self.radius
-      y = sin(a*(pi/180.))*self.radius
-      # Gamma correction-style height recomputation (keeps range)
-      z = height
-      """z = self.startHeight + \
-            (self.endHeight-self.startHeight) * \
-            ((height-self.startHeight)/(self.endHeight-self.startHeight)) ** \
-              (1./self.gamma)"""
-      # Enable drawing in low and high resolution
-      self.points3dHD.append(Point3D(x,y,z))
-      # Ensure that the first and last point are in the low res samples
-      if step % 10 == 0 or step == steps-1:
-        self.points3d.append(Point3D(x,y,z))
-      angle += anglestep
-      height += heightstep
-
-    """# Bezier curve computation
-    # Control points
-    P0 = Point3D(self.startAngle, self.startHeight,    0.)
-    P1 = Point3D(self.startAngle, self.startHeight,    0.)
-    P2 = Point3D(self.endAngle,   self.endHeight,      0.)
-    P3 = Point3D(self.endAngle,   self.endHeight,      0.)
-    for step in range(steps+1):
-      t = step/float(steps)
-      # Cubic Bezier curve, explicit formula (en.wikipedia.org: Bezier curve)
-      B =     (1-t)**3        * P0 + \
-          3 * (1-t)**2 * t    * P1 + \
-          3 * (1-t)    * t**2 * P2 + \
-                         t**3 * P3
-      a = B.x if self.rightHanded else (360.-B.x)
-      x = cos(a*(pi/180.))*self.radius
-      y = sin(a*(pi/180.))*self.radius
-      z = B.y
-      # Enable drawing in low and high resolution
-      self.points3dHD.append(Point3D(x,y,z))
-      # Ensure that the first and last point are in the low res samples
-      if step % 10 == 0 or step == steps-1:
-        self.points3d.append(Point3D(x,y,z))
-      angle += anglestep
-      height += heightstep"""
-
-
-  def getEndPoint3d(self, getActiveEnd):
-    return self.points3d[0] if (self.activeEnd==0 and getActiveEnd) or  \
-                               (self.activeEnd==1 and not getActiveEnd) \
-                            else self.points3d[-1]
-
-  def setEndPos3d(self, newPos, setActiveEnd):
-    #self.noTuplesPlease()
-    endIndexInPoints3d = 0 if (self.activeEnd==0 and setActiveEnd) or  \
-                              (self.activeEnd==1 and not setActiveEnd) \
-                           else -1
-    hDelta = newPos.z - self.points3d[endIndexInPoints3d].z
-    if (self.activeEnd==0 and setActiveEnd) or  \
-       (self.activeEnd==1 and not setActiveEnd):
-      self.startHeight += .25*hDelta
-      self.endHeight   -= .5*hDelta
-      self.center.z    += .5*hDelta
-    else:
-      self.startHeight -= .5*hDelta
-      self.endHeight   += .25*hDelta
-      self.center.z    += .5*hDelta
-    self.recompute()
-    self.render(True)
-
-  def changeAngles(self, mouseRel, setActiveEnd):
-    if (self.activeEnd==0 and setActiveEnd) or  \
-       (self.activeEnd==1 and not setActiveEnd):
-      self.startAngle -= mouseRel[0]
-    else:
-      self.endAngle += mouseRel[0]
-    self.recompute()
-    self.render(True)
-
-  def moveTo(self, newPos):
-    super(HelixArc, self).moveTo(newPos)
     self.render(True)
 
   def render(self, highdefinition=False):
     """
-    If highdefinition is FALSE, the HelixArc will be rendered using 100 sample
-    points. If highdefinition is TRUE, 1000 points will be used instead.
+    The samples are taken from the level of detail that fits the zoom (see
+    projectSamples()): if highdefinition is TRUE about one per pixel, else
+    one per LOW_DEFINITION_PIXELS pixels.
     """
-    minx, miny, maxx, maxy = 9999.,9999.,-9999.,-9999.
-    points = self.points3dHD if highdefinition else self.points3d
-    pixels = []
-    for p in points:
-      px, py = project3dToPixelPosition(p, (0,0))
-      pixels.append(((px,py), p.z+self.center.z))
-      minx=min(minx,px)
-      miny=min(miny,py)
-      maxx=max(maxx,px)
-      maxy=max(maxy,py)
+    minx, miny, maxx, maxy = pixelBounds(self)
+    pixels = projectSamples(self, highdefinition)
     # Padding the image avoids clipping pixels
     pad = CLICK_TOLERANCE_RADIUS
     self.centershift = [(maxx+minx)/2,(maxy+miny)/2]
@@ -1510,14 +1110,7 @@ class HelixArc(PathPiece):
     self.surfaceObj = sf
 
     # Mark the active end
-    pos  = self.points3d[0] if self.activeEnd == 0 else self.points3d[-1]
-    ppos = project3dToPixelPosition(pos)
-    self.activeEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
-                              int(ppos[1])-CLICK_TOLERANCE_RADIUS)
-    pos  = self.points3d[-1] if self.activeEnd == 0 else self.points3d[0]
-    ppos = project3dToPixelPosition(pos)
-    self.inactiveEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
-                                int(ppos[1])-CLICK_TOLERANCE_RADIUS)
+    self.updatePixelPositions()
 
     # Draw sample points, using Wu-style antialiasing
     drawcolor = SELECTED_OBJECT_COLOR if self.selected else self.color
@@ -1584,7 +1177,51 @@ class HelixArc(PathPiece):
     screen.blit(self.surfaceObj, self.rect)
 
 
-class BezierArc(PathPiece):
+def pixelBounds(piece):
+  """Bounds (minx, miny, maxx, maxy) of a PathPiece projected like by
+  projectSamples(), computed from its parameters (see
+  PathPieceGeometry.projectedBounds())"""
+  xAxis = (right[0], front[0], up[0])
+  yAxis = (right[1], front[1], up[1])
+  minx, miny, maxx, maxy = piece.projectedBounds(xAxis, yAxis)
+  c = (CAMERA_POSITION.x, CAMERA_POSITION.y, CAMERA_POSITION.z)
+  cx, cy = dot(c, xAxis), dot(c, yAxis)
+  return ((minx-cx)*zoom, (miny-cy)*zoom, (maxx-cx)*zoom, (maxy-cy)*zoom)
+
+
+def projectSamples(piece, highdefinition, densify=None):
+  """Pixel positions (for origin (0,0)) of a PathPiece's samples at the
+  level of detail for the current zoom, as a list of ((x, y), world z).
+  The gaps between the samples are filled if densify is set (by default in
+  high definition)."""
+  samples = piece.lodSamples(zoom, 1. if highdefinition
+                                   else LOW_DEFINITION_PIXELS)
+  c = samples - (CAMERA_POSITION.x, CAMERA_POSITION.y, CAMERA_POSITION.z)
+  xs = (c[:, 0]*right[0] + c[:, 1]*front[0] + c[:, 2]*up[0])*zoom
+  ys = (c[:, 0]*right[1] + c[:, 1]*front[1] + c[:, 2]*up[1])*zoom
+  pixels = list(zip(zip(xs.tolist(), ys.tolist()),
+                    (samples[:, 2] + piece.center.z).tolist()))
+  if highdefinition if densify is None else densify:
+    pixels = densifyPixels(pixels)
+  return pixels
+
+
+def densifyPixels(pixels):
+  """Fill the gaps between consecutive projected samples ((x, y), z) with
+  points about one pixel apart"""
+  if not pixels:
+    return pixels
+  result = []
+  for ((x0, y0), z0), ((x1, y1), z1) in zip(pixels[:-1], pixels[1:]):
+    steps = max(1, int(ceil(max(abs(x1-x0), abs(y1-y0)))))
+    for k in range(steps):
+      t = k/float(steps)
+      result.append(((x0+(x1-x0)*t, y0+(y1-y0)*t), z0+(z1-z0)*t))
+  result.append(pixels[-1])
+  return result
+
+
+class BezierArc(BezierArcGeometry, PathPiece):
   def __init__(self,
                startPoint3D=Point3D(50,0,0),
                endPoint3D=Point3D(-50,0,0),
@@ -1592,87 +1229,17 @@ class BezierArc(PathPiece):
                bezierControlEndPoint3D=Point3D(0,-50,0),
                color=(0,0,0)):
     """Bezier Points are OFFSETS to the respective point!"""
-    super(BezierArc, self).__init__()
+    super(BezierArc, self).__init__(startPoint3D, endPoint3D,
+                                    bezierControlStartPoint3D,
+                                    bezierControlEndPoint3D,
+                                    color)
     self.centershift = [0,0]
-    self.color = color
-    self.startPoint = Point3D.copy(startPoint3D)
-    self.endPoint = Point3D.copy(endPoint3D)
     self.activeEndPixelPos = [0,0]
     self.inactiveEndPixelPos = [0,0]
     self.bezierControlStartPixelPos = [0,0]
     self.bezierControlEndPixelPos = [0,0]
-    self.activeEnd = 0
-    self.bezierControlStartPoint = Point3D.copy(bezierControlStartPoint3D)
-    self.bezierControlEndPoint = Point3D.copy(bezierControlEndPoint3D)
-    self.center = (self.startPoint+self.endPoint)/2
-    self.points3d = []
-    self.points3dHD = []
-    self.recompute()
     self.render(True)
 
-  def shelve(self):
-    """Save a BezierArc instance to file"""
-    d = [self.center,
-         self.color[:],
-         self.startPoint,
-         self.endPoint,
-         self.bezierControlStartPoint,
-         self.bezierControlEndPoint,
-         self.activeEnd]
-    return d
-
-  def unshelve(self, shelvedData):
-    """Load a BezierArc instance from file"""
-    self.center,                  \
-    self.color,                   \
-    self.startPoint,              \
-    self.endPoint,                \
-    self.bezierControlStartPoint, \
-    self.bezierControlEndPoint,   \
-    self.activeEnd = shelvedData
-    self.recompute()
-
-  def recompute(self):
-    self.points3d = []
-    self.points3dHD = []
-    step = 0
-    # Roughly estimate the arc length
-    """arclength = .5*self.bezierControlStartPoint.norm() +                \
-                ((self.startPoint + self.bezierControlStartPoint) -     \
-                 (self.endPoint + self.bezierControlEndPoint)).norm() + \
-                .5*self.bezierControlEndPoint.norm() - \
-                .25*(self.startPoint -     \
-                     (self.endPoint + self.bezierControlEndPoint)).norm() - \
-                .25*(self.endPoint -     \
-                     (self.startPoint + self.bezierControlStartPoint)).norm()"""
-    arclength = ((self.startPoint + .5*self.bezierControlStartPoint) -     \
-                 (self.endPoint + .5*self.bezierControlEndPoint)).norm()
-    steps = int(arclength)
-    # Avoid nasty divide-by-zero errors
-    steps = max(100, steps)
-    # Limit the number of samples to avoid lag
-    steps = min(1000, steps)
-    # Bezier curve computation
-    self.points3d = []
-    self.points3dHD = []
-    # Control points
-    P0 = self.startPoint
-    P1 = self.startPoint + self.bezierControlStartPoint
-    P2 = self.endPoint + self.bezierControlEndPoint
-    P3 = self.endPoint
-    for step in range(steps+1):
-      t = step/float(steps)
-      # Cubic Bezier curve, explicit formula (en.wikipedia.org: Bezier curve)
-      B =     (1-t)**3        * P0 + \
-          3 * (1-t)**2 * t    * P1 + \
-          3 * (1-t)    * t**2 * P2 + \
-                         t**3 * P3
-      # Enable drawing in low and high resolution
-      self.points3dHD.append(B)
-      # Ensure that the first and last point are in the low res samples
-      if step % 10 == 0 or step == steps:
-        self.points3d.append(B)
-
   def cursorOnBezierControl(self, mousePos=None, _start=True):
     if mousePos is None:
       mousePos = pygame.mouse.get_pos()
@@ -1685,64 +1252,28 @@ class BezierArc(PathPiece):
             (mousePos[1]-CLICK_TOLERANCE_RADIUS-ppos[1])**2)  \
            < CLICK_TOLERANCE_RADIUS**2-1
 
-  def getEndPoint3d(self, getActiveEnd):
-    return self.points3d[0] if (self.activeEnd==0 and getActiveEnd) or  \
-                               (self.activeEnd==1 and not getActiveEnd) \
-                            else self.points3d[-1]
-
-  def setEndPos3d(self, newPos, setActiveEnd):
-    endIndexInPoints3d = 0 if (self.activeEnd==0 and setActiveEnd) or  \
-                              (self.activeEnd==1 and not setActiveEnd) \
-                           else -1
-    delta = newPos - self.points3d[endIndexInPoints3d]
-    if (self.activeEnd==0 and setActiveEnd) or  \
-       (self.activeEnd==1 and not setActiveEnd):
-      self.startPoint += .5 * delta
-      self.endPoint   -= .5  * delta
-      self.center     += .5  * delta
-    else:
-      self.startPoint -= .5  * delta
-      self.endPoint   += .5 * delta
-      self.center     += .5  * delta
-    self.recompute()
-    self.render(True)
-
-  def getBezierControl(self, getStart):
-    return self.bezierControlStartPoint \
-            if getStart                 \
-            else self.bezierControlEndPoint
-
-  def setBezierControl(self, newPos, setStart):
-    if setStart:
-      self.bezierControlStartPoint = Point3D.copy(newPos)
-    else:
-      self.bezierControlEndPoint   = Point3D.copy(newPos)
-    #handle = Point3D.copy(newPos)
-    self.recompute()
-    self.render(True)
-
-  def moveTo(self, newPos):
-    super(BezierArc, self).moveTo(newPos)
-    self.render(True)
+  def updatePixelPositions(self):
+    """The ends and the Bezier control points"""
+    super(BezierArc, self).updatePixelPositions()
+    pos  = self.startPoint+self.bezierControlStartPoint
+    ppos = project3dToPixelPosition(pos + self.center)
+    self.bezierControlStartPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
+                                       int(ppos[1])-CLICK_TOLERANCE_RADIUS)
+    pos  = self.endPoint+self.bezierControlEndPoint
+    ppos = project3dToPixelPosition(pos + self.center)
+    self.bezierControlEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
+                                     int(ppos[1])-CLICK_TOLERANCE_RADIUS)
 
   def render(self, highdefinition=False):
     """
-    If highdefinition is FALSE, the HelixArc will be rendered using 100 sample
-    points. If highdefinition is TRUE, 1000 points will be used instead.
+    The samples are taken from the level of detail that fits the zoom (see
+    projectSamples()), coarser if highdefinition is FALSE. Either way, the
+    curve is drawn about one point per pixel.
     """
-    minx, miny, maxx, maxy = 9999.,9999.,-9999.,-9999.
-    points = self.points3dHD if highdefinition else self.points3d
-    pixels = []
-    for p in points+[self.startPoint+self.bezierControlStartPoint,
-                     self.endPoint+self.bezierControlEndPoint]:
-      px, py = project3dToPixelPosition(p, (0,0))
-      pixels.append(((px,py), p.z+self.center.z))
-      minx=min(minx,px)
-      miny=min(miny,py)
-      maxx=max(maxx,px)
-      maxy=max(maxy,py)
-    # The Bezier control points should not be drawn as points, so take them out
-    pixels[-2:] = []
+    # The bounds include the (undrawn) control points
+    minx, miny, maxx, maxy = pixelBounds(self)
+    # The samples are sparse where the curve is straight, so always fill gaps
+    pixels = projectSamples(self, highdefinition, True)
     # Padding the image avoids clipping pixels
     pad = CLICK_TOLERANCE_RADIUS+2
     self.centershift = [(maxx+minx)/2,(maxy+miny)/2]
@@ -1752,22 +1283,7 @@ class BezierArc(PathPiece):
     sfsize=sf.get_size()
     self.surfaceObj = sf
 
-    pos  = self.points3d[0] if self.activeEnd == 0 else self.points3d[-1]
-    ppos = project3dToPixelPosition(pos + self.center)
-    self.activeEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
-                              int(ppos[1])-CLICK_TOLERANCE_RADIUS)
-    pos  = self.points3d[-1] if self.activeEnd == 0 else self.points3d[0]
-    ppos = project3dToPixelPosition(pos + self.center)
-    self.inactiveEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
-                                int(ppos[1])-CLICK_TOLERANCE_RADIUS)
-    pos  = self.startPoint+self.bezierControlStartPoint
-    ppos = project3dToPixelPosition(pos + self.center)
-    self.bezierControlStartPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
-                                       int(ppos[1])-CLICK_TOLERANCE_RADIUS)
-    pos  = self.endPoint+self.bezierControlEndPoint
-    ppos = project3dToPixelPosition(pos + self.center)
-    self.bezierControlEndPixelPos = (int(ppos[0])-CLICK_TOLERANCE_RADIUS,
-                                     int(ppos[1])-CLICK_TOLERANCE_RADIUS)
+    self.updatePixelPositions()
 
     # Draw sample points, using Wu-style antialiasing
     drawcolor = SELECTED_OBJECT_COLOR if self.selected else self.color
@@ -1839,22 +1355,12 @@ class BezierArc(PathPiece):
     screen.blit(self.surfaceObj, self.rect)
 
 
-class Path(object):
-  """@class Path
-  A Path describes a 3-dimensional spacial structure consisting of (possibly
-  intertwined) curves made up of linked-together PathPieces. Objects may move
-  along a Path, switching off to another Path at a point where the two Paths
-  are linked.
-  """
-  def __init__(self):
-    pass
-
-
 #_______________________________________________________________________
 
 
 def areYouSure(text=None):
   """GTK function to ask for user confirmation"""
+  import gtk
   pdialog = gtk.MessageDialog(type=gtk.MESSAGE_WARNING,
                               buttons=gtk.BUTTONS_YES_NO)
   if text is not None:
@@ -1873,23 +1379,48 @@ def purgeScene():
   global objectsList
   deselectObjects()
   objectsList = [o for o in objectsList if isinstance(o, Button)]
+  scenePiecesChanged()
+
+def scenePieces():
+  """All PathPiece instances of the scene"""
+  return [o for o in objectsList if not isinstance(o, Button)]
+
+def scenePiecesChanged():
+  """Call after adding PathPieces to or removing them from objectsList"""
+  global scenePiecesDirty
+  scenePiecesDirty = True
+
+def syncSceneIndexes():
+  """Bring the path graph and indexes up to date with the added and
+  removed PathPieces, if any (moved and edited ones update them
+  themselves)"""
+  global scenePiecesDirty
+  if not scenePiecesDirty:
+    return
+  scenePiecesDirty = False
+  pieces = scenePieces()
+  pathGraph.setPieces(pieces)
+  pathIndex.setPieces(pieces)
+  endIndex.setPieces(pieces)
+  clearanceChecker.setPieces(pieces)
 
 def serializeScene():
   """Save all PathPiece instances"""
-  return [(o.__class__.__name__, o.shelve()) for o in objectsList
-                                             if not isinstance(o, Button)]
+  # Copy, since shelve() hands out the pieces' own (mutable) Point3Ds
+  return copy.deepcopy(serializeObjects(scenePieces()))
+
+# On-screen classes of the PathPiece types a scene can contain
+PIECE_CLASSES = {'Straight': Straight,
+                 'HelixArc': HelixArc,
+                 'BezierArc': BezierArc}
 
 def deserializeScene(data):
   """Reconstruct PathPiece instances from serialized data"""
   global objectsList
-  classes = {'Straight': Straight,
-             'HelixArc': HelixArc,
-             'BezierArc': BezierArc}
-  for classname, shelvedObj in data:
-    o = classes[classname]()
-    o.unshelve(shelvedObj)
+  for o in unshelveObjects(data, PIECE_CLASSES):
     objectsList.append(o)
-    o.render(True)
+    updateScheduler.markAppearance(o)
+  scenePiecesChanged()
 
 def createUndoHistory(newstep=True):
   """Saves the current scene state into the undo history"""
@@ -1969,6 +1500,59 @@ def compute_projection_parameters(newazimuth, newelevation, newzoom):
   up = [0, sin(elevation)]
   zoom = min(10., max(0.1, newzoom))
 
+def closingJoinOffer():
+  """The two open ends that would close the selected piece's path into a
+  loop, if they are near enough to offer that, else None"""
+  if len(selectedObjects) != 1:
+    return None
+  closing = pathGraph.closingJoin(selectedObjects[0])
+  if closing is None:
+    return None
+  a, b = [PathNetwork.endPosition(*node) for node in closing]
+  if (b-a).norm() > CLOSE_PATH_DISTANCE:
+    return None
+  return closing
+
+def joinEnds(node, other):
+  """Move an end of a piece onto the end of another piece (HelixArcs can
+  only follow in height)"""
+  piece, end = node
+  target = PathNetwork.endPosition(*other) - piece.center
+  piece.setEndPos3d(target, PathNetwork.isActiveEnd(piece, end))
+
+def endSnapOffer(piece, activeEnd):
+  """The dragged end of a piece and the nearest end of another piece it
+  could be snapped to, or None if there is none or they are joined already"""
+  if isinstance(piece, HelixArc):
+    # HelixArc ends only move in height
+    return None
+  node = (piece, 0 if piece.isStartEnd(activeEnd) else 1)
+  other = endIndex.nearestEnd(PathNetwork.endPosition(*node), (piece,))
+  if other is None or other in pathGraph.joinedEnds(node):
+    return None
+  return node, other
+
+@causesUnsavedChange
+def closeSelectedPath():
+  """Close the selected piece's path by moving one of its open ends onto
+  the other (HelixArcs can only follow in height)"""
+  closing = closingJoinOffer()
+  if closing is None:
+    infoMessage("no path to close")
+    return
+  createUndoHistory()
+  joinEnds(*closing)
+  piece = closing[0][0]
+  # The path graph learns of the move when the piece notifies its
+  # observers, which otherwise waits for the frame's updateScheduler.flush()
+  # (the piece stays marked there, so it is rendered as usual)
+  piece.updateGeometry()
+  piece.notifyObservers()
+  if pathGraph.isClosed(piece):
+    infoMessage("Path closed (%d pieces)." % pathGraph.circuitSize(piece))
+  else:
+    infoMessage("Path could not be closed completely.")
+
 def focusCameraOnSelectedObjects():
   """Focus the camera on the selected objects.
   If the selection includes multiple objects, focus on the mean."""
@@ -1978,23 +1562,59 @@ def focusCameraOnSelectedObjects():
   object_centers = [o.center for o in selectedObjects]
   CAMERA_POSITION = sum(object_centers, Point3D())/float(len(object_centers))
 
+def transformSelection(translation=None, angle=0., scale=1.):
+  """Move (by a Point3D), turn (degrees about the vertical axis) and scale
+  all selected objects at once, the latter two about the selection's mean
+  center. The PathPieces go through PathGeometry.transformPieces(); those
+  whose shape changed are left to updateScheduler, moving alone does not
+  need a new surface."""
+  if not selectedObjects:
+    return
+  pieces = [o for o in selectedObjects if isinstance(o, PathPiece)]
+  centers = [o.center for o in selectedObjects]
+  pivot = sum(centers, Point3D())/float(len(centers))
+  reshaped = set(transformPieces(pieces, translation, angle, scale, pivot))
+  for o in selectedObjects:
+    if isinstance(o, PathPiece):
+      if o not in reshaped:
+        o.updatePixelPositions()
+    elif translation is not None:
+      DisplayedObject.moveByOffset(o, translation)
+
+def scheduleHDRender(piece):
+  """Render a PathPiece in HD in the spare time of a frame"""
+  def task():
+    if piece in objectsList:
+      piece.render(True)
+  idleTasks.submit(task, HD_RENDER_PRIORITY, ('renderHD', piece))
+
+def scheduleSceneHDRender():
+  """Render all PathPieces in HD (see scheduleHDRender()) once the camera
+  has stood still for HQ_FRAME_DELAY frames. Scheduling it again before
+  only postpones that one task."""
+  def task():
+    for o in objectsList:
+      if isinstance(o, PathPiece):
+        scheduleHDRender(o)
+  idleTasks.submit(task, HD_RENDER_PRIORITY, 'renderSceneHD', HQ_FRAME_DELAY)
+
+def pixelMotionTo3d(relativePixelMotion):
+  """The horizontal translation that moves points on screen by a pixel
+  offset (the same for all points, the projection being orthographic)"""
+  return unprojectPixelTo3dPosition(relativePixelMotion, (0, 0)) - \
+         unprojectPixelTo3dPosition((0, 0), (0, 0))
+
 def project3dToPixelPosition(c, origin=None):
+  """Computes the 2D pixel screen coordinate for a 3D point"""
   if origin is None:
     origin = ORIGIN
-  c = Point3D.copy(c) - CAMERA_POSITION
-  """Computes the 2D pixel screen coordinate for a 3D point"""
-  # Isometric projection
+  # Isometric projection of c - CAMERA_POSITION, zoomed, and compensated for
+  # the pixel shift (window center is world center)
   #          [ -right- ]T    [ | ]
   # result = [ -front- ]  *  [ c ]
   #          [ --up--- ]     [ | ]
-  result = [c.x * right[0] + c.y * front[0] + c.z * up[0],
-            c.x * right[1] + c.y * front[1] + c.z * up[1]]
-  result[0] *= zoom
-  result[1] *= zoom
-  # Compensate for pixel shift (window center is world center)
-  result[0] += origin[0]
-  result[1] += origin[1]
-  return result
+  return c.project(CAMERA_POSITION, (right[0], front[0], up[0]),
+                                    (right[1], front[1], up[1]), zoom, origin)
 
 
 def unprojectPixelTo3dPosition(p, origin=None, height=0.):
@@ -2019,10 +1639,36 @@ def unprojectPixelTo3dPosition(p, origin=None, height=0.):
       (1. - (front[0]*right[1])/(right[0]*front[1]))
   x = ((p[0]-origin[0])/zoom - height*up[0] - y*front[0]) / right[0]
   z = height
-  point3d = Point3D(x, y, z) + CAMERA_POSITION
+  point3d = Point3D(x, y, z)
+  point3d += CAMERA_POSITION
   return point3d
 
 
+def viewDirection():
+  """The direction in which the camera looks (all points along it are
+  projected onto the same pixel)"""
+  # Perpendicular to both rows of the projection matrix
+  return Point3D(front[0]*up[1] - up[0]*front[1],
+                 up[0]*right[1] - right[0]*up[1],
+                 right[0]*front[1] - front[0]*right[1])
+
+
+def snapToPaths(ppos, exclude=()):
+  """The point on a path (or the path's end) under the pixel position ppos,
+  if there is one within SNAP_PIXELS; else None"""
+  tolerance = SNAP_PIXELS/zoom
+  found = pathIndex.nearestToLine(unprojectPixelTo3dPosition(ppos, ORIGIN),
+                                  viewDirection(), tolerance, exclude)
+  if found is None:
+    return None
+  piece, distance, point, s = found
+  if s < tolerance:
+    return PathNetwork.endPosition(piece, 0)
+  if s > piece.arcLength() - tolerance:
+    return PathNetwork.endPosition(piece, 1)
+  return point
+
+
 def drawPotentialConnectionLine(p1, p2, screen, color=None):
   # Yes, this is really not how that was intended to be used.
   if color is None:
@@ -2093,47 +1739,88 @@ def render_background():
   return BGSurfaceObj
 
 
+def computeOffsetTables():
+  """Fill the pixel offset tables for click tolerance and end markers"""
+  if CLICK_TOLERANCE_OFFSETS:
+    return
+  for y in range(-CLICK_TOLERANCE_RADIUS,CLICK_TOLERANCE_RADIUS+1):
+    for x in range(-CLICK_TOLERANCE_RADIUS,CLICK_TOLERANCE_RADIUS+1):
+      if x**2+y**2 <= CLICK_TOLERANCE_RADIUS**2+1:
+        CLICK_TOLERANCE_OFFSETS.append((x, y))
+      if CLICK_TOLERANCE_RADIUS**2-8 <= x**2+y**2 <= CLICK_TOLERANCE_RADIUS**2+1:
+        MARK_RING_OFFSETS.append((x, y))
+      if x**2+y**2 <= CLICK_TOLERANCE_RADIUS**2-16:
+        MARK_DOT_OFFSETS.append((x,y))
+
+
+def prerenderMarkers():
+  """Render the markers for path piece ends and Bezier control points"""
+  global markring, markdot, markrectangle
+  computeOffsetTables()
+  size = (2*CLICK_TOLERANCE_RADIUS+1, 2*CLICK_TOLERANCE_RADIUS+1)
+  markring      = pygame.Surface(size).convert_alpha()
+  markdot       = pygame.Surface(size).convert_alpha()
+  markrectangle = pygame.Surface(size).convert_alpha()
+  markring.fill((0,0,0,0))
+  markdot.fill((0,0,0,0))
+  markrectangle.fill((0,0,0,0))
+  for dx,dy in MARK_RING_OFFSETS:
+    markring.set_at((CLICK_TOLERANCE_RADIUS+dx,
+                     CLICK_TOLERANCE_RADIUS+dy),
+                    (255,0,0))
+  for dx,dy in MARK_DOT_OFFSETS:
+    markdot.set_at((CLICK_TOLERANCE_RADIUS+dx,
+                    CLICK_TOLERANCE_RADIUS+dy),
+                   (255,0,0))
+  for i in range(2*CLICK_TOLERANCE_RADIUS+1):
+    markrectangle.set_at((i, 0),
+                         (255, 0, 0))
+    markrectangle.set_at((0, i),
+                         (255, 0, 0))
+    markrectangle.set_at((i, 2*CLICK_TOLERANCE_RADIUS),
+                         (255, 0, 0))
+    markrectangle.set_at((2*CLICK_TOLERANCE_RADIUS, i),
+                         (255, 0, 0))
+
+
+# GUI buttons: class, name, where the column is counted from (the left or
+# right window border or the window center), column and row in button sizes
+BUTTON_LAYOUT = ((NewSceneButton,           'newSceneButton',         'left',   0, 0),
+                 (LoadSceneButton,          'loadSceneButton',        'left',   0, 1),
+                 (SaveSceneButton,          'saveSceneButton',        'left',   0, 2),
+                 (ExitProgramButton,        'exitProgramButton',      'left',   0, 3),
+                 (AddStraightButton,        'addStraightButton',      'right',  0, 0),
+                 (AppendStraightButton,     'appendStraightButton',   'right',  1, 0),
+                 (AddHelixArcButton,        'addHelixArcButton',      'right',  0, 1),
+                 (AppendHelixArcButton,     'appendHelixArcButton',   'right',  1, 1),
+                 (AddBezierArcButton,       'addBezierArcButton',     'right',  0, 2),
+                 (AppendBezierArcButton,    'appendBezierArcButton',  'right',  1, 2),
+                 (ChangeActiveEndButton,    'changeActiveEndButton',  'right',  0, 3),
+                 (FlattenPathPieceButton,   'flattenPathPieceButton', 'right',  0, 4),
+                 (FocusButton,              'focusButton',            'right',  0, 5),
+                 (DeleteObjectsButton,      'deleteObjectsButton',    'right',  0, 7),
+                 (UndoButton,               'undoButton',             'center', 0, 0),
+                 (RedoButton,               'redoButton',             'center', 1, 0))
+
+
+def buttonPosition(border, column, row):
+  """Top right corner of a button of BUTTON_LAYOUT in the current window"""
+  if border == 'left':
+    x = (column+1)*BUTTON_SIZE
+  elif border == 'right':
+    x = WINDOW_SIZE[0] - column*BUTTON_SIZE
+  else:
+    x = WINDOW_SIZE[0]//2 + column*BUTTON_SIZE
+  return (x, row*BUTTON_SIZE)
+
+
 def makeGUIButtons():
   """Initialize GUI buttons"""
   buttons = []
-  to_make = ((NewSceneButton, "newSceneButton",
-                (50, 0)),
-             (LoadSceneButton, "loadSceneButton",
-                (50, 50)),
-             (SaveSceneButton, "saveSceneButton",
-                (50, 100)),
-             (ExitProgramButton, "exitProgramButton",
-                (50, 150)),
-             (AddStraightButton, "addStraightButton",
-                (WINDOW_SIZE[0], 0)),
-             (AppendStraightButton, "appendStraightButton",
-                (WINDOW_SIZE[0]-50, 0)),
-             (AddHelixArcButton, "addHelixArcButton",
-                (WINDOW_SIZE[0], 50)),
-             (AppendHelixArcButton, "appendHelixArcButton",
-                (WINDOW_SIZE[0]-50, 50)),
-             (AddBezierArcButton, "addBezierArcButton",
-                (WINDOW_SIZE[0], 100)),
-             (AppendBezierArcButton, "appendBezierArcButton",
-                (WINDOW_SIZE[0]-50, 100)),
-             (ChangeActiveEndButton, "changeActiveEndButton",
-                (WINDOW_SIZE[0], 150)),
-             (FlattenPathPieceButton, "flattenPathPieceButton",
-                (WINDOW_SIZE[0], 200)),
-             (FocusButton, "focusButton",
-                (WINDOW_SIZE[0], 250)),
-             (DeleteObjectsButton, "deleteObjectsButton",
-                (WINDOW_SIZE[0], 350)),
-             (UndoButton, "undoButton",
-                (WINDOW_SIZE[0]//2,0)),
-             (RedoButton, "redoButton",
-                (WINDOW_SIZE[0]//2+50,0))
-            )
-
-  for buttonClass, name, (x,y) in to_make:
+  for buttonClass, name, border, column, row in BUTTON_LAYOUT:
     newButton = buttonClass(name)
     rect = newButton.surfaceObj.get_rect()
-    rect.topright = (x,y)
+    rect.topright = buttonPosition(border, column, row)
     newButton.setRectangle(rect)
     buttons.append(newButton)
 
@@ -2206,8 +1893,26 @@ def deleteObject(obj):
   deselectObjects(obj)
   obj.deselect()
   objectsList.remove(obj)
+  scenePiecesChanged()
+
+
+
+def drawPathJoins(screen):
+  """Mark all joined PathPiece ends"""
+  for a, b in pathGraph.joinList():
+    ppos = project3dToPixelPosition(PathNetwork.endPosition(*a))
+    pygame.draw.circle(screen, GREEN, [int(c) for c in ppos], 6, 2)
 
 
+def drawClearanceViolations(screen):
+  """Mark where PathPieces are closer than Clearance.MIN_CLEARANCE"""
+  for a, b, distance, pointA, pointB in clearanceChecker.violations():
+    ppos = [[int(c) for c in project3dToPixelPosition(p)]
+            for p in (pointA, pointB)]
+    pygame.draw.line(screen, RED, ppos[0], ppos[1], 2)
+    for p in ppos:
+      pygame.draw.circle(screen, RED, p, 8, 2)
+
 
 def drawHelpDebugInfoMessages(screen, rerender=False,
                               windowSizeHasChanged=False,
@@ -2234,6 +1939,16 @@ def drawHelpDebugInfoMessages(screen, rerender=False,
     textRect = textObj.get_rect()
     textRect.topleft = (ppos[0]+10, ppos[1])
     screen.blit(textObj, textRect)
+    # ...and about its circuit (the joined pieces it belongs to)
+    if so in pathGraph.pieces:
+      text = 'circuit %d: %d piece(s), %s' % (pathGraph.circuitNumber(so),
+                                               pathGraph.circuitSize(so),
+                                               'closed' if pathGraph.isClosed(so)
+                                                        else 'open')
+      textObj = pygame.font.SysFont(None, 18).render(text, True, (0, 0, 0))
+      textRect = textObj.get_rect()
+      textRect.topleft = (ppos[0]+10, ppos[1]+15)
+      screen.blit(textObj, textRect)
 
   # Render info text about azimuth and elevation angles
   if rerender or not msgs1:
@@ -2254,8 +1969,12 @@ def drawHelpDebugInfoMessages(screen, rerender=False,
     lines = ["Use WASD or MIDDLE MOUSE BUTTON to rotate the camera (isometric projection).",
              "Move selected objects with the ARROW KEYS and PAGE-UP/DOWN, or drag them",
              "  using the mouse (hold SHIFT to move along the z-axis).",
+             "Turn the selection with R (SHIFT+R: the other way), scale it with [ and ].",
              "Zoom in and out using the +/- keys, RIGHT MOUSE BUTTON or MOUSE WHEEL.",
              "Press HOME to reset the camera.",
+             "Hold CTRL while dragging an end to snap it onto other paths or the grid.",
+             "Release a dragged end near the end of another piece to join them.",
+             "Ctrl+J closes the selected path into a loop if its ends are near.",
              "Ctrl+A selects all objects."][::-1]
     for i in range(len(lines)):
       textObj = pygame.font.SysFont(None, 18).render(lines[i], True, (0, 0, 0))
@@ -2312,25 +2031,9 @@ def processResizeEvent(event, screen):
   screen      = pygame.display.set_mode( WINDOW_SIZE,
                                          pygame.RESIZABLE )
   # Update button positions
-  buttons = (("newSceneButton",         (50, 0)),
-             ("loadSceneButton",        (50, 50)),
-             ("saveSceneButton",        (50, 100)),
-             ("exitProgramButton",      (50, 150)),
-             ("addStraightButton",      (WINDOW_SIZE[0], 0)),
-             ("appendStraightButton",   (WINDOW_SIZE[0]-50, 0)),
-             ("addHelixArcButton",      (WINDOW_SIZE[0], 50)),
-             ("appendHelixArcButton",   (WINDOW_SIZE[0]-50, 50)),
-             ("addBezierArcButton",     (WINDOW_SIZE[0], 100)),
-             ("appendBezierArcButton",  (WINDOW_SIZE[0]-50, 100)),
-             ("changeActiveEndButton",  (WINDOW_SIZE[0], 150)),
-             ("flattenPathPieceButton", (WINDOW_SIZE[0], 200)),
-             ("focusButton",            (WINDOW_SIZE[0], 250)),
-             ("deleteObjectsButton",    (WINDOW_SIZE[0], 350)),
-             ("undoButton",             (WINDOW_SIZE[0]//2,0)),
-             ("redoButton",             (WINDOW_SIZE[0]//2+50,0)))
-  for name, pos in buttons:
+  for buttonClass, name, border, column, row in BUTTON_LAYOUT:
     rect = getObjectByName(name).surfaceObj.get_rect()
-    rect.topright = pos
+    rect.topright = buttonPosition(border, column, row)
     getObjectByName(name).setRectangle(rect)
 
 #_______________________________________________________________________
@@ -2338,8 +2041,7 @@ def processResizeEvent(event, screen):
 
 def main():
   global idleClick, objectsList, selectedObjects, WINDOW_SIZE, CAMERA_POSITION
-
-  CAMERA_POSITION = Point3D.fromList(CAMERA_POSITION)
+  global UI_SCALE, BUTTON_SIZE
 
   logging.basicConfig(level=logging.DEBUG,
                       format='%(asctime)s %(levelname)s: %(message)s',
@@ -2347,12 +2049,15 @@ def main():
 
   # Initialize pygame
   pygame.init()
+  # Scale the GUI to the resolution of the desktop
+  UI_SCALE    = AssetBuild.displayScale(pygame.display.Info().current_h)
+  BUTTON_SIZE = int(round(50*UI_SCALE))
   screen = pygame.display.set_mode( WINDOW_SIZE,
                                     pygame.RESIZABLE )
 
   # Set window icon
   # Image credit: http://chidioparareports.blogspot.de/2012/06/special-report-nigerian-airlines-and.html
-  icon = pygame.image.load('{}/img/icon.png'.format(SCRIPT_PATH))
+  icon = loadImage('icon')
   pygame.display.set_icon(icon)
 
   # Set window title
@@ -2373,34 +2078,12 @@ def main():
   makeGUIButtons()
 
   # Prerender the marker for a path piece's active end
-  global markring, markdot, markrectangle
-  markring      = markring.convert_alpha()
-  markdot       = markdot.convert_alpha()
-  markrectangle = markrectangle.convert_alpha()
-  markring.fill((0,0,0,0))
-  markdot.fill((0,0,0,0))
-  markrectangle.fill((0,0,0,0))
-  for dx,dy in MARK_RING_OFFSETS:
-    markring.set_at((CLICK_TOLERANCE_RADIUS+dx,
-                     CLICK_TOLERANCE_RADIUS+dy),
-                    (255,0,0))
-  for dx,dy in MARK_DOT_OFFSETS:
-    markdot.set_at((CLICK_TOLERANCE_RADIUS+dx,
-                    CLICK_TOLERANCE_RADIUS+dy),
-                   (255,0,0))
-  for i in range(2*CLICK_TOLERANCE_RADIUS+1):
-    markrectangle.set_at((i, 0),
-                         (255, 0, 0))
-    markrectangle.set_at((0, i),
-                         (255, 0, 0))
-    markrectangle.set_at((i, 2*CLICK_TOLERANCE_RADIUS),
-                         (255, 0, 0))
-    markrectangle.set_at((2*CLICK_TOLERANCE_RADIUS, i),
-                         (255, 0, 0))
+  prerenderMarkers()
 
   # Prerender the button tooltips
+  tooltipFont = pygame.font.SysFont(None, 20)
   for k, v in TOOLTIP_TEXTS.items():
-    tmp = pygame.font.SysFont(None, 20).render(v, True, (0,0,0), (255,255,255))
+    tmp = tooltipFont.render(v, True, (0,0,0), (255,255,255))
     TOOLTIP_SURFACEOBJECTS[k] = tmp
 
   # How far the mouse has travelled with a button down, used to distinguish
@@ -2417,13 +2100,12 @@ def main():
                          = dragStartedOnBezierControlEnd    \
                          = False
   boxStartPoint = (0, 0)
+  # Dragged end and the end it snaps to when released, see endSnapOffer()
+  endSnap = None
 
   # Print info and debugging text?
   printDebug = False
 
-  # Occasionally render HelixArcs in high quality
-  framesWithoutRerendering = 0
-
   ### DEBUG
   objectsList.append(BezierArc(startPoint3D=Point3D(100,0,-50),
                                endPoint3D=Point3D(-100,0,50),
@@ -2431,6 +2113,7 @@ def main():
                                bezierControlEndPoint3D=Point3D(0,-50,0)))
   objectsList.append(HelixArc())
   objectsList.append(Straight())
+  scenePiecesChanged()
 
   # Prerender font object
   toggleDebugTextObj = pygame.font.SysFont(None, 18).render('Press H to toggle debug information.',
@@ -2456,10 +2139,11 @@ def main():
     # NOTE that even mouse movement within the game window is an event.
     #
     # (totalFrameCount > HQ_FRAME_DELAY is a hack to ensure that the
-    # first few frames are rendered even if no events occur
+    # first few frames are rendered even if no events occur.) Deferred tasks
+    # need frames to run in, though.
     if not pygame.event.peek() and \
        totalFrameCount > HQ_FRAME_DELAY and \
-       not framesWithoutRerendering < 3:
+       not idleTasks:
       thisTickEvents.append(pygame.event.wait())
 
     # Check current status of mouse buttons (not events)
@@ -2593,7 +2277,12 @@ def main():
             if not undoHistory:
               getObjectByName('undoButton').disable()
           else:
+            # Join a dragged end to the end offered while dragging
+            if endSnap is not None:
+              joinEnds(*endSnap)
+              infoMessage("Ends joined.")
             setWindowTitle(WINDOW_TITLE, True)
+        endSnap = None
         if lmbLastTick                          and \
            not boxSelectionInProgress           and \
            not dragStartedOnGUI                 and \
@@ -2740,24 +2429,33 @@ def main():
         # Ctrl-Q: Quit program
         if pressedKeys[pygame.K_q]:
           getObjectByName('exitProgramButton').clickAction(True)
-
-    """# Move selected objects per keyboard
-    try:
-      for so in selectedObjects:
-        if pressedKeys[pygame.K_UP]:
-          so.moveByOffset((0,10,0))
-        if pressedKeys[pygame.K_DOWN]:
-          so.moveByOffset((0,-10,0))
-        if pressedKeys[pygame.K_LEFT]:
-          so.moveByOffset((-10,0,0))
-        if pressedKeys[pygame.K_RIGHT]:
-          so.moveByOffset((10,0,0))
-        if pressedKeys[pygame.K_PAGEUP]:
-          so.moveByOffset((0,0,10))
-        if pressedKeys[pygame.K_PAGEDOWN]:
-          so.moveByOffset((0,0,-10))
-    except:
-      for so in selectedObjects: print so"""
+        # Ctrl-J: Close the selected path into a loop
+        if pressedKeys[pygame.K_j]:
+          closeSelectedPath()
+
+    # Move, turn and scale selected objects per keyboard
+    if selectedObjects and not CtrlKeyPressed:
+      moveKeys = {pygame.K_UP:       (0, 1, 0),  pygame.K_DOWN:     (0, -1, 0),
+                  pygame.K_LEFT:     (-1, 0, 0), pygame.K_RIGHT:    (1, 0, 0),
+                  pygame.K_PAGEUP:   (0, 0, 1),  pygame.K_PAGEDOWN: (0, 0, -1)}
+      move = [k for k in moveKeys if pressedKeys[k]]
+      if move:
+        if not [k for k in move if pressedKeysLastTick[k]]:
+          createUndoHistory()
+        direction = sum([Point3D(*moveKeys[k]) for k in move], Point3D())
+        transformSelection(direction*KEYBOARD_MOVE_STEP)
+      pressed = [k for k in (pygame.K_r, pygame.K_LEFTBRACKET,
+                             pygame.K_RIGHTBRACKET)
+                   if pressedKeys[k] and not pressedKeysLastTick[k]]
+      if pressed:
+        createUndoHistory()
+      if pygame.K_r in pressed:
+        transformSelection(angle=-KEYBOARD_TURN_STEP if ShiftKeyPressed
+                                 else KEYBOARD_TURN_STEP)
+      if pygame.K_LEFTBRACKET in pressed:
+        transformSelection(scale=1./KEYBOARD_SCALE_STEP)
+      if pygame.K_RIGHTBRACKET in pressed:
+        transformSelection(scale=KEYBOARD_SCALE_STEP)
 
     ## Delete selected objects
     if pressedKeys[pygame.K_DELETE] and selectedObjects:
@@ -2778,19 +2476,22 @@ def main():
         so.gamma = max(.05, min(9., so.gamma))"""
 
     ## Move things using the mouse
+    dragging = lmbDown and \
+               dragManhattanDistance > DRAGGING_DISTANCE_THRESHOLD and \
+               (dragStartedOnSelectedObject      or \
+                dragStartedOnActiveEnd           or \
+                dragStartedOnInactiveEnd         or \
+                dragStartedOnBezierControlStart  or \
+                dragStartedOnBezierControlEnd)
     if dragManhattanDistance > DRAGGING_DISTANCE_THRESHOLD:
       # Move selected object(s)
       if dragStartedOnSelectedObject:
         # Motion along z-axis
         if ShiftKeyPressed:
-          for so in selectedObjects:
-            so.moveTo(Point3D(so.center.x,
-                              so.center.y,
-                              so.center.z-mouseRelativeMotionThisTick[1]))
+          transformSelection(Point3D(0, 0, -mouseRelativeMotionThisTick[1]))
         # Motion along (z=0)-plane
         else:
-          for so in selectedObjects:
-            so.moveByPixelOffset(mouseRelativeMotionThisTick)
+          transformSelection(pixelMotionTo3d(mouseRelativeMotionThisTick))
       # Manipulate a single selected object
       elif len(selectedObjects)==1:
         so = selectedObjects[0]
@@ -2800,9 +2501,9 @@ def main():
           if dragStartedOnActiveEnd or dragStartedOnInactiveEnd:
             # Change a HelixArc's RADIUS using the SHIFT+CTRL keys
             if ShiftKeyPressed and CtrlKeyPressed:
-              so.radius += mouseRelativeMotionThisTick[0]
-              so.recompute()
-              so.render(True)
+              so.radius = max(MIN_HELIX_RADIUS,
+                              so.radius + mouseRelativeMotionThisTick[0])
+              so.geometryChanged()
             # Change a HelixArc's HEIGHT using the SHIFT key
             elif ShiftKeyPressed:
               pos = so.getEndPoint3d(dragStartedOnActiveEnd)
@@ -2832,11 +2533,12 @@ def main():
               ppos[1] += mouseRelativeMotionThisTick[1]
               pos = unprojectPixelTo3dPosition(ppos, ORIGIN, z)
               if CtrlKeyPressed:
-                # Snap to grid
-                z += so.center.z
-                ppos = mousePos
-                pos = unprojectPixelTo3dPosition(ppos, ORIGIN, z)
-                pos.snapToNearestGridPoint()
+                # Snap to other paths or to the grid
+                pos = snapToPaths(mousePos, (so,))
+                if pos is None:
+                  z += so.center.z
+                  pos = unprojectPixelTo3dPosition(mousePos, ORIGIN, z)
+                  pos.snapToNearestGridPoint()
                 pos -= so.center
               so.setEndPos3d(pos, dragStartedOnActiveEnd)
           elif dragStartedOnBezierControlStart or dragStartedOnBezierControlEnd:
@@ -2884,31 +2586,44 @@ def main():
               ppos[1] += mouseRelativeMotionThisTick[1]
               pos = unprojectPixelTo3dPosition(ppos, ORIGIN, z)
               if CtrlKeyPressed:
-                # Snap to grid
-                z += so.center.z
-                ppos = mousePos
-                pos = unprojectPixelTo3dPosition(ppos, ORIGIN, z)
-                pos.snapToNearestGridPoint()
+                # Snap to other paths or to the grid
+                pos = snapToPaths(mousePos, (so,))
+                if pos is None:
+                  z += so.center.z
+                  pos = unprojectPixelTo3dPosition(mousePos, ORIGIN, z)
+                  pos.snapToNearestGridPoint()
                 pos -= so.center
               so.setEndPos3d(pos, dragStartedOnActiveEnd)
+        # Offer to join a dragged end to a nearby end of another piece
+        if dragStartedOnActiveEnd or dragStartedOnInactiveEnd:
+          endSnap = endSnapOffer(so, dragStartedOnActiveEnd)
 
 
 
     # If the camera has changed, the background graphic has to be re-rendered
     if rerender:
-      framesWithoutRerendering = 0
       BGSurfaceObj = render_background()
+      updateScheduler.flush(objectsList, render=False)
       for o in objectsList:
         o.render(render_HD_override)
+        idleTasks.cancel(('renderHD', o))
+      # Render PathPieces in good quality once the camera stands still
+      if render_HD_override:
+        idleTasks.cancel('renderSceneHD')
+      else:
+        scheduleSceneHDRender()
     else:
-      framesWithoutRerendering += 1
-
-    # Render PathPieces in good quality if the scene is stationary
-    if framesWithoutRerendering == HQ_FRAME_DELAY:
-      infoMessage("Rendering in HD...")
-      for o in objectsList:
-        if isinstance(o, PathPiece):
-          o.render(True)
+      # Whatever changes while the user drags is rendered in low definition
+      # (once per frame at most); in HD once the mouse button is released
+      if dragging:
+        updateScheduler.flush(objectsList, False)
+      else:
+        updateScheduler.refine()
+        for o in updateScheduler.flush(objectsList):
+          idleTasks.cancel(('renderHD', o))
+
+    # Deferred work, as far as the frame's time budget allows
+    idleTasks.run(IDLE_TASK_BUDGET)
 
     # Save keyboard state for next tick
     pressedKeysLastTick = pressedKeys
@@ -2947,9 +2662,27 @@ def main():
     if printDebug:
       drawHelpDebugInfoMessages(screen, rerender, windowSizeHasChanged)
 
+    # Update the PathPiece connectivity if pieces were added or removed
+    syncSceneIndexes()
+
     # Draw objects
     for o in objectsList:
       o.draw(screen)
+    if printDebug:
+      drawPathJoins(screen)
+    drawClearanceViolations(screen)
+
+    # Offer to close the selected path (Ctrl+J)
+    closing = closingJoinOffer()
+    if closing is not None:
+      drawPotentialConnectionLine(PathNetwork.endPosition(*closing[0]),
+                                  PathNetwork.endPosition(*closing[1]),
+                                  screen)
+    # Offer to join the dragged end on release
+    if endSnap is not None:
+      drawPotentialConnectionLine(PathNetwork.endPosition(*endSnap[0]),
+                                  PathNetwork.endPosition(*endSnap[1]),
+                                  screen, (100,200,100))
 
     # Draw the selection box and select objects whose centers are within the box
     if boxSelectionInProgress:
@@ -0,0 +1,1251 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Geometry and scene model of Mayday levels.
+
+This module holds everything about PathPieces that does not concern drawing:
+3D points, the sampling of the different PathPiece types, editing operations
+on their parameters, and reading/writing scenes. It imports neither pygame nor
+gtk, so tools and the game can use it without any display. The Level Editor
+derives its on-screen PathPieces from the classes in here.
+"""
+
+from math import pi, sin, cos, sqrt, asin, atan, atan2, floor, ceil, log, \
+                 copysign
+from collections import OrderedDict
+from bisect import bisect_right
+import json, pickle, shelve
+
+# Aircraft bank into turns like in a coordinated turn at cruising speed V:
+# tan(bank angle) = V^2/g * turn rate (heading change per distance flown).
+# TURN_BANK_FACTOR is that V^2/g, in distance units.
+TURN_BANK_FACTOR = 40.
+MAX_BANK_ANGLE = 60.*(pi/180.)
+
+# BezierArcs are subdivided until their samples are at most this far from
+# the curve (points3dHD and points3d)
+BEZIER_TOLERANCE = .05
+BEZIER_TOLERANCE_LOW = 1.
+# Bound on the number of halvings, i.e. at most 2**depth segments
+BEZIER_MAX_DEPTH = 16
+
+# Straights and HelixArcs get about one sample per unit of length (HelixArcs
+# one per 50/radius degrees), but at least and at most this many
+MIN_SAMPLES = 100
+MAX_SAMPLES = 1000
+# While a HelixArc is edited, it keeps its angle step between samples until
+# that is this factor off the step a fresh sampling would use
+RESAMPLE_FACTOR = 2.
+# Unit circle tables are grown by rotation, re-seeded with exact cos and sin
+# every this many entries against drift; at most this many tables are kept
+RESEED_INTERVAL = 64
+MAX_UNIT_CIRCLE_TABLES = 64
+# HelixArc angle steps are rounded to powers of 2**(1./this) degrees, so
+# that arcs of similar size share a unit circle table
+ANGLE_STEPS_PER_OCTAVE = 8
+
+
+class Point3D(object):
+  """@class Point3D
+  A 3D vector. Slotted to keep the many sample points small; the operators
+  duck-type their operands instead of checking them with isinstance.
+  The fused operations (axpy, lerp, project) do in one step what would
+  otherwise allocate temporary points.
+  """
+  __slots__ = ('x', 'y', 'z')
+
+  def __init__(self, _x=0., _y=0., _z=0.):
+    """Constructor"""
+    self.x, self.y, self.z = _x, _y, _z
+
+  @classmethod
+  def copy(cls, other):
+    """Copy 'constructor'"""
+    try:
+      return Point3D(other.x, other.y, other.z)
+    except AttributeError:
+      raise TypeError
+
+  @classmethod
+  def fromList(cls, other):
+    """Create Point3D from (x,y,z) or [x,y,z]"""
+    if not isinstance(other, (list, tuple)):
+      raise TypeError
+    if not len(other)==3:
+      raise TypeError
+    return Point3D(other[0], other[1], other[2])
+
+  # Pickling: the state is the attribute dictionary that Point3D had before
+  # it was slotted, so old scenes load and old versions read new ones
+  def __getstate__(self):
+    return {'x': self.x, 'y': self.y, 'z': self.z}
+
+  def __setstate__(self, state):
+    self.x, self.y, self.z = state['x'], state['y'], state['z']
+
+  def xy(self):
+    """Point projected to the (z=0)-plane"""
+    return Point3D(self.x, self.y, 0)
+
+  def norm(self):
+    """L2-Norm from origin to point"""
+    return sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
+
+  def toRGB(self):
+    """Convert a Point3D to an RGB color triple.
+    Channel values are integer numbers clamped to a range of [0, 255]"""
+    r, g, b = self.x, self.y, self.z
+    r = max(0, min(255, int(r)))
+    g = max(0, min(255, int(g)))
+    b = max(0, min(255, int(b)))
+    return [r, g, b]
+
+  def snapToNearestGridPoint(self):
+    """Round the Point3D to the nearest grid crossing"""
+    self.x = round(self.x/50)*50
+    self.y = round(self.y/50)*50
+
+  #_____________________________________________________________________
+  # Fused operations
+
+  def axpy(self, a, other):
+    """self += a*other, in place; returns self"""
+    a = float(a)
+    self.x += a*other.x
+    self.y += a*other.y
+    self.z += a*other.z
+    return self
+
+  def lerp(self, other, t):
+    """The point a fraction t of the way from self to other"""
+    return Point3D(self.x + (other.x-self.x)*t,
+                   self.y + (other.y-self.y)*t,
+                   self.z + (other.z-self.z)*t)
+
+  def project(self, eye, xAxis, yAxis, scale=1., origin=(0, 0)):
+    """[x, y] of self - eye projected onto two axes ((x, y, z) tuples, e.g.
+    the rows of a camera's projection matrix), scaled and then shifted by
+    origin"""
+    x, y, z = self.x-eye.x, self.y-eye.y, self.z-eye.z
+    return [(x*xAxis[0] + y*xAxis[1] + z*xAxis[2])*scale + origin[0],
+            (x*yAxis[0] + y*yAxis[1] + z*yAxis[2])*scale + origin[1]]
+
+  #_____________________________________________________________________
+  # Operators
+
+  def __add__(self, other):
+    """self + other"""
+    try:
+      return Point3D(self.x + other.x,
+                     self.y + other.y,
+                     self.z + other.z)
+    except AttributeError:
+      raise TypeError
+
+  def __sub__(self, other):
+    """self - other"""
+    try:
+      return Point3D(self.x - other.x,
+                     self.y - other.y,
+                     self.z - other.z)
+    except AttributeError:
+      raise TypeError
+
+  def __iadd__(self, other):
+    """self += other"""
+    try:
+      self.x += other.x
+      self.y += other.y
+      self.z += other.z
+    except AttributeError:
+      raise TypeError
+    return self
+
+  def __isub__(self, other):
+    """self -= other"""
+    try:
+      self.x -= other.x
+      self.y -= other.y
+      self.z -= other.z
+    except AttributeError:
+      raise TypeError
+    return self
+
+  def __mul__(self, other):
+    """self * other"""
+    # float() accepts exactly the scalars (and raises TypeError otherwise)
+    other = float(other)
+    return Point3D(self.x * other,
+                   self.y * other,
+                   self.z * other)
+
+  def __rmul__(self, other):
+    """other * self"""
+    return self.__mul__(other)
+
+  def __div__(self, other):
+    """self / other"""
+    other = float(other)
+    return Point3D(self.x / other,
+                   self.y / other,
+                   self.z / other)
+
+  __truediv__ = __div__
+
+  def __str__(self):
+    return "(%f, %f, %f)" % (self.x, self.y, self.z)
+
+
+class PathPieceGeometry(object):
+  """@class PathPieceGeometry
+  Base class of all PathPiece types. A PathPiece is sampled into a list of
+  points (points3dHD, and every 10th of them in points3d) which are OFFSETS
+  to its center.
+
+  The samples are evenly spaced in angle or curve parameter, not in
+  distance. Positions along a piece are therefore given as arc length
+  (distance from its first sample) and looked up in a table of the
+  cumulative distances of the samples; see pointAtDistance().
+  """
+  # Name under which the piece type is stored in scene files
+  typeName = None
+
+  def __init__(self):
+    self.center = Point3D()
+    self.activeEnd = 0
+    # Set by invalidateGeometry(): the samples are outdated and recomputed
+    # when next read
+    self.geometryDirty = False
+    self.points3d = []
+    self.points3dHD = []
+    # Callables notified with the piece after it was moved or changed (e.g.
+    # by a PathNetwork.PathGraph); not saved
+    self.observers = []
+    # Arc length tables, see arcLengths(); rebuilt when points3dHD is replaced
+    self.arcLengthSamples = None
+    self.arcLengthTable = None
+    self.arcLengthArrays = None
+    # Level of detail pyramid, see lodPyramid(); rebuilt with the arrays
+    self.lodSource = None
+    self.lodLevels = None
+    # Frame tables, see frames(); rebuilt like the arc length tables
+    self.frameSamples = None
+    self.frameTable = None
+    self.frameArrays = None
+
+  def recompute(self):
+    pass
+
+  # The samples; reading them recomputes them first if they are outdated,
+  # assigning them (in recompute()) makes them current
+  @property
+  def points3d(self):
+    self.updateGeometry()
+    return self._points3d
+
+  @points3d.setter
+  def points3d(self, points):
+    self._points3d = points
+
+  @property
+  def points3dHD(self):
+    self.updateGeometry()
+    return self._points3dHD
+
+  @points3dHD.setter
+  def points3dHD(self, points):
+    self.geometryDirty = False
+    self._points3dHD = points
+
+  def invalidateGeometry(self):
+    """Mark the samples as outdated; several edits in a row then cost one
+    recompute()"""
+    self.geometryDirty = True
+
+  def updateGeometry(self):
+    """recompute() if the samples are outdated"""
+    if self.geometryDirty:
+      self.geometryDirty = False
+      self.recompute()
+
+  def notifyObservers(self):
+    for observer in self.observers:
+      observer(self)
+
+  def geometryChanged(self):
+    """Called after the piece's shape parameters were edited. The samples
+    are recomputed when next needed (observers reading them included)."""
+    self.invalidateGeometry()
+    self.notifyObservers()
+
+  def isStartEnd(self, activeEnd):
+    """True if the active (or inactive) end is the start of the samples"""
+    return (self.activeEnd==0 and activeEnd) or \
+           (self.activeEnd==1 and not activeEnd)
+
+  def getEndPoint3d(self, getActiveEnd):
+    return self.points3d[0] if self.isStartEnd(getActiveEnd) \
+                            else self.points3d[-1]
+
+  def moveTo(self, newPos):
+    self.center = Point3D.copy(newPos)
+    self.notifyObservers()
+
+  def moveByOffset(self, offset):
+    self.center += offset
+    self.notifyObservers()
+
+  #_____________________________________________________________________
+  # Arc length parametrization
+
+  def arcLengths(self):
+    """Cumulative distances of the points3dHD samples from the first one"""
+    if self.arcLengthSamples is not self.points3dHD:
+      table = [0.]
+      for a, b in zip(self.points3dHD[:-1], self.points3dHD[1:]):
+        table.append(table[-1] + (b-a).norm())
+      self.arcLengthTable = table
+      self.arcLengthArrays = None
+      self.arcLengthSamples = self.points3dHD
+    return self.arcLengthTable
+
+  def arcLength(self):
+    """Length of the piece"""
+    return self.arcLengths()[-1]
+
+  def segmentAtDistance(self, s):
+    """Index i of the sample segment [i, i+1] containing arc length s, and
+    the fraction of the way through it (s is clamped to the piece)"""
+    table = self.arcLengths()
+    i = max(0, min(len(table)-2, bisect_right(table, s)-1))
+    segmentLength = table[i+1] - table[i]
+    if segmentLength <= 0.:
+      return i, 0.
+    return i, max(0., min(1., (s-table[i])/segmentLength))
+
+  def pointAtDistance(self, s):
+    """World position at arc length s"""
+    i, t = self.segmentAtDistance(s)
+    a, b = self.points3dHD[i], self.points3dHD[i+1]
+    return self.center + a + t*(b-a)
+
+  def tangentAtDistance(self, s):
+    """Unit direction of travel (towards the last sample) at arc length s"""
+    i, t = self.segmentAtDistance(s)
+    d = self.points3dHD[i+1] - self.points3dHD[i]
+    n = d.norm()
+    return d/n if n > 0. else Point3D()
+
+  def sampleArrays(self):
+    """Arc length table and samples (N x 3, offsets to center) as numpy
+    arrays, for the batched queries"""
+    import numpy
+    table = self.arcLengths()
+    if self.arcLengthArrays is None:
+      self.arcLengthArrays = (numpy.array(table),
+                              numpy.array([(p.x, p.y, p.z)
+                                           for p in self.points3dHD]))
+    return self.arcLengthArrays
+
+  def lodPyramid(self):
+    """Levels of detail of the points3dHD samples, as (samples, spacing)
+    pairs from the finest to the coarsest: all samples with their largest
+    gap, then the fewest of them (first and last included) at most
+    spacing apart along the piece, the spacing doubling per level up to
+    half the piece's length. Levels are taken by arc length rather than by
+    index, since samples may be spaced unevenly (BezierArcs are sampled
+    adaptively). Requires numpy."""
+    import numpy
+    table, samples = self.sampleArrays()
+    if self.lodSource is not samples:
+      gap = float(numpy.diff(table).max()) if len(table) > 1 else 0.
+      levels = []
+      spacing = float(table[-1])/2.
+      while spacing >= gap and spacing > 0.:
+        # Greedily keep the farthest sample within spacing of the last kept
+        kept = [0]
+        while kept[-1] < len(table)-1:
+          kept.append(int(numpy.searchsorted(table, table[kept[-1]]+spacing,
+                                             'right'))-1)
+        if len(kept) < len(table):
+          levels.insert(0, (samples[kept], spacing))
+        spacing /= 2.
+      self.lodLevels = [(samples, gap)] + levels
+      self.lodSource = samples
+    return self.lodLevels
+
+  def lodSamples(self, pixelsPerUnit, pixelsPerSample=1.):
+    """The coarsest level of detail whose samples are at most
+    pixelsPerSample pixels apart when the piece is drawn at pixelsPerUnit
+    (arc length bounds the distance on screen), or all samples where even
+    they are farther apart."""
+    levels = self.lodPyramid()
+    level = 0
+    while level+1 < len(levels) and \
+          levels[level+1][1]*pixelsPerUnit <= pixelsPerSample:
+      level += 1
+    return levels[level][0]
+
+  def pointsAtDistances(self, distances):
+    """World positions at many arc lengths at once (N x 3 numpy array).
+    Requires numpy."""
+    import numpy
+    table, samples = self.sampleArrays()
+    distances = numpy.asarray(distances, dtype=float)
+    points = numpy.empty(distances.shape + (3,))
+    for axis, offset in enumerate((self.center.x, self.center.y, self.center.z)):
+      points[..., axis] = numpy.interp(distances, table, samples[:, axis])
+      points[..., axis] += offset
+    return points
+
+  def tangentsAtDistances(self, distances):
+    """Unit directions of travel at many arc lengths at once (N x 3 numpy
+    array). Requires numpy."""
+    import numpy
+    table, samples = self.sampleArrays()
+    distances = numpy.asarray(distances, dtype=float)
+    i = numpy.clip(numpy.searchsorted(table, distances, 'right')-1,
+                   0, len(table)-2)
+    d = samples[i+1] - samples[i]
+    n = numpy.sqrt((d*d).sum(axis=-1))[..., numpy.newaxis]
+    return numpy.where(n > 0., d/numpy.where(n > 0., n, 1.), 0.)
+
+
+  #_____________________________________________________________________
+  # Orientation along the piece
+
+  def frames(self):
+    """Orientation of an aircraft at every points3dHD sample, flying towards
+    the last one: (tangents, normals, bank angles). Tangents and normals
+    are unit (x, y, z) tuples, perpendicular to each other; bank angles are
+    in radians, positive in left (counter-clockwise) turns."""
+    if self.frameSamples is not self.points3dHD:
+      self.frameTable = self.computeFrames()
+      self.frameArrays = None
+      self.frameSamples = self.points3dHD
+    return self.frameTable
+
+  def sampleTangents(self):
+    """Unit tangents at the samples, by default from their differences"""
+    pts = self.points3dHD
+    tangents = []
+    for i in range(len(pts)):
+      d = pts[min(i+1, len(pts)-1)] - pts[max(i-1, 0)]
+      tangents.append(unitTuple((d.x, d.y, d.z)))
+    return tangents
+
+  def computeFrames(self):
+    """Rotation-minimizing frames (no twist about the tangent) along the
+    samples, starting with the normal that is level at the first one"""
+    pts = [(p.x, p.y, p.z) for p in self.points3dHD]
+    tangents = self.sampleTangents()
+    if not pts:
+      return [], [], []
+    normals = [levelNormal(tangents[0])]
+    # Double reflection method (Wang et al., Computation of Rotation
+    # Minimizing Frames, 2008)
+    for i in range(len(pts)-1):
+      r, t = normals[-1], tangents[i]
+      v1 = (pts[i+1][0]-pts[i][0], pts[i+1][1]-pts[i][1], pts[i+1][2]-pts[i][2])
+      c1 = dot(v1, v1)
+      if c1 > 1e-12:
+        r = reflect(r, v1, c1)
+        t = reflect(t, v1, c1)
+      v2 = (tangents[i+1][0]-t[0], tangents[i+1][1]-t[1], tangents[i+1][2]-t[2])
+      c2 = dot(v2, v2)
+      if c2 > 1e-12:
+        r = reflect(r, v2, c2)
+      normals.append(perpendicularUnit(r, tangents[i+1]))
+    return tangents, normals, self.sampleBankAngles(tangents)
+
+  def sampleBankAngles(self, tangents):
+    """Bank angles from the heading changes between the sample tangents"""
+    table = self.arcLengths()
+    headings = [atan2(t[1], t[0]) for t in tangents]
+    banks = []
+    for i in range(len(tangents)):
+      lo, hi = max(i-1, 0), min(i+1, len(tangents)-1)
+      ds = table[hi] - table[lo]
+      turn = (headings[hi] - headings[lo] + pi) % (2*pi) - pi
+      banks.append(bankAngle(turn/ds if ds > 0. else 0.))
+    return banks
+
+  def frameAtDistance(self, s):
+    """(tangent, normal, bank angle) at arc length s, see frames()"""
+    i, t = self.segmentAtDistance(s)
+    tangents, normals, banks = self.frames()
+    tangent = unitTuple(mix(tangents[i], tangents[i+1], t))
+    normal = perpendicularUnit(mix(normals[i], normals[i+1], t), tangent)
+    return (Point3D(*tangent), Point3D(*normal),
+            banks[i] + (banks[i+1]-banks[i])*t)
+
+  def framesAtDistances(self, distances):
+    """Tangents (N x 3), normals (N x 3) and bank angles (N) at many arc
+    lengths at once, as numpy arrays. Requires numpy."""
+    import numpy
+    table = self.sampleArrays()[0]
+    if self.frameArrays is None or self.frameSamples is not self.points3dHD:
+      tangents, normals, banks = self.frames()
+      self.frameArrays = (numpy.array(tangents), numpy.array(normals),
+                          numpy.array(banks))
+    tangents, normals, banks = self.frameArrays
+    distances = numpy.asarray(distances, dtype=float)
+    def interp(values):
+      return numpy.interp(distances, table, values)
+    return orthonormalFrames(
+             numpy.stack([interp(tangents[:, k]) for k in range(3)], -1),
+             numpy.stack([interp(normals[:, k]) for k in range(3)], -1)) + \
+           (interp(banks),)
+
+  #_____________________________________________________________________
+  # Bounds
+
+  def axisRange(self, axis):
+    """(min, max) of the dot products of the piece's points (offsets to its
+    center) with axis, an (x, y, z) tuple. This default goes through the
+    samples; the piece types compute it from their parameters."""
+    values = [dot((p.x, p.y, p.z), axis) for p in self.points3dHD]
+    return min(values), max(values)
+
+  def projectedBounds(self, xAxis, yAxis):
+    """(minx, miny, maxx, maxy) of the piece's points projected onto two
+    axes (e.g. the rows of the view's projection matrix)"""
+    minx, maxx = self.axisRange(xAxis)
+    miny, maxy = self.axisRange(yAxis)
+    return minx, miny, maxx, maxy
+
+
+def dot(a, b):
+  return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
+
+
+def mix(a, b, t):
+  return (a[0]+(b[0]-a[0])*t, a[1]+(b[1]-a[1])*t, a[2]+(b[2]-a[2])*t)
+
+
+def unitTuple(v):
+  n = sqrt(dot(v, v))
+  return (v[0]/n, v[1]/n, v[2]/n) if n > 0. else (0., 0., 0.)
+
+
+def reflect(v, normal, normalSquared):
+  """v mirrored at the plane with the given normal (and its squared norm)"""
+  f = 2.*dot(v, normal)/normalSquared
+  return (v[0]-f*normal[0], v[1]-f*normal[1], v[2]-f*normal[2])
+
+
+def perpendicularUnit(v, tangent):
+  """The unit part of v perpendicular to the unit tangent (or a level
+  normal if there is none)"""
+  along = dot(v, tangent)
+  r = unitTuple((v[0]-along*tangent[0], v[1]-along*tangent[1],
+                 v[2]-along*tangent[2]))
+  return r if r != (0., 0., 0.) else levelNormal(tangent)
+
+
+def levelNormal(tangent):
+  """The horizontal unit normal to the left of a tangent (the x axis for
+  vertical or no tangents)"""
+  r = unitTuple((-tangent[1], tangent[0], 0.))
+  return r if r != (0., 0., 0.) else (1., 0., 0.)
+
+
+def bankAngle(turnRate):
+  """Bank angle for a heading change per distance, see TURN_BANK_FACTOR"""
+  return max(-MAX_BANK_ANGLE, min(MAX_BANK_ANGLE,
+                                  atan(TURN_BANK_FACTOR*turnRate)))
+
+
+def orthonormalFrames(tangents, normals):
+  """Interpolated tangents and normals (numpy N x 3 arrays) made unit and
+  perpendicular again"""
+  import numpy
+  tangents = tangents/numpy.maximum(
+               numpy.sqrt((tangents*tangents).sum(-1))[..., numpy.newaxis],
+               1e-12)
+  normals = normals - (normals*tangents).sum(-1)[..., numpy.newaxis]*tangents
+  normals = normals/numpy.maximum(
+              numpy.sqrt((normals*normals).sum(-1))[..., numpy.newaxis], 1e-12)
+  return tangents, normals
+
+
+def lowResolution(points):
+  """Every 10th of the points, and the last one"""
+  low = points[::10]
+  if (len(points)-1) % 10:
+    low.append(points[-1])
+  return low
+
+
+class StraightGeometry(PathPieceGeometry):
+  typeName = 'Straight'
+
+  def __init__(self,
+               startPoint3D=Point3D(50,0,0),
+               endPoint3D=Point3D(-50,0,0),
+               color=(0,0,0)):
+    super(StraightGeometry, self).__init__()
+    self.color = color
+    self.startPoint = Point3D.copy(startPoint3D)
+    self.endPoint = Point3D.copy(endPoint3D)
+    self.center = (self.startPoint+self.endPoint)/2
+    self.recompute()
+
+  def shelve(self):
+    """Save a Straight instance to file"""
+    d = [self.center,
+         self.color[:],
+         self.startPoint,
+         self.endPoint,
+         self.activeEnd]
+    return d
+
+  def unshelve(self, shelvedData):
+    """Load a Straight instance from file"""
+    self.center,                  \
+    self.color,                   \
+    self.startPoint,              \
+    self.endPoint,                \
+    self.activeEnd = shelvedData
+    self.recompute()
+
+  def recompute(self):
+    # The number of samples depends directly on the Path length
+    steps = int((self.endPoint - self.startPoint).norm())
+    steps = min(MAX_SAMPLES, max(MIN_SAMPLES, steps))
+    # The samples are an affine ramp; built from plain floats, this avoids a
+    # temporary Point3D per sample and operation
+    s = self.startPoint
+    d = (self.endPoint-self.startPoint)/steps
+    self.points3dHD = [Point3D(s.x+k*d.x, s.y+k*d.y, s.z+k*d.z)
+                       for k in range(steps+1)]
+    self.points3d = lowResolution(self.points3dHD)
+
+  def sampleTangents(self):
+    d = self.endPoint - self.startPoint
+    return [unitTuple((d.x, d.y, d.z))]*len(self.points3dHD)
+
+  def transformShape(self, angle, scale):
+    self.startPoint = turnAndScale(self.startPoint, angle, scale)
+    self.endPoint = turnAndScale(self.endPoint, angle, scale)
+
+  def axisRange(self, axis):
+    """The ends"""
+    a = dot((self.startPoint.x, self.startPoint.y, self.startPoint.z), axis)
+    b = dot((self.endPoint.x, self.endPoint.y, self.endPoint.z), axis)
+    return min(a, b), max(a, b)
+
+  def setEndPos3d(self, newPos, setActiveEnd):
+    endIndexInPoints3d = 0 if self.isStartEnd(setActiveEnd) else -1
+    delta = newPos - self.points3d[endIndexInPoints3d]
+    if self.isStartEnd(setActiveEnd):
+      self.startPoint.axpy( .5, delta)
+      self.endPoint.axpy(  -.5, delta)
+      self.center.axpy(     .5, delta)
+    else:
+      self.startPoint.axpy(-.5, delta)
+      self.endPoint.axpy(   .5, delta)
+      self.center.axpy(     .5, delta)
+    self.geometryChanged()
+
+
+class UnitCircleTable(object):
+  """@class UnitCircleTable
+  cos and sin of the angles k*step (degrees) for k = 0, 1, ..., grown on
+  demand: each entry is the previous one rotated by step, so only every
+  RESEED_INTERVAL-th entry costs a call to cos and sin.
+  """
+  def __init__(self, step):
+    self.step = step
+    self.cos = [1.]
+    self.sin = [0.]
+    self.rotation = (cos(step*(pi/180.)), sin(step*(pi/180.)))
+
+  def extend(self, count):
+    """Make sure the table has count entries"""
+    cs, sn = self.cos, self.sin
+    rc, rs = self.rotation
+    c, s = cs[-1], sn[-1]
+    for k in range(len(cs), count):
+      if k % RESEED_INTERVAL:
+        c, s = c*rc - s*rs, s*rc + c*rs
+      else:
+        c, s = cos(k*self.step*(pi/180.)), sin(k*self.step*(pi/180.))
+      cs.append(c)
+      sn.append(s)
+
+  def span(self, first, last):
+    """Lists of the cos and sin for k = first ... last-1 (negative k
+    mirror the table)"""
+    if first >= last:
+      return [], []
+    self.extend(max(last, -first+1))
+    cs, sn = [], []
+    if first < 0:
+      mirrored = slice(1-min(last, 0), 1-first)
+      cs = self.cos[mirrored][::-1]
+      sn = [-s for s in self.sin[mirrored][::-1]]
+    if last > 0:
+      first = max(first, 0)
+      cs += self.cos[first:last]
+      sn += self.sin[first:last]
+    return cs, sn
+
+
+# Tables by step, shared by all HelixArcs sampled with that step, least
+# recently used first
+unitCircleTables = OrderedDict()
+
+
+def unitCircleTable(step):
+  table = unitCircleTables.pop(step, None)
+  if table is None:
+    if len(unitCircleTables) >= MAX_UNIT_CIRCLE_TABLES:
+      unitCircleTables.popitem(last=False)
+    table = UnitCircleTable(step)
+  unitCircleTables[step] = table
+  return table
+
+
+def roundAngleStep(step):
+  """step rounded to the nearest power of 2**(1./ANGLE_STEPS_PER_OCTAVE)
+  degrees, keeping its sign"""
+  if not step:
+    return 0.
+  octaves = round(log(abs(step), 2)*ANGLE_STEPS_PER_OCTAVE)
+  rounded = 2.**(octaves/ANGLE_STEPS_PER_OCTAVE)
+  return rounded if step > 0 else -rounded
+
+
+class HelixArcGeometry(PathPieceGeometry):
+  typeName = 'HelixArc'
+
+  def __init__(self,
+               startHeight=-40., endHeight=40.,
+               startAngle=0., endAngle=360.,
+               radius=50., center=Point3D(),
+               rightHanded=True, color=(0,0,0),
+               gamma=1.):
+    super(HelixArcGeometry, self).__init__()
+    self.center = Point3D.copy(center)
+    self.centershift = [0,0]
+    self.color = color
+    self.startAngle, self.endAngle = startAngle, endAngle
+    self.startHeight, self.endHeight = startHeight, endHeight
+    self.rightHanded = rightHanded
+    self.radius = radius
+    ## The gamma value controls the gradient of the HelixArc's steepness
+    #  It's called "gamma" because it follows a gamma correction-style curve
+    self.gamma = gamma
+    # Sampling state, see recompute(): the radius and handedness sampled,
+    # the angle grid, and the samples on it from grid index gridFirst on
+    self.sampling = None
+    self.angleStep = 0.
+    self.sampleOrigin = 0.
+    self.gridFirst = 0
+    self.gridPoints = []
+    self.recompute()
+
+  def shelve(self):
+    """Save a HelixArc instance to file"""
+    d = [self.center,
+         self.centershift[:],
+         self.color[:],
+         self.startAngle,
+         self.endAngle,
+         self.startHeight,
+         self.endHeight,
+         self.rightHanded,
+         self.radius,
+         self.activeEnd,
+         self.gamma]
+    return d
+
+  def unshelve(self, shelvedData):
+    """Load a HelixArc instance from file"""
+    self.center,                  \
+    self.centershift,             \
+    self.color,                   \
+    self.startAngle,              \
+    self.endAngle,                \
+    self.startHeight,             \
+    self.endHeight,               \
+    self.rightHanded,             \
+    self.radius,                  \
+    self.activeEnd,               \
+    self.gamma = shelvedData
+    self.recompute()
+
+  def preferredAngleStep(self):
+    """Angle between samples of a fresh sampling (signed like the angle
+    range, 0 if the range is empty), rounded by roundAngleStep()"""
+    span = self.endAngle - self.startAngle
+    steps = int(abs(span) * abs(self.radius)/50)
+    steps = min(MAX_SAMPLES, max(MIN_SAMPLES, steps))
+    return roundAngleStep(span/float(steps))
+
+  def helixPoint(self, angle):
+    """Sample at an angle, at height 0"""
+    a = angle if self.rightHanded else (360.-angle)
+    return Point3D(cos(a*(pi/180.))*self.radius,
+                   sin(a*(pi/180.))*self.radius, 0.)
+
+  def gridSamples(self, first, last):
+    """Samples at height 0 on the grid, k = first ... last-1. The angles
+    k*angleStep come from the shared unit circle table and are turned by
+    sampleOrigin, so no cos or sin is needed per sample. Reversed ranges
+    share the table of the positive step."""
+    cs, sn = unitCircleTable(abs(self.angleStep)).span(first, last)
+    a = self.sampleOrigin*(pi/180.)
+    rc, rs = cos(a)*self.radius, sin(a)*self.radius
+    if not self.rightHanded:
+      # Mirrored: sin(360-angle) = -sin(angle)
+      rs = -rs
+    if (self.angleStep < 0) != (not self.rightHanded):
+      sn = [-s for s in sn]
+    return [Point3D(c*rc - s*rs, s*rc + c*rs, 0.) for c, s in zip(cs, sn)]
+
+  def recompute(self):
+    """Sample at startAngle, at the angles sampleOrigin + k*angleStep
+    between the ends, and at endAngle. The heights are a linear ramp over
+    the angle.
+
+    The grid stays while radius and handedness do and the step still fits
+    the angle range, so an edit of the angles only computes the samples
+    added at the ends and an edit of the heights none at all. Either way,
+    the samples kept just get their heights from the new ramp."""
+    span = self.endAngle - self.startAngle
+    preferred = self.preferredAngleStep()
+    if self.sampling != (self.radius, self.rightHanded) or \
+       not 1./RESAMPLE_FACTOR <= (self.angleStep/preferred if preferred
+                                  else 0.) <= RESAMPLE_FACTOR:
+      self.sampling = (self.radius, self.rightHanded)
+      self.angleStep = preferred
+      self.sampleOrigin = self.startAngle
+      self.gridPoints = []
+
+    # Grid indices strictly between the ends
+    first, last = 1, 0
+    if self.angleStep:
+      first = int(floor((self.startAngle-self.sampleOrigin)/self.angleStep
+                        + 1e-6)) + 1
+      last = int(ceil((self.endAngle-self.sampleOrigin)/self.angleStep
+                      - 1e-6)) - 1
+    old, oldFirst = self.gridPoints, self.gridFirst
+    lo, hi = max(first, oldFirst), min(last, oldFirst+len(old)-1)
+    if lo > hi:
+      lo, hi = last+1, last
+    self.gridPoints = self.gridSamples(first, lo) + \
+                      old[lo-oldFirst:hi+1-oldFirst] + \
+                      self.gridSamples(max(lo, hi+1), last+1)
+    self.gridFirst = first
+
+    # Gamma correction-style height recomputation (keeps range), not applied:
+    #   z = startHeight + (endHeight-startHeight) * (ramp value) ** (1./gamma)
+    slope = (self.endHeight-self.startHeight)/float(span) if span else 0.
+    dz = slope*self.angleStep
+    z = self.startHeight + slope*(self.sampleOrigin-self.startAngle) + \
+        dz*first
+    for i, p in enumerate(self.gridPoints):
+      p.z = z + dz*i
+    start = self.helixPoint(self.startAngle)
+    start.z = self.startHeight
+    end = self.helixPoint(self.endAngle)
+    end.z = self.endHeight
+    self.points3dHD = [start] + self.gridPoints + [end]
+    self.points3d = lowResolution(self.points3dHD)
+
+  def setEndPos3d(self, newPos, setActiveEnd):
+    endIndexInPoints3d = 0 if self.isStartEnd(setActiveEnd) else -1
+    hDelta = newPos.z - self.points3d[endIndexInPoints3d].z
+    if self.isStartEnd(setActiveEnd):
+      self.startHeight += .25*hDelta
+      self.endHeight   -= .5*hDelta
+      self.center.z    += .5*hDelta
+    else:
+      self.startHeight -= .5*hDelta
+      self.endHeight   += .25*hDelta
+      self.center.z    += .5*hDelta
+    self.geometryChanged()
+
+  def computeFrames(self):
+    """The helix's own frames: the normal points to its axis, the bank
+    follows its constant turn rate"""
+    steps = len(self.points3dHD)
+    if not steps:
+      return [], [], []
+    # Derivatives by angle (radians) of the position in sample order:
+    # reversed arcs (endAngle < startAngle) run towards smaller angles
+    span = (self.endAngle-self.startAngle)*(pi/180.)
+    direction = copysign(1., span)
+    turn = direction if self.rightHanded else -direction
+    dz = direction*(self.endHeight-self.startHeight)/span if span else 0.
+    if self.radius == 0.:
+      # A vertical segment: no turn, no axis to point the normal to
+      tangent = unitTuple((0., 0., dz))
+      return [tangent]*steps, [levelNormal(tangent)]*steps, [0.]*steps
+    tangents, normals, banks = [], [], []
+    for p in self.points3dHD:
+      tangent = unitTuple((-turn*p.y, turn*p.x, dz))
+      tangents.append(tangent)
+      normals.append(unitTuple((-p.x, -p.y, 0.)))
+      # Heading changes by 1/|radius| per horizontal distance
+      horizontal = sqrt(tangent[0]**2 + tangent[1]**2)
+      banks.append(bankAngle(turn*horizontal/abs(self.radius)))
+    return tangents, normals, banks
+
+  def transformShape(self, angle, scale):
+    # Left-handed helices run through 360-angle
+    turn = angle if self.rightHanded else -angle
+    self.startAngle += turn
+    self.endAngle += turn
+    self.radius *= scale
+    self.startHeight *= scale
+    self.endHeight *= scale
+
+  def axisRange(self, axis):
+    """Along the axis, the helix is A cos t + B sin t + C t + D over its
+    angles t. The extremes are at the ends or where the derivative
+    -R sin(t-phi) + C vanishes (A cos t + B sin t = R cos(t-phi))."""
+    t0, t1 = self.startAngle*(pi/180.), self.endAngle*(pi/180.)
+    # Left-handed helices run through 360-angle: sin changes its sign
+    a = self.radius*axis[0]
+    b = self.radius*axis[1]*(1. if self.rightHanded else -1.)
+    c = axis[2]*(self.endHeight-self.startHeight)/(t1-t0) if t1 != t0 else 0.
+    d = axis[2]*self.startHeight - c*t0
+    ts = [t0, t1]
+    r = sqrt(a*a + b*b)
+    if r > abs(c):
+      lo, hi = min(t0, t1), max(t0, t1)
+      phi, s = atan2(b, a), asin(c/r)
+      for base in (phi+s, phi+pi-s):
+        t = base + ceil((lo-base)/(2.*pi))*2.*pi
+        while t <= hi:
+          ts.append(t)
+          t += 2.*pi
+    values = [a*cos(t) + b*sin(t) + c*t + d for t in ts]
+    return min(values), max(values)
+
+  def changeAngles(self, mouseRel, setActiveEnd):
+    if self.isStartEnd(setActiveEnd):
+      self.startAngle -= mouseRel[0]
+    else:
+      self.endAngle += mouseRel[0]
+    self.geometryChanged()
+
+
+def bezierIsFlat(p0, p1, p2, p3, tolerance):
+  """Whether the cubic Bezier curve (coordinate tuples) is within tolerance
+  of its chord: it lies in the convex hull of its control points, so it is
+  if both inner control points are"""
+  d = (p3[0]-p0[0], p3[1]-p0[1], p3[2]-p0[2])
+  length = dot(d, d)
+  for p in (p1, p2):
+    r = (p[0]-p0[0], p[1]-p0[1], p[2]-p0[2])
+    s = max(0., min(1., dot(r, d)/length)) if length > 0. else 0.
+    e = (r[0]-d[0]*s, r[1]-d[1]*s, r[2]-d[2]*s)
+    if dot(e, e) > tolerance*tolerance:
+      return False
+  return True
+
+
+def subdivideBezier(p0, p1, p2, p3, tolerance, maxDepth=BEZIER_MAX_DEPTH):
+  """Points (coordinate tuples) along a cubic Bezier curve, no farther than
+  tolerance from it, and their curve parameters. The curve is split in half
+  (de Casteljau) until every part is flat enough, so the points are dense
+  where the curve bends and sparse where it is straight."""
+  points, parameters = [p0], [0.]
+  stack = [(p0, p1, p2, p3, 0., 1., 0)]
+  while stack:
+    p0, p1, p2, p3, t0, t1, depth = stack.pop()
+    if depth >= maxDepth or bezierIsFlat(p0, p1, p2, p3, tolerance):
+      points.append(p3)
+      parameters.append(t1)
+      continue
+    p01, p12, p23 = mix(p0, p1, .5), mix(p1, p2, .5), mix(p2, p3, .5)
+    p012, p123 = mix(p01, p12, .5), mix(p12, p23, .5)
+    mid = mix(p012, p123, .5)
+    tm = (t0+t1)/2.
+    # The first half is popped (and output) first
+    stack.append((mid, p123, p23, p3, tm, t1, depth+1))
+    stack.append((p0, p01, p012, mid, t0, tm, depth+1))
+  return points, parameters
+
+
+class BezierArcGeometry(PathPieceGeometry):
+  typeName = 'BezierArc'
+
+  def __init__(self,
+               startPoint3D=Point3D(50,0,0),
+               endPoint3D=Point3D(-50,0,0),
+               bezierControlStartPoint3D=Point3D(0,50,0),
+               bezierControlEndPoint3D=Point3D(0,-50,0),
+               color=(0,0,0)):
+    """Bezier Points are OFFSETS to the respective point!"""
+    super(BezierArcGeometry, self).__init__()
+    self.color = color
+    self.startPoint = Point3D.copy(startPoint3D)
+    self.endPoint = Point3D.copy(endPoint3D)
+    self.bezierControlStartPoint = Point3D.copy(bezierControlStartPoint3D)
+    self.bezierControlEndPoint = Point3D.copy(bezierControlEndPoint3D)
+    self.center = (self.startPoint+self.endPoint)/2
+    self.recompute()
+
+  def shelve(self):
+    """Save a BezierArc instance to file"""
+    d = [self.center,
+         self.color[:],
+         self.startPoint,
+         self.endPoint,
+         self.bezierControlStartPoint,
+         self.bezierControlEndPoint,
+         self.activeEnd]
+    return d
+
+  def unshelve(self, shelvedData):
+    """Load a BezierArc instance from file"""
+    self.center,                  \
+    self.color,                   \
+    self.startPoint,              \
+    self.endPoint,                \
+    self.bezierControlStartPoint, \
+    self.bezierControlEndPoint,   \
+    self.activeEnd = shelvedData
+    self.recompute()
+
+  def controlPoints(self):
+    """The four control points as (x, y, z) tuples"""
+    P0 = self.startPoint
+    P1 = self.startPoint + self.bezierControlStartPoint
+    P2 = self.endPoint + self.bezierControlEndPoint
+    P3 = self.endPoint
+    return [(P.x, P.y, P.z) for P in (P0, P1, P2, P3)]
+
+  def recompute(self):
+    controls = self.controlPoints()
+    # Adaptive sampling in high and low resolution; the curve parameters of
+    # the HD samples are kept for sampleTangents()
+    points, self.sampleParameters = subdivideBezier(*controls,
+                                                    tolerance=BEZIER_TOLERANCE)
+    self.points3dHD = [Point3D(*p) for p in points]
+    points = subdivideBezier(*controls, tolerance=BEZIER_TOLERANCE_LOW)[0]
+    self.points3d = [Point3D(*p) for p in points]
+
+  def sampleTangents(self):
+    """Unit tangents from the curve's derivative"""
+    P0 = self.startPoint
+    P1 = self.startPoint + self.bezierControlStartPoint
+    P2 = self.endPoint + self.bezierControlEndPoint
+    P3 = self.endPoint
+    tangents = []
+    for t in self.sampleParameters:
+      D = (1-t)**2 * (P1-P0) + 2*(1-t)*t * (P2-P1) + t**2 * (P3-P2)
+      if D.norm() <= 1e-9:
+        # Control point on its end point: the curve leaves towards the next
+        D = P2-P0 if t == 0. else P3-P1 if t == 1. else P3-P0
+      tangents.append(unitTuple((D.x, D.y, D.z)))
+    return tangents
+
+  def setEndPos3d(self, newPos, setActiveEnd):
+    endIndexInPoints3d = 0 if self.isStartEnd(setActiveEnd) else -1
+    delta = newPos - self.points3d[endIndexInPoints3d]
+    if self.isStartEnd(setActiveEnd):
+      self.startPoint.axpy( .5, delta)
+      self.endPoint.axpy(  -.5, delta)
+      self.center.axpy(     .5, delta)
+    else:
+      self.startPoint.axpy(-.5, delta)
+      self.endPoint.axpy(   .5, delta)
+      self.center.axpy(     .5, delta)
+    self.geometryChanged()
+
+  def getBezierControl(self, getStart):
+    return self.bezierControlStartPoint \
+            if getStart                 \
+            else self.bezierControlEndPoint
+
+  def transformShape(self, angle, scale):
+    for name in ('startPoint', 'endPoint',
+                 'bezierControlStartPoint', 'bezierControlEndPoint'):
+      setattr(self, name, turnAndScale(getattr(self, name), angle, scale))
+
+  def axisRange(self, axis):
+    """The curve lies in the convex hull of its control points"""
+    values = [dot(p, axis) for p in self.controlPoints()]
+    return min(values), max(values)
+
+  def setBezierControl(self, newPos, setStart):
+    if setStart:
+      self.bezierControlStartPoint = Point3D.copy(newPos)
+    else:
+      self.bezierControlEndPoint   = Point3D.copy(newPos)
+    self.geometryChanged()
+
+
+def turnAndScale(p, angle, scale):
+  """p turned by angle (degrees) about the z axis and scaled"""
+  c, s = cos(angle*(pi/180.))*scale, sin(angle*(pi/180.))*scale
+  return Point3D(p.x*c - p.y*s, p.x*s + p.y*c, p.z*scale)
+
+
+def transformPieces(pieces, translation=None, angle=0., scale=1.,
+                    pivot=None):
+  """Transform many PathPieces at once: turn them by angle (degrees,
+  counter-clockwise about the vertical axis through pivot), scale them
+  about pivot, then move them by translation (a Point3D). The centers are
+  transformed together in one numpy operation; the shapes only if turned or
+  scaled, by each piece type's transformShape(angle, scale), which changes
+  the shape parameters (about the piece's center), and geometryChanged().
+  Observers are notified once per piece.
+  Returns the pieces whose shape changed (e.g. to render them again)."""
+  import numpy
+  pieces = list(pieces)
+  if not pieces:
+    return []
+  centers = numpy.array([(p.center.x, p.center.y, p.center.z)
+                         for p in pieces])
+  reshape = angle % 360. != 0. or scale != 1.
+  if reshape:
+    c, s = cos(angle*(pi/180.)), sin(angle*(pi/180.))
+    origin = numpy.array([pivot.x, pivot.y, pivot.z]) if pivot is not None \
+                                                     else numpy.zeros(3)
+    matrix = scale*numpy.array([[c, -s, 0.], [s, c, 0.], [0., 0., 1.]])
+    centers = (centers-origin).dot(matrix.T) + origin
+  if translation is not None:
+    centers += (translation.x, translation.y, translation.z)
+  for piece, center in zip(pieces, centers.tolist()):
+    piece.center = Point3D(*center)
+    if reshape:
+      piece.transformShape(angle, scale)
+      piece.geometryChanged()
+    else:
+      piece.notifyObservers()
+  return pieces if reshape else []
+
+
+class Path(object):
+  """@class Path
+  A Path describes a 3-dimensional spacial structure consisting of (possibly
+  intertwined) curves made up of linked-together PathPieces. Objects may move
+  along a Path, switching off to another Path at a point where the two Paths
+  are linked.
+  """
+  def __init__(self):
+    pass
+
+
+#_______________________________________________________________________
+# Scene files
+
+
+# The PathPiece types a scene can contain, by their typeName
+PIECE_CLASSES = {'Straight':  StraightGeometry,
+                 'HelixArc':  HelixArcGeometry,
+                 'BezierArc': BezierArcGeometry}
+
+# Format identifier written into converted scene files
+SCENE_FORMAT = 'mayday-scene'
+SCENE_FORMAT_VERSION = 1
+
+# Names of the values returned by each PathPiece type's shelve(), in order
+SHELVE_FIELDS = {'Straight':  ('center', 'color', 'startPoint', 'endPoint',
+                               'activeEnd'),
+                 'HelixArc':  ('center', 'centershift', 'color', 'startAngle',
+                               'endAngle', 'startHeight', 'endHeight',
+                               'rightHanded', 'radius', 'activeEnd', 'gamma'),
+                 'BezierArc': ('center', 'color', 'startPoint', 'endPoint',
+                               'bezierControlStartPoint',
+                               'bezierControlEndPoint', 'activeEnd')}
+POINT_FIELDS = ('center', 'startPoint', 'endPoint',
+                'bezierControlStartPoint', 'bezierControlEndPoint')
+
+
+def serializeObjects(objects):
+  """Save PathPiece instances"""
+  return [(o.typeName, o.shelve()) for o in objects]
+
+
+def unshelveObjects(data, classes=None):
+  """Reconstruct PathPiece instances from serialized data"""
+  if classes is None:
+    classes = PIECE_CLASSES
+  objects = []
+  for classname, shelvedObj in data:
+    o = classes[classname]()
+    o.unshelve(shelvedObj)
+    objects.append(o)
+  return objects
+
+
+class SceneUnpickler(pickle.Unpickler):
+  """Scenes saved by older editor versions reference Point3D in module
+  __main__ or LevelEditor. Map those to this module."""
+  def find_class(self, module, name):
+    if module in ('__main__', 'LevelEditor') and name == 'Point3D':
+      module = __name__
+    return pickle.Unpickler.find_class(self, module, name)
+
+
+def readShelvedScene(filename):
+  """Read the serialized scene data from a .shelve file"""
+  db = shelve.open(filename, 'r')
+  try:
+    # Bypass the shelf's own unpickling to be able to remap modules
+    raw = db.dict['objectslist']
+  finally:
+    db.close()
+  try:
+    from cStringIO import StringIO
+  except ImportError:
+    from io import BytesIO as StringIO
+  return SceneUnpickler(StringIO(raw)).load()
+
+
+def writeShelvedScene(filename, data):
+  """Write serialized scene data to a .shelve file"""
+  db = shelve.open(filename)
+  db['objectslist'] = data
+  db.close()
+
+
+def sceneToJSON(data):
+  """Convert serialized scene data to the portable JSON scene format"""
+  objects = []
+  for classname, shelvedObj in data:
+    entry = {'type': classname}
+    for field, value in zip(SHELVE_FIELDS[classname], shelvedObj):
+      if isinstance(value, Point3D):
+        value = [value.x, value.y, value.z]
+      elif isinstance(value, tuple):
+        value = list(value)
+      entry[field] = value
+    objects.append(entry)
+  return {'format': SCENE_FORMAT, 'version': SCENE_FORMAT_VERSION,
+          'objects': objects}
+
+
+def sceneFromJSON(document):
+  """Convert a JSON scene document to serialized scene data"""
+  if document.get('format') != SCENE_FORMAT:
+    raise ValueError('Not a %s document' % SCENE_FORMAT)
+  data = []
+  for entry in document['objects']:
+    classname = str(entry['type'])
+    shelvedObj = []
+    for field in SHELVE_FIELDS[classname]:
+      value = entry[field]
+      if field in POINT_FIELDS:
+        value = Point3D.fromList(value)
+      elif field == 'color':
+        value = tuple(value)
+      shelvedObj.append(value)
+    data.append((classname, shelvedObj))
+  return data
+
+
+def readScene(filename):
+  """Read serialized scene data from a .shelve or .json scene file"""
+  if filename.endswith('.json'):
+    with open(filename) as f:
+      return sceneFromJSON(json.load(f))
+  return readShelvedScene(filename)
@@ -0,0 +1,416 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Spatial index over the samples of PathPieces.
+
+Every piece gets a bounding volume hierarchy (SegmentBVH) over the segments
+between its points3dHD samples. A PathIndex answers "which point on any path
+is closest to this 3D point" (nearestPoint) or "to this line of sight"
+(nearestToLine, e.g. the ray under a mouse pixel) by descending only the
+branches whose boxes could still contain something closer than the best
+segment found so far. That is fast enough to ask on every mouse motion while
+dragging, e.g. to snap onto other paths.
+
+The hierarchies are built in piece coordinates (samples are offsets to the
+piece's center), so moving a piece costs nothing, and editing it only refits
+the boxes as long as the number of samples stays the same. The index listens
+to its pieces (see PathPieceGeometry.observers) and brings the hierarchy of a
+changed piece up to date when it is next needed.
+
+Above them, a PieceTree holds the world boxes of the whole pieces, so a
+query only looks at the pieces in the branches it descends instead of every
+piece. It is built anew when pieces are added or removed; a changed piece
+only refits the boxes on the path from its leaf to the root (until so many
+were refit that a fresh build pays off).
+
+Like PathGeometry, this module imports neither pygame nor gtk.
+"""
+
+from math import sqrt
+
+# Segments per leaf of a SegmentBVH
+LEAF_SIZE = 8
+# Pieces per leaf of a PieceTree
+PIECE_LEAF_SIZE = 4
+
+# World box of a piece without segments: contains nothing, unites with
+# any box to that box
+EMPTY_BOX = (float('inf'),)*3 + (float('-inf'),)*3
+
+#_______________________________________________________________________
+
+
+def pointSegmentDistance(x, p, q):
+  """Distance between the point x and the segment p-q (coordinate tuples)
+  and the parameter (0 at p, 1 at q) of the closest point on the segment"""
+  d = (q[0]-p[0], q[1]-p[1], q[2]-p[2])
+  r = (x[0]-p[0], x[1]-p[1], x[2]-p[2])
+  a = d[0]*d[0] + d[1]*d[1] + d[2]*d[2]
+  s = max(0., min(1., (d[0]*r[0] + d[1]*r[1] + d[2]*r[2])/a)) if a > 1e-12 \
+                                                             else 0.
+  dx, dy, dz = r[0]-d[0]*s, r[1]-d[1]*s, r[2]-d[2]*s
+  return sqrt(dx*dx + dy*dy + dz*dz), s
+
+
+def acrossLine(x, origin, direction):
+  """The part of x - origin perpendicular to the (unit) direction"""
+  r = (x[0]-origin[0], x[1]-origin[1], x[2]-origin[2])
+  along = r[0]*direction[0] + r[1]*direction[1] + r[2]*direction[2]
+  return (r[0]-direction[0]*along, r[1]-direction[1]*along,
+          r[2]-direction[2]*along)
+
+
+def lineSegmentDistance(origin, direction, p, q):
+  """Distance between the infinite line through origin along the (unit)
+  direction and the segment p-q, and the parameter of the closest point on
+  the segment. Seen along the line, this is a point-segment distance."""
+  return pointSegmentDistance((0., 0., 0.), acrossLine(p, origin, direction),
+                                            acrossLine(q, origin, direction))
+
+
+def pointBoxDistance(x, node):
+  """Distance between a point and the box of a SegmentBVH node"""
+  gap = 0.
+  for k in range(3):
+    d = node[2+k] - x[k]
+    if d <= 0.:
+      d = x[k] - node[5+k]
+    if d > 0.:
+      gap += d*d
+  return sqrt(gap)
+
+
+def lineBoxDistance(origin, direction, node):
+  """Lower bound of the distance between a line and the box of a SegmentBVH
+  node (the distance to the box's bounding sphere)"""
+  center = ((node[2]+node[5])/2., (node[3]+node[6])/2., (node[4]+node[7])/2.)
+  half = ((node[5]-node[2])/2., (node[6]-node[3])/2., (node[7]-node[4])/2.)
+  r = acrossLine(center, origin, direction)
+  return max(0., sqrt(r[0]*r[0] + r[1]*r[1] + r[2]*r[2]) -
+                 sqrt(half[0]*half[0] + half[1]*half[1] + half[2]*half[2]))
+
+
+class SegmentBVH(object):
+  """@class SegmentBVH
+  Bounding box hierarchy over the segments between consecutive points. The
+  points follow a curve, so halving the index range already gives tight,
+  coherent boxes. Nodes are lists
+    [first segment, last segment + 1, minx, miny, minz, maxx, maxy, maxz,
+     left child, right child]
+  with children -1 for leaves; children always come after their parent.
+  """
+  def __init__(self, points):
+    self.points = [(p.x, p.y, p.z) for p in points]
+    self.nodes = []
+    if len(self.points) > 1:
+      self.buildNode(0, len(self.points)-1)
+
+  def buildNode(self, lo, hi):
+    index = len(self.nodes)
+    node = [lo, hi, 0., 0., 0., 0., 0., 0., -1, -1]
+    self.nodes.append(node)
+    if hi - lo > LEAF_SIZE:
+      mid = (lo + hi)//2
+      node[8] = self.buildNode(lo, mid)
+      node[9] = self.buildNode(mid, hi)
+    self.fitNode(node)
+    return index
+
+  def fitNode(self, node):
+    if node[8] < 0:
+      pts = self.points[node[0]:node[1]+1]
+      xs = [p[0] for p in pts]
+      ys = [p[1] for p in pts]
+      zs = [p[2] for p in pts]
+      node[2:8] = [min(xs), min(ys), min(zs), max(xs), max(ys), max(zs)]
+    else:
+      l, r = self.nodes[node[8]], self.nodes[node[9]]
+      node[2:8] = [min(l[2], r[2]), min(l[3], r[3]), min(l[4], r[4]),
+                   max(l[5], r[5]), max(l[6], r[6]), max(l[7], r[7])]
+
+  def refit(self, points):
+    """Update for moved points; False if their number changed (rebuild!)"""
+    if len(points) != len(self.points):
+      return False
+    self.points = [(p.x, p.y, p.z) for p in points]
+    for node in reversed(self.nodes):
+      self.fitNode(node)
+    return True
+
+  def nearest(self, boxDistance, segmentDistance, limit):
+    """The segment nearest to something, if nearer than limit:
+    (distance, segment index, parameter on the segment) or None.
+    boxDistance(node) must not exceed the distance of any segment in the
+    node, segmentDistance(p, q) returns (distance, parameter)."""
+    if not self.nodes:
+      return None
+    best = None
+    stack = [(boxDistance(self.nodes[0]), 0)]
+    while stack:
+      d, index = stack.pop()
+      if d >= limit:
+        continue
+      node = self.nodes[index]
+      if node[8] < 0:
+        pts = self.points
+        for i in range(node[0], node[1]):
+          d, s = segmentDistance(pts[i], pts[i+1])
+          if d < limit:
+            limit = d
+            best = (d, i, s)
+        continue
+      near = (boxDistance(self.nodes[node[8]]), node[8])
+      far = (boxDistance(self.nodes[node[9]]), node[9])
+      if far < near:
+        near, far = far, near
+      # The nearer child is popped (and may lower the limit) first
+      stack.append(far)
+      stack.append(near)
+    return best
+
+
+class PieceTree(object):
+  """@class PieceTree
+  Bounding box hierarchy over the world boxes of PathPieces. Nodes are laid
+  out like those of a SegmentBVH, the index ranges referring to the list of
+  pieces (in the order of the leaves); boxes are tuples
+    (minx, miny, minz, maxx, maxy, maxz)
+  """
+  def __init__(self, pieces, boxes):
+    self.pieces = []
+    self.boxes = []
+    self.nodes = []
+    self.parents = []
+    # Index in self.pieces and leaf node of each piece
+    self.slot = {}
+    self.leafOf = {}
+    if pieces:
+      self.buildNode(list(zip(pieces, boxes)), -1)
+
+  def buildNode(self, items, parent):
+    index = len(self.nodes)
+    node = [len(self.pieces), 0, 0., 0., 0., 0., 0., 0., -1, -1]
+    self.nodes.append(node)
+    self.parents.append(parent)
+    if len(items) > PIECE_LEAF_SIZE:
+      # Halve along the axis in which the box centers spread most
+      centers = [boxCenter(box) for piece, box in items]
+      axis = max(range(3), key=lambda k: max(c[k] for c in centers) -
+                                         min(c[k] for c in centers))
+      order = sorted(range(len(items)), key=lambda i: centers[i][axis])
+      items = [items[i] for i in order]
+      half = len(items)//2
+      node[8] = self.buildNode(items[:half], index)
+      node[9] = self.buildNode(items[half:], index)
+    else:
+      for piece, box in items:
+        self.slot[piece] = len(self.pieces)
+        self.leafOf[piece] = index
+        self.pieces.append(piece)
+        self.boxes.append(box)
+    node[1] = len(self.pieces)
+    self.fitNode(node)
+    return index
+
+  def fitNode(self, node):
+    if node[8] < 0:
+      boxes = self.boxes[node[0]:node[1]]
+    else:
+      boxes = [self.nodes[node[8]][2:8], self.nodes[node[9]][2:8]]
+    node[2:8] = [min(box[0] for box in boxes), min(box[1] for box in boxes),
+                 min(box[2] for box in boxes), max(box[3] for box in boxes),
+                 max(box[4] for box in boxes), max(box[5] for box in boxes)]
+
+  def refit(self, piece, box):
+    """Update for the new world box of a piece"""
+    self.boxes[self.slot[piece]] = box
+    index = self.leafOf[piece]
+    while index >= 0:
+      self.fitNode(self.nodes[index])
+      index = self.parents[index]
+
+  def nearest(self, boxDistance, pieceNearest, limit):
+    """The nearest something on any piece, if nearer than limit.
+    boxDistance(node) must not exceed the distance of anything in the node,
+    pieceNearest(piece, limit) returns a tuple starting with the distance
+    of the nearest something on the piece, or None if none is nearer than
+    limit. Returns what pieceNearest returned for the nearest piece."""
+    if not self.nodes:
+      return None
+    best = None
+    stack = [(boxDistance(self.nodes[0]), 0)]
+    while stack:
+      d, index = stack.pop()
+      if d >= limit:
+        continue
+      node = self.nodes[index]
+      if node[8] < 0:
+        for piece in self.pieces[node[0]:node[1]]:
+          found = pieceNearest(piece, limit)
+          if found is not None:
+            limit = found[0]
+            best = found
+        continue
+      near = (boxDistance(self.nodes[node[8]]), node[8])
+      far = (boxDistance(self.nodes[node[9]]), node[9])
+      if far < near:
+        near, far = far, near
+      stack.append(far)
+      stack.append(near)
+    return best
+
+  def overlapping(self, box, margin=0.):
+    """The pieces whose boxes come within margin of box on every axis"""
+    def apart(other):
+      return other[0]-margin > box[3] or box[0]-margin > other[3] or \
+             other[1]-margin > box[4] or box[1]-margin > other[4] or \
+             other[2]-margin > box[5] or box[2]-margin > other[5]
+    found = []
+    stack = [0] if self.nodes else []
+    while stack:
+      node = self.nodes[stack.pop()]
+      if apart(node[2:8]):
+        continue
+      if node[8] < 0:
+        for i in range(node[0], node[1]):
+          if not apart(self.boxes[i]):
+            found.append(self.pieces[i])
+      else:
+        stack.append(node[8])
+        stack.append(node[9])
+    return found
+
+
+def boxCenter(box):
+  if box[0] > box[3]:
+    return (0., 0., 0.)
+  return ((box[0]+box[3])/2., (box[1]+box[4])/2., (box[2]+box[5])/2.)
+
+
+class PathIndex(object):
+  """@class PathIndex
+  Nearest-point queries over the samples of a set of PathPieces, kept up to
+  date as the pieces change. Queries return tuples
+    (piece, distance, closest point on the piece, arc length at that point)
+  with world coordinates, or None if nothing is near enough.
+  """
+  def __init__(self):
+    self.pieces = set()
+    self.bvhs = {}
+    self.changed = set()
+    # The PieceTree (None: to be built), the pieces changed since it was
+    # brought up to date, and the refits since it was built
+    self.tree = None
+    self.moved = set()
+    self.refits = 0
+
+  def addPiece(self, piece):
+    if piece in self.pieces:
+      return
+    self.pieces.add(piece)
+    piece.observers.append(self.pieceChanged)
+    self.changed.add(piece)
+    self.tree = None
+
+  def removePiece(self, piece):
+    if piece not in self.pieces:
+      return
+    piece.observers.remove(self.pieceChanged)
+    self.pieces.remove(piece)
+    self.changed.discard(piece)
+    self.moved.discard(piece)
+    self.bvhs.pop(piece, None)
+    self.tree = None
+
+  def setPieces(self, pieces):
+    """Make the index contain exactly the given pieces"""
+    pieces = set(pieces)
+    for piece in self.pieces - pieces:
+      self.removePiece(piece)
+    for piece in pieces - self.pieces:
+      self.addPiece(piece)
+
+  def pieceChanged(self, piece):
+    """Observer callback"""
+    self.changed.add(piece)
+    self.moved.add(piece)
+
+  def bvh(self, piece):
+    """The piece's hierarchy (in piece coordinates), brought up to date"""
+    if piece in self.changed:
+      self.changed.remove(piece)
+      bvh = self.bvhs.get(piece)
+      if bvh is None or not bvh.refit(piece.points3dHD):
+        self.bvhs[piece] = SegmentBVH(piece.points3dHD)
+    return self.bvhs[piece]
+
+  def worldBox(self, piece):
+    """(minx, miny, minz, maxx, maxy, maxz) of the piece, or None if it has
+    no segments"""
+    nodes = self.bvh(piece).nodes
+    if not nodes:
+      return None
+    root = nodes[0]
+    c = piece.center
+    return (root[2]+c.x, root[3]+c.y, root[4]+c.z,
+            root[5]+c.x, root[6]+c.y, root[7]+c.z)
+
+  def pieceTree(self):
+    """The PieceTree over all pieces, brought up to date"""
+    if self.tree is None or self.refits > len(self.pieces):
+      pieces = list(self.pieces)
+      self.tree = PieceTree(pieces, [self.worldBox(piece) or EMPTY_BOX
+                                     for piece in pieces])
+      self.refits = 0
+    else:
+      for piece in self.moved:
+        self.tree.refit(piece, self.worldBox(piece) or EMPTY_BOX)
+      self.refits += len(self.moved)
+    self.moved = set()
+    return self.tree
+
+  def nearest(self, query, boxDistance, maxDistance, exclude):
+    """Common part of the queries: boxDistance(node) bounds the distance to
+    the world box of a PieceTree node, query(center of a piece) returns the
+    boxDistance and segmentDistance for SegmentBVH.nearest() in the
+    piece's coordinates"""
+    def pieceNearest(piece, limit):
+      if piece in exclude:
+        return None
+      c = piece.center
+      pieceBoxDistance, segmentDistance = query((c.x, c.y, c.z))
+      found = self.bvh(piece).nearest(pieceBoxDistance, segmentDistance,
+                                      limit)
+      return None if found is None else (found[0], piece) + found[1:]
+    best = self.pieceTree().nearest(boxDistance, pieceNearest, maxDistance)
+    if best is None:
+      return None
+    d, piece, i, s = best
+    p, q = piece.points3dHD[i], piece.points3dHD[i+1]
+    table = piece.arcLengths()
+    return (piece, d, piece.center + p + (q-p)*s,
+            table[i] + (table[i+1]-table[i])*s)
+
+  def nearestPoint(self, pos, maxDistance=float('inf'), exclude=()):
+    """The point on any piece (except those in exclude) closest to pos"""
+    def query(center):
+      x = (pos.x-center[0], pos.y-center[1], pos.z-center[2])
+      return (lambda node: pointBoxDistance(x, node),
+              lambda p, q: pointSegmentDistance(x, p, q))
+    world = (pos.x, pos.y, pos.z)
+    return self.nearest(query, lambda node: pointBoxDistance(world, node),
+                        maxDistance, exclude)
+
+  def nearestToLine(self, origin, direction, maxDistance=float('inf'),
+                    exclude=()):
+    """The point on any piece (except those in exclude) closest to the line
+    through origin along direction, e.g. the line of sight of a pixel"""
+    direction = direction/direction.norm()
+    v = (direction.x, direction.y, direction.z)
+    def query(center):
+      o = (origin.x-center[0], origin.y-center[1], origin.z-center[2])
+      return (lambda node: lineBoxDistance(o, v, node),
+              lambda p, q: lineSegmentDistance(o, v, p, q))
+    world = (origin.x, origin.y, origin.z)
+    return self.nearest(query, lambda node: lineBoxDistance(world, v, node),
+                        maxDistance, exclude)
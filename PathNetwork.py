@@ -0,0 +1,470 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Connectivity of PathPieces.
+
+The nodes of a PathGraph are the two ends of every PathPiece, its edges are
+the pieces themselves (connecting their own two ends) and joins between the
+ends of different pieces. Two ends are joined when they are closer than a
+tolerance. Joins are found through a 3D spatial hash of all end positions, so
+adding, moving or editing a piece costs time proportional to the number of
+ends near it instead of the number of pieces in the level. The graph listens
+to its pieces (see PathPieceGeometry.observers) and updates itself whenever
+one of them is moved or changed.
+
+The connected components ("circuits") of the graph are kept up to date with
+every join, so asking which circuit a piece belongs to, whether that circuit
+is closed (contains a cycle) and which of its ends are still open takes
+constant time. Ends joined to each other, directly or through other ends,
+form a junction; a circuit contains a cycle if it has at least as many
+pieces as junctions (three pieces meeting in one junction are a branch, not
+a loop). Joining merges circuits and junctions by moving the ends of the
+smaller one. Removing a join searches from both of its ends at once; if they
+are no longer connected, the side exhausted first (the smaller one) is split
+off, so only that part is visited.
+
+An EndIndex is a second, coarser hash of all ends, for finding an end to
+snap to near a dragged one in constant time.
+
+Like PathGeometry, this module imports neither pygame nor gtk.
+"""
+
+from math import floor
+from collections import deque
+from PathGeometry import Point3D
+
+# Ends of different PathPieces closer than this are joined
+JOIN_TOLERANCE = 2.
+# EndIndex: ends this close to a position are candidates to snap to
+SNAP_DISTANCE = 30.
+
+#_______________________________________________________________________
+
+
+class SpatialHash(object):
+  """@class SpatialHash
+  Points (by key) in a uniform grid of cubic cells. Finding all points near a
+  position only has to look at the cells around it.
+  """
+  def __init__(self, cellSize):
+    self.cellSize = float(cellSize)
+    self.cells = {}
+    self.positions = {}
+
+  def __len__(self):
+    return len(self.positions)
+
+  def __contains__(self, key):
+    return key in self.positions
+
+  def cellOf(self, pos):
+    return (int(floor(pos.x/self.cellSize)),
+            int(floor(pos.y/self.cellSize)),
+            int(floor(pos.z/self.cellSize)))
+
+  def insert(self, key, pos):
+    self.positions[key] = pos
+    self.cells.setdefault(self.cellOf(pos), set()).add(key)
+
+  def remove(self, key):
+    cell = self.cellOf(self.positions.pop(key))
+    keys = self.cells[cell]
+    keys.discard(key)
+    if not keys:
+      del self.cells[cell]
+
+  def move(self, key, pos):
+    if key in self.positions:
+      self.remove(key)
+    self.insert(key, pos)
+
+  def near(self, pos, radius):
+    """All keys whose points are within radius of pos"""
+    r = Point3D(radius, radius, radius)
+    cx0, cy0, cz0 = self.cellOf(pos - r)
+    cx1, cy1, cz1 = self.cellOf(pos + r)
+    found = []
+    for cx in range(cx0, cx1+1):
+      for cy in range(cy0, cy1+1):
+        for cz in range(cz0, cz1+1):
+          for key in self.cells.get((cx, cy, cz), ()):
+            if (self.positions[key] - pos).norm() <= radius:
+              found.append(key)
+    return found
+
+
+class Partition(object):
+  """@class Partition
+  Disjoint sets, by number, that can be merged and split again. Every
+  element knows its set, so looking it up takes constant time; merging
+  moves the elements of the smaller set, splitting those split off.
+  """
+  def __init__(self):
+    self.setOf = {}
+    self.members = {}
+    self.nextSet = 1
+
+  def find(self, x):
+    return self.setOf[x]
+
+  def size(self, s):
+    return len(self.members[s])
+
+  def split(self, elements):
+    """Move elements (new ones or part of a set) into a new set. Returns
+    the new set's number."""
+    s = self.nextSet
+    self.nextSet += 1
+    self.members[s] = set(elements)
+    for x in self.members[s]:
+      old = self.setOf.get(x)
+      if old is not None:
+        self.members[old].discard(x)
+        if not self.members[old]:
+          del self.members[old]
+      self.setOf[x] = s
+    return s
+
+  def add(self, x):
+    return self.split([x])
+
+  def remove(self, x):
+    s = self.setOf.pop(x)
+    self.members[s].discard(x)
+    if not self.members[s]:
+      del self.members[s]
+
+  def merge(self, a, b):
+    """Merge the sets of a and b. Returns (surviving set, absorbed set), or
+    None if a and b already were in the same set."""
+    sa, sb = self.setOf[a], self.setOf[b]
+    if sa == sb:
+      return None
+    if len(self.members[sa]) < len(self.members[sb]):
+      sa, sb = sb, sa
+    for x in self.members[sb]:
+      self.setOf[x] = sa
+    self.members[sa] |= self.members.pop(sb)
+    return sa, sb
+
+
+def separatedPart(a, b, neighbours):
+  """After an edge between a and b was removed: the elements still
+  connected to a or to b, whichever side is exhausted first when searching
+  breadth first from both at once, if that side does not reach the other;
+  None if a and b are still connected. neighbours(x) lists the elements x
+  has edges to."""
+  seen = (set([a]), set([b]))
+  queues = (deque([a]), deque([b]))
+  while True:
+    for side in (0, 1):
+      if not queues[side]:
+        return seen[side]
+      for other in neighbours(queues[side].popleft()):
+        if other in seen[1-side]:
+          return None
+        if other not in seen[side]:
+          seen[side].add(other)
+          queues[side].append(other)
+
+
+def endPosition(piece, end):
+  """World position of an end of a PathPiece: end 0 is its first sample,
+  end 1 its last"""
+  return piece.center + (piece.points3d[0] if end == 0 else piece.points3d[-1])
+
+
+def isActiveEnd(piece, end):
+  """Whether an end (0 or 1) is the piece's active end, e.g. to pass to its
+  setEndPos3d()"""
+  return piece.isStartEnd(True) == (end == 0)
+
+
+class PathGraph(object):
+  """@class PathGraph
+  Ends of PathPieces as nodes, pieces and joins between ends as edges.
+  Nodes are (piece, end) tuples, see endPosition().
+  """
+  def __init__(self, tolerance=JOIN_TOLERANCE):
+    self.tolerance = tolerance
+    self.pieces = set()
+    self.endHash = SpatialHash(tolerance)
+    # Joined ends of other pieces, by end
+    self.joins = {}
+    # Junctions and circuits as partitions of all ends, plus the number of
+    # junctions, the open ends and a serial number of each circuit
+    self.junctions = Partition()
+    self.circuits = Partition()
+    self.circuitJunctions = {}
+    self.circuitOpenEnds = {}
+    self.circuitNumbers = {}
+    self.nextCircuitNumber = 1
+    # Callables observer(pieces), called with the pieces whose joins or
+    # geometry changed
+    self.observers = []
+
+  def notifyObservers(self, pieces):
+    for observer in self.observers:
+      observer(pieces)
+
+  def addPiece(self, piece):
+    if piece in self.pieces:
+      return
+    self.pieces.add(piece)
+    ends = [(piece, 0), (piece, 1)]
+    for node in ends:
+      self.joins[node] = set()
+      self.junctions.add(node)
+    circuit = self.circuits.split(ends)
+    self.circuitJunctions[circuit] = 2
+    self.circuitOpenEnds[circuit] = set(ends)
+    self.circuitNumbers[circuit] = self.nextCircuitNumber
+    self.nextCircuitNumber += 1
+    piece.observers.append(self.pieceChanged)
+    self.pieceChanged(piece)
+
+  def removePiece(self, piece):
+    if piece not in self.pieces:
+      return
+    changed = self.neighbours(piece) | set([piece])
+    for end in (0, 1):
+      self.unjoinAll((piece, end))
+    for end in (0, 1):
+      self.endHash.remove((piece, end))
+      del self.joins[(piece, end)]
+    # Unjoined, the piece is a circuit of its own
+    circuit = self.circuits.find((piece, 0))
+    del self.circuitJunctions[circuit]
+    del self.circuitOpenEnds[circuit]
+    del self.circuitNumbers[circuit]
+    for end in (0, 1):
+      self.circuits.remove((piece, end))
+      self.junctions.remove((piece, end))
+    piece.observers.remove(self.pieceChanged)
+    self.pieces.remove(piece)
+    self.notifyObservers(changed)
+
+  def setPieces(self, pieces):
+    """Make the graph contain exactly the given pieces"""
+    pieces = set(pieces)
+    for piece in self.pieces - pieces:
+      self.removePiece(piece)
+    for piece in pieces - self.pieces:
+      self.addPiece(piece)
+
+  def clear(self):
+    self.setPieces(())
+
+  def pieceChanged(self, piece):
+    """Observer callback: re-hash the piece's ends and update its joins"""
+    changed = set([piece])
+    for end in (0, 1):
+      node = (piece, end)
+      pos = endPosition(piece, end)
+      self.endHash.move(node, pos)
+      near = set(other for other in self.endHash.near(pos, self.tolerance)
+                       if other[0] is not piece)
+      for other in self.joins[node] - near:
+        self.unjoin(node, other)
+        changed.add(other[0])
+      for other in near - self.joins[node]:
+        self.join(node, other)
+        changed.add(other[0])
+    self.notifyObservers(changed)
+
+  def join(self, a, b):
+    """Join two ends. Returns True if the join closed a circuit."""
+    if b in self.joins[a]:
+      return False
+    wasClosed = self.circuitClosed(self.circuits.find(a)) or \
+                self.circuitClosed(self.circuits.find(b))
+    for node in (a, b):
+      if not self.joins[node]:
+        self.circuitOpenEnds[self.circuits.find(node)].discard(node)
+    self.joins[a].add(b)
+    self.joins[b].add(a)
+    circuit = self.mergeCircuits(a, b)
+    if self.junctions.merge(a, b) is not None:
+      self.circuitJunctions[circuit] -= 1
+    return not wasClosed and self.circuitClosed(circuit)
+
+  def unjoin(self, a, b):
+    if b not in self.joins[a]:
+      return
+    self.joins[a].discard(b)
+    self.joins[b].discard(a)
+    circuit = self.circuits.find(a)
+    for node in (a, b):
+      if not self.joins[node]:
+        self.circuitOpenEnds[circuit].add(node)
+    part = separatedPart(a, b, self.joinedEnds)
+    if part is not None:
+      self.junctions.split(part)
+      self.circuitJunctions[circuit] += 1
+    part = separatedPart(a, b, self.connectedEnds)
+    if part is not None:
+      self.splitCircuit(circuit, part)
+
+  def unjoinAll(self, node):
+    for other in list(self.joins[node]):
+      self.unjoin(node, other)
+
+  def joinedEnds(self, node):
+    """Ends of other pieces joined to an end"""
+    return self.joins.get(node, set())
+
+  def connectedEnds(self, node):
+    """Ends sharing an edge with an end: the other end of its piece and the
+    ends joined to it"""
+    piece, end = node
+    return [(piece, 1-end)] + list(self.joins[node])
+
+  def neighbours(self, piece):
+    """Pieces joined to either end of a piece"""
+    return set(other for end in (0, 1)
+                     for other, otherEnd in self.joinedEnds((piece, end)))
+
+  def isOpenEnd(self, node):
+    return not self.joins[node]
+
+  def openEnds(self):
+    return [node for node, joined in self.joins.items() if not joined]
+
+  def joinList(self):
+    """Every join once, as a pair of ends"""
+    seen = set()
+    result = []
+    for a, joined in self.joins.items():
+      for b in joined:
+        if (b, a) not in seen:
+          seen.add((a, b))
+          result.append((a, b))
+    return result
+
+  #_____________________________________________________________________
+  # Circuits
+
+  def circuitClosed(self, circuit):
+    return self.circuits.size(circuit)//2 >= self.circuitJunctions[circuit]
+
+  def mergeCircuits(self, a, b):
+    """Merge the circuits of two ends, returns the merged circuit"""
+    merged = self.circuits.merge(a, b)
+    if merged is None:
+      return self.circuits.find(a)
+    circuit, absorbed = merged
+    self.circuitJunctions[circuit] += self.circuitJunctions.pop(absorbed)
+    openEnds = self.circuitOpenEnds.pop(absorbed)
+    if len(openEnds) > len(self.circuitOpenEnds[circuit]):
+      openEnds, self.circuitOpenEnds[circuit] = \
+        self.circuitOpenEnds[circuit], openEnds
+    self.circuitOpenEnds[circuit] |= openEnds
+    self.circuitNumbers[circuit] = min(self.circuitNumbers[circuit],
+                                       self.circuitNumbers.pop(absorbed))
+    return circuit
+
+  def splitCircuit(self, circuit, part):
+    """Make the ends in part, no longer connected to the rest of the
+    circuit, a circuit of their own"""
+    new = self.circuits.split(part)
+    junctions = len(set(self.junctions.find(node) for node in part))
+    self.circuitJunctions[new] = junctions
+    self.circuitJunctions[circuit] -= junctions
+    openEnds = set(node for node in part if not self.joins[node])
+    self.circuitOpenEnds[new] = openEnds
+    self.circuitOpenEnds[circuit] -= openEnds
+    self.circuitNumbers[new] = self.nextCircuitNumber
+    self.nextCircuitNumber += 1
+
+  def circuitOf(self, piece):
+    """Number identifying the circuit a piece belongs to"""
+    return self.circuits.find((piece, 0))
+
+  def circuitNumber(self, piece):
+    """Number of the piece's circuit, for display"""
+    return self.circuitNumbers[self.circuitOf(piece)]
+
+  def circuitSize(self, piece):
+    """Number of pieces in the piece's circuit"""
+    return self.circuits.size(self.circuitOf(piece))//2
+
+  def isClosed(self, piece):
+    """Whether the piece's circuit contains a cycle"""
+    return self.circuitClosed(self.circuitOf(piece))
+
+  def openEndsOfCircuit(self, piece):
+    return set(self.circuitOpenEnds[self.circuitOf(piece)])
+
+  def closingJoin(self, piece):
+    """The two ends whose join would close the piece's circuit into a
+    loop, or None if it is closed already or not a simple chain"""
+    if self.isClosed(piece):
+      return None
+    openEnds = self.circuitOpenEnds[self.circuitOf(piece)]
+    if len(openEnds) != 2:
+      return None
+    a, b = openEnds
+    # A piece is never joined to itself
+    if a[0] is b[0]:
+      return None
+    # Prefer an end of the given piece first
+    return (b, a) if b[0] is piece else (a, b)
+
+  def edges(self):
+    """All edges: ((piece, 0), (piece, 1)) for every piece plus all joins"""
+    return [((piece, 0), (piece, 1)) for piece in self.pieces] + \
+           self.joinList()
+
+
+class EndIndex(object):
+  """@class EndIndex
+  Ends of PathPieces in a spatial hash whose cells are as large as the snap
+  distance, so finding the nearest end only looks at the 27 cells around a
+  position, however many pieces there are. Nodes are (piece, end) tuples like
+  in PathGraph.
+  """
+  def __init__(self, distance=SNAP_DISTANCE):
+    self.distance = distance
+    self.pieces = set()
+    self.endHash = SpatialHash(distance)
+
+  def addPiece(self, piece):
+    if piece in self.pieces:
+      return
+    self.pieces.add(piece)
+    piece.observers.append(self.pieceChanged)
+    self.pieceChanged(piece)
+
+  def removePiece(self, piece):
+    if piece not in self.pieces:
+      return
+    for end in (0, 1):
+      self.endHash.remove((piece, end))
+    piece.observers.remove(self.pieceChanged)
+    self.pieces.remove(piece)
+
+  def setPieces(self, pieces):
+    """Make the index contain exactly the given pieces"""
+    pieces = set(pieces)
+    for piece in self.pieces - pieces:
+      self.removePiece(piece)
+    for piece in pieces - self.pieces:
+      self.addPiece(piece)
+
+  def pieceChanged(self, piece):
+    """Observer callback: re-hash the piece's ends"""
+    for end in (0, 1):
+      self.endHash.move((piece, end), endPosition(piece, end))
+
+  def nearestEnd(self, pos, exclude=()):
+    """The end nearest to pos within the snap distance, not counting ends of
+    the pieces in exclude, or None"""
+    best = None
+    bestDistance = self.distance
+    for node in self.endHash.near(pos, self.distance):
+      if node[0] in exclude:
+        continue
+      d = (self.endHash.positions[node] - pos).norm()
+      if d <= bestDistance:
+        best, bestDistance = node, d
+    return best
@@ -0,0 +1,149 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Routes through the path network.
+
+A route leads from the end through which an aircraft enters a PathPiece to
+the end through which it shall leave some (possibly other) piece. Between
+pieces it may only pass from an end to an end joined to it (see
+PathNetwork.PathGraph), so it never turns around in the middle of a piece.
+The cost of a route is the sum of the costs of the pieces it traverses:
+their arc length for the shortest route, the time to fly them for the
+fastest one (see travelTime()).
+
+A Router runs Dijkstra's algorithm from each source only as far as the
+queried goal needs and keeps the search, so further routes from the same
+source are mostly lookups and continue the search where it stopped. The
+router listens to its PathGraph and drops only the searches that reached a
+piece whose geometry or joins changed.
+
+Like PathGeometry, this module imports neither pygame nor gtk.
+"""
+
+from heapq import heappush, heappop
+
+#_______________________________________________________________________
+
+
+def arcLength(piece):
+  """Cost of a piece for the shortest route"""
+  return piece.arcLength()
+
+
+def travelTime(speed):
+  """Cost function for the fastest route, given the speed (distance per
+  time unit) on each piece as speed(piece)"""
+  def cost(piece):
+    return piece.arcLength()/speed(piece)
+  return cost
+
+
+class Search(object):
+  """@class Search
+  Dijkstra's algorithm from one source, run only as far as needed so far.
+  States are the ends through which the route leaves a piece.
+  """
+  def __init__(self, graph, source, cost):
+    self.graph = graph
+    self.cost = cost
+    piece, end = source
+    exit = (piece, 1-end)
+    # Pieces the search has seen; changing them may change its results.
+    # newPieces are those not yet picked up by the Router.
+    self.pieces = set([piece])
+    self.newPieces = [piece]
+    self.distance = {exit: cost(piece)}
+    self.previous = {exit: None}
+    self.settled = set()
+    # Entries (distance, serial number, end); the serial number breaks ties
+    self.heap = [(self.distance[exit], 0, exit)]
+    self.pushed = 1
+
+  def settle(self, goal):
+    """Continue until the goal is settled or nothing is left to reach"""
+    while self.heap and goal not in self.settled:
+      d, serial, node = heappop(self.heap)
+      if node in self.settled:
+        continue
+      self.settled.add(node)
+      for piece, end in self.graph.joinedEnds(node):
+        if piece not in self.pieces:
+          self.pieces.add(piece)
+          self.newPieces.append(piece)
+        exit = (piece, 1-end)
+        dExit = d + self.cost(piece)
+        if dExit < self.distance.get(exit, float('inf')):
+          self.distance[exit] = dExit
+          self.previous[exit] = node
+          heappush(self.heap, (dExit, self.pushed, exit))
+          self.pushed += 1
+
+  def route(self, goal):
+    """(cost, [(piece, entered end), ...]) or None if unreachable"""
+    self.settle(goal)
+    if goal not in self.settled:
+      return None
+    entered = []
+    node = goal
+    while node is not None:
+      entered.append((node[0], 1-node[1]))
+      node = self.previous[node]
+    entered.reverse()
+    return self.distance[goal], entered
+
+
+class Router(object):
+  """@class Router
+  Cheapest routes between piece ends of a PathGraph, with the searches
+  from each source kept until the graph changes near them.
+  """
+  def __init__(self, graph, cost=arcLength):
+    self.graph = graph
+    self.cost = cost
+    # Searches by source, and the sources whose searches saw a piece
+    self.searches = {}
+    self.sourcesOfPiece = {}
+    graph.observers.append(self.graphChanged)
+
+  def route(self, start, goal):
+    """The cheapest route entering a piece through the end start and
+    leaving one through the end goal (both (piece, end) tuples), see
+    Search.route()"""
+    search = self.searches.get(start)
+    if search is None:
+      search = Search(self.graph, start, self.cost)
+      self.searches[start] = search
+    result = search.route(goal)
+    for piece in search.newPieces:
+      self.sourcesOfPiece.setdefault(piece, set()).add(start)
+    search.newPieces = []
+    return result
+
+  def routeCost(self, start, goal):
+    result = self.route(start, goal)
+    return None if result is None else result[0]
+
+  def graphChanged(self, pieces):
+    """Graph observer callback: drop the searches that saw the pieces"""
+    for piece in pieces:
+      for source in self.sourcesOfPiece.pop(piece, ()):
+        self.forgetSearch(source)
+
+  def forgetSearch(self, source):
+    search = self.searches.pop(source, None)
+    if search is None:
+      return
+    for piece in search.pieces:
+      sources = self.sourcesOfPiece.get(piece)
+      if sources is not None:
+        sources.discard(source)
+        if not sources:
+          del self.sourcesOfPiece[piece]
+
+  def clear(self):
+    self.searches = {}
+    self.sourcesOfPiece = {}
+
+  def detach(self):
+    """Stop listening to the graph"""
+    self.graph.observers.remove(self.graphChanged)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Headless batch processing of Level Editor scenes.
+
+Every scene file given on the command line is loaded, all of its PathPieces
+are recomputed and checked against the geometry constraints, the scene is
+converted to the portable JSON scene format, and a baked export (the sampled
+path geometry in world coordinates) is written next to it. Files are processed
+in parallel worker processes; the time spent on each file is reported.
+
+Only the pure geometry model (PathGeometry) is used, so neither pygame nor
+GTK are imported. (Python 2 needs the "futures" backport for
+concurrent.futures.)
+
+Usage: python SceneBatch.py [-j JOBS] [-o OUTPUT_DIR] [--check-only] FILE...
+"""
+
+import argparse, json, math, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+
+from PathGeometry import StraightGeometry, HelixArcGeometry, \
+                         BezierArcGeometry, BEZIER_TOLERANCE, MIN_SAMPLES, \
+                         RESAMPLE_FACTOR, readScene, sceneToJSON, \
+                         unshelveObjects
+
+# Format identifier written into baked exports
+BAKED_FORMAT = 'mayday-baked'
+BAKED_FORMAT_VERSION = 2
+
+# Largest allowed distance between two neighbouring high resolution samples
+# of short pieces. The sample count is capped, so long pieces may have fewer
+# per unit; they still have MIN_SAMPLES samples, evenly spaced within
+# RESAMPLE_FACTOR (see maxSampleSpacing()). BezierArcs are sampled
+# adaptively and checked for their error instead.
+MAX_SAMPLE_SPACING = 5.
+
+#_______________________________________________________________________
+
+
+def checkGeometry(obj):
+  """Return a list of geometry constraint violations of a PathPiece"""
+  problems = []
+  name = obj.typeName
+  for p in obj.points3dHD:
+    if any(math.isnan(c) or math.isinf(c) for c in (p.x, p.y, p.z)):
+      problems.append('%s has non-finite sample coordinates' % name)
+      return problems
+  if obj.activeEnd not in (0, 1):
+    problems.append('%s has invalid active end %r' % (name, obj.activeEnd))
+  if isinstance(obj, StraightGeometry):
+    if (obj.endPoint - obj.startPoint).norm() == 0.:
+      problems.append('Straight has zero length')
+  elif isinstance(obj, HelixArcGeometry):
+    if obj.radius == 0.:
+      problems.append('HelixArc has zero radius')
+      if obj.startHeight == obj.endHeight:
+        problems.append('HelixArc is degenerate')
+    # Reversed ranges (endAngle < startAngle) are valid
+    if obj.endAngle == obj.startAngle:
+      problems.append('HelixArc has empty angle range [%.1f, %.1f]' %
+                      (obj.startAngle, obj.endAngle))
+  elif isinstance(obj, BezierArcGeometry):
+    if (obj.endPoint - obj.startPoint).norm() == 0. and \
+       obj.bezierControlStartPoint.norm() == 0. and \
+       obj.bezierControlEndPoint.norm() == 0.:
+      problems.append('BezierArc is degenerate')
+  if isinstance(obj, BezierArcGeometry):
+    # Adaptively sampled: bound the distance to the curve instead
+    error = bezierSampleError(obj)
+    if error > 1.01*BEZIER_TOLERANCE:
+      problems.append('BezierArc samples are %.3f units off the curve '
+                      '(max. %.3f)' % (error, BEZIER_TOLERANCE))
+    return problems
+  spacing = max([(b-a).norm() for a, b in zip(obj.points3dHD[:-1],
+                                                obj.points3dHD[1:])] or [0.])
+  limit = maxSampleSpacing(obj)
+  if spacing > limit:
+    problems.append('%s samples are %.1f units apart (max. %.1f)' %
+                    (name, spacing, limit))
+  return problems
+
+
+def maxSampleSpacing(obj):
+  """Largest allowed distance between neighbouring samples of a Straight or
+  HelixArc of the piece's length"""
+  return max(MAX_SAMPLE_SPACING,
+             1.01*RESAMPLE_FACTOR*obj.arcLength()/MIN_SAMPLES)
+
+
+def bezierSampleError(obj):
+  """Largest distance between a BezierArc and the segments between its
+  samples, measured halfway through each segment's curve parameters"""
+  P0 = obj.startPoint
+  P1 = obj.startPoint + obj.bezierControlStartPoint
+  P2 = obj.endPoint + obj.bezierControlEndPoint
+  P3 = obj.endPoint
+  error = 0.
+  pts, params = obj.points3dHD, obj.sampleParameters
+  for i in range(len(pts)-1):
+    t = (params[i] + params[i+1])/2.
+    B = (1-t)**3 * P0 + 3*(1-t)**2*t * P1 + 3*(1-t)*t**2 * P2 + t**3 * P3
+    a, b = pts[i], pts[i+1]
+    d = b - a
+    length = d.x*d.x + d.y*d.y + d.z*d.z
+    r = B - a
+    s = max(0., min(1., (r.x*d.x + r.y*d.y + r.z*d.z)/length)) if length \
+                                                                  else 0.
+    error = max(error, (r - d*s).norm())
+  return error
+
+
+def bakeScene(objects, source=''):
+  """Compile the world space samples of all PathPieces, their arc lengths
+  and the aircraft orientation at each (see PathPieceGeometry.frames())
+  into a baked export"""
+  pieces = []
+  for o in objects:
+    samples = [o.center + p for p in o.points3dHD]
+    tangents, normals, banks = o.frames()
+    pieces.append({'type': o.typeName,
+                   'length': o.arcLength(),
+                   'samples': [[p.x, p.y, p.z] for p in samples],
+                   'distances': o.arcLengths(),
+                   'tangents': [list(t) for t in tangents],
+                   'normals': [list(n) for n in normals],
+                   'banks': banks})
+  return {'format': BAKED_FORMAT, 'version': BAKED_FORMAT_VERSION,
+          'source': source, 'pieces': pieces}
+
+
+def outputPaths(filename, outputDir=None):
+  """Return the (converted scene, baked export) paths for a scene file"""
+  directory, basename = os.path.split(filename)
+  stem = os.path.splitext(basename)[0]
+  if outputDir is not None:
+    directory = outputDir
+  return (os.path.join(directory, stem+'.json'),
+          os.path.join(directory, stem+'.baked.json'))
+
+
+def processScene(filename, outputDir=None, checkOnly=False):
+  """Load, recompute, check, convert and bake one scene file.
+  Runs in a worker process; returns a picklable report dictionary."""
+  report = {'filename': filename, 'timings': [], 'problems': [],
+            'error': None, 'outputs': []}
+  def lap(stage, since):
+    now = time.time()
+    report['timings'].append((stage, now-since))
+    return now
+  start = t = time.time()
+  try:
+    data = readScene(filename)
+    objects = unshelveObjects(data)
+    t = lap('load', t)
+    for o in objects:
+      o.recompute()
+    t = lap('recompute', t)
+    for o in objects:
+      report['problems'].extend(checkGeometry(o))
+    t = lap('check', t)
+    if not checkOnly:
+      scenePath, bakedPath = outputPaths(filename, outputDir)
+      # Never overwrite the input when it already is a JSON scene
+      if os.path.abspath(scenePath) != os.path.abspath(filename):
+        with open(scenePath, 'w') as f:
+          json.dump(sceneToJSON(data), f, indent=1)
+        report['outputs'].append(scenePath)
+      with open(bakedPath, 'w') as f:
+        json.dump(bakeScene(objects, os.path.basename(filename)), f)
+      report['outputs'].append(bakedPath)
+      t = lap('export', t)
+  except Exception as e:
+    report['error'] = '%s: %s' % (e.__class__.__name__, e)
+  report['total'] = time.time()-start
+  return report
+
+
+def formatReport(report):
+  """One summary line (plus problem lines) for a processed scene"""
+  stages = '  '.join(['%s %.1f' % (stage, 1000.*seconds)
+                      for stage, seconds in report['timings']])
+  if report['error'] is not None:
+    status = 'ERROR (%s)' % report['error']
+  elif report['problems']:
+    status = '%d problem(s)' % len(report['problems'])
+  else:
+    status = 'OK'
+  lines = ['%-40s %8.1f ms  [%s]  %s' % (report['filename'],
+                                         1000.*report['total'], stages, status)]
+  lines.extend(['    %s' % p for p in report['problems']])
+  return '\n'.join(lines)
+
+#_______________________________________________________________________
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+             description='Validate, convert and bake Mayday scene files')
+  parser.add_argument('files', nargs='+', metavar='FILE',
+                      help='.shelve or .json scene files')
+  parser.add_argument('-j', '--jobs', type=int, default=None,
+                      help='number of worker processes (default: CPU count)')
+  parser.add_argument('-o', '--output-dir', default=None,
+                      help='write outputs here instead of next to the inputs')
+  parser.add_argument('--check-only', action='store_true',
+                      help='only load, recompute and check the scenes')
+  args = parser.parse_args(argv)
+
+  if args.output_dir is not None and not os.path.isdir(args.output_dir):
+    os.makedirs(args.output_dir)
+
+  start = time.time()
+  failed = 0
+  with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+    futures = [executor.submit(processScene, f, args.output_dir,
+                               args.check_only)
+               for f in args.files]
+    for future in futures:
+      report = future.result()
+      print(formatReport(report))
+      if report['error'] is not None or report['problems']:
+        failed += 1
+  print('%d file(s), %d with errors or problems, %.2f s total' %
+        (len(args.files), failed, time.time()-start))
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
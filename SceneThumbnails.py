@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Offscreen rendering of Level Editor scenes to PNG images.
+
+Scenes are drawn exactly like the editor draws them (ground grid plus all
+PathPieces in high definition) for a given camera, without opening a window
+or importing GTK. Several files and/or camera angles are rendered in parallel
+worker processes.
+
+Usage: python SceneThumbnails.py [-s WxH] [-a AZIMUTH...] [-e ELEVATION...]
+                                 [-z ZOOM] [-c X Y Z] [-o OUTPUT_DIR] FILE...
+(angles in degrees; the editor's default camera is -a 315 -e -66 -z 1)
+"""
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse, sys, time
+from math import pi
+from concurrent.futures import ProcessPoolExecutor
+
+import pygame
+import LevelEditor
+from PathGeometry import Point3D, readScene, unshelveObjects
+
+DEFAULT_AZIMUTH   = 315.
+DEFAULT_ELEVATION = -66.
+DEFAULT_ZOOM      = 1.
+DEFAULT_SIZE      = (200, 150)
+
+# Scenes already loaded by this (worker) process, by file name
+_sceneCache = {}
+
+#_______________________________________________________________________
+
+
+def initHeadless():
+  """Prepare pygame for windowless operation.
+  Safe to call more than once (e.g. once per task in a worker process)."""
+  if pygame.display.get_surface() is None:
+    pygame.display.init()
+    # PathPieces convert their surfaces, which needs a display mode
+    pygame.display.set_mode((1, 1))
+
+
+def setCamera(size, azimuth, elevation, zoom, cameraPosition):
+  """Set the LevelEditor's camera (angles in degrees) and viewport size"""
+  LevelEditor.WINDOW_SIZE = list(size)
+  LevelEditor.ORIGIN = [size[0]//2, size[1]//2]
+  LevelEditor.compute_projection_parameters(azimuth*(pi/180.),
+                                            elevation*(pi/180.),
+                                            zoom)
+  LevelEditor.CAMERA_POSITION = Point3D.fromList(list(cameraPosition))
+
+
+def renderScene(objects, size=DEFAULT_SIZE, azimuth=DEFAULT_AZIMUTH,
+                elevation=DEFAULT_ELEVATION, zoom=DEFAULT_ZOOM,
+                cameraPosition=(0., 0., 0.)):
+  """Render PathPieces onto a new surface of the given size and return it"""
+  initHeadless()
+  setCamera(size, azimuth, elevation, zoom, cameraPosition)
+  surface = LevelEditor.render_background()
+  for o in objects:
+    o.render(True)
+    o.draw(surface)
+  return surface
+
+
+def loadSceneObjects(filename):
+  """PathPieces of a scene file, cached per process"""
+  if filename not in _sceneCache:
+    initHeadless()
+    _sceneCache[filename] = unshelveObjects(readScene(filename),
+                                            LevelEditor.PIECE_CLASSES)
+  return _sceneCache[filename]
+
+
+def renderSceneFile(filename, outfile, size=DEFAULT_SIZE,
+                    azimuth=DEFAULT_AZIMUTH, elevation=DEFAULT_ELEVATION,
+                    zoom=DEFAULT_ZOOM, cameraPosition=(0., 0., 0.)):
+  """Render a scene file to a PNG image. Returns (outfile, seconds taken)."""
+  start = time.time()
+  surface = renderScene(loadSceneObjects(filename), size, azimuth, elevation,
+                        zoom, cameraPosition)
+  pygame.image.save(surface, outfile)
+  return outfile, time.time()-start
+
+
+def renderSceneTask(filename, *args):
+  """renderSceneFile() in a worker process. Returns (outfile, seconds,
+  error), error being None or a message: exceptions are caught here, as
+  some (e.g. anydbm.error) cannot be pickled back to the main process."""
+  try:
+    return renderSceneFile(filename, *args) + (None,)
+  except Exception as e:
+    return None, 0., '%s: %s' % (e.__class__.__name__, e)
+
+
+def thumbnailPath(filename, outputDir, azimuth, elevation, tagAngles):
+  """Output file name; camera angles are included if several are rendered"""
+  directory, basename = os.path.split(filename)
+  stem = os.path.splitext(basename)[0]
+  if outputDir is not None:
+    directory = outputDir
+  if tagAngles:
+    stem = '%s_az%g_el%g' % (stem, azimuth, elevation)
+  return os.path.join(directory, stem+'.png')
+
+#_______________________________________________________________________
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+             description='Render Mayday scene files to PNG images')
+  parser.add_argument('files', nargs='+', metavar='FILE',
+                      help='.shelve or .json scene files')
+  parser.add_argument('-s', '--size', default='%dx%d' % DEFAULT_SIZE,
+                      help='image size WIDTHxHEIGHT (default: %(default)s)')
+  parser.add_argument('-a', '--azimuth', type=float, nargs='+',
+                      default=[DEFAULT_AZIMUTH], help='azimuth angle(s)')
+  parser.add_argument('-e', '--elevation', type=float, nargs='+',
+                      default=[DEFAULT_ELEVATION], help='elevation angle(s)')
+  parser.add_argument('-z', '--zoom', type=float, default=DEFAULT_ZOOM)
+  parser.add_argument('-c', '--camera', type=float, nargs=3,
+                      default=[0., 0., 0.], metavar=('X', 'Y', 'Z'),
+                      help='camera position (CAMERA_POSITION)')
+  parser.add_argument('-o', '--output-dir', default=None,
+                      help='write images here instead of next to the inputs')
+  parser.add_argument('-j', '--jobs', type=int, default=None,
+                      help='number of worker processes (default: CPU count)')
+  args = parser.parse_args(argv)
+
+  size = tuple(int(v) for v in args.size.lower().split('x'))
+  if args.output_dir is not None and not os.path.isdir(args.output_dir):
+    os.makedirs(args.output_dir)
+  tagAngles = len(args.azimuth) > 1 or len(args.elevation) > 1
+
+  failed = 0
+  with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+    tasks = []
+    # Files vary slowest, so that one worker tends to get all angles of a file
+    for filename in args.files:
+      for azimuth in args.azimuth:
+        for elevation in args.elevation:
+          outfile = thumbnailPath(filename, args.output_dir,
+                                  azimuth, elevation, tagAngles)
+          tasks.append((filename,
+                        executor.submit(renderSceneTask, filename, outfile,
+                                        size, azimuth, elevation, args.zoom,
+                                        args.camera)))
+    for filename, future in tasks:
+      try:
+        outfile, seconds, error = future.result()
+      except Exception as e:
+        outfile, seconds, error = None, 0., '%s: %s' % (e.__class__.__name__,
+                                                       e)
+      if error is None:
+        print('%-40s -> %s (%.1f ms)' % (filename, outfile, 1000.*seconds))
+      else:
+        print('%-40s ERROR (%s)' % (filename, error))
+        failed += 1
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
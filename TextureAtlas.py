@@ -0,0 +1,137 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Texture atlas for the GUI images.
+
+All GUI images (img/*.png, possibly replaced by rasterized SVGs of a higher
+resolution, see AssetBuild) are packed into a single surface. The packed image
+and a JSON index (image rectangles plus the path, modification time and size
+of every source file) are cached on disk per UI scale and rebuilt
+automatically whenever a source image is added, removed or changed. Images
+are handed out as subsurfaces of the atlas, so start-up reads one file
+instead of dozens.
+"""
+
+import json, os
+import pygame
+
+# Width of the atlas surface at scale 1; images are packed into rows ("shelves")
+ATLAS_WIDTH = 512
+# Free pixels around each image
+ATLAS_PADDING = 1
+INDEX_VERSION = 2
+
+
+def imageSources(sourceDir):
+  """All PNGs in sourceDir, as {image name: path}"""
+  sources = {}
+  for filename in os.listdir(sourceDir):
+    name, ext = os.path.splitext(filename)
+    if ext.lower() == '.png':
+      sources[name] = os.path.join(sourceDir, filename)
+  return sources
+
+
+def sourceStamps(sources):
+  """Path, modification time and size of every source image, by name"""
+  stamps = {}
+  for name, path in sources.items():
+    stat = os.stat(path)
+    stamps[name] = [path, stat.st_mtime, stat.st_size]
+  return stamps
+
+
+def packRectangles(sizes, width=ATLAS_WIDTH, padding=ATLAS_PADDING):
+  """Shelf-pack images given as {name: (w, h)}. Returns the rectangles
+  {name: [x, y, w, h]} and the total height needed."""
+  rects = {}
+  x = y = shelfHeight = 0
+  # Tallest images first keeps the shelves tight
+  for name in sorted(sizes, key=lambda n: (-sizes[n][1], n)):
+    w, h = sizes[name]
+    if x > 0 and x + w + padding > width:
+      x, y, shelfHeight = 0, y + shelfHeight, 0
+    rects[name] = [x + padding, y + padding, w, h]
+    x += w + padding
+    shelfHeight = max(shelfHeight, h + padding)
+  return rects, y + shelfHeight + padding
+
+
+class TextureAtlas(object):
+  def __init__(self, surface, rects):
+    self.surface = surface
+    self.rects = rects
+    self.images = {}
+
+  def __contains__(self, name):
+    return name in self.rects
+
+  def image(self, name):
+    """The image <name> as a subsurface of the atlas"""
+    if name not in self.images:
+      self.images[name] = self.surface.subsurface(pygame.Rect(self.rects[name]))
+    return self.images[name]
+
+
+def scaleImage(img, size):
+  """Smoothly scale an image to size"""
+  # smoothscale needs 32 bit; palette PNGs are loaded with less
+  tmp = pygame.Surface(img.get_size(), pygame.SRCALPHA, 32)
+  tmp.blit(img, (0, 0))
+  return pygame.transform.smoothscale(tmp, size)
+
+
+def buildAtlas(sources, scale=1., renderings={}):
+  """Pack the source images, scaled by scale, into a new surface. For images
+  that also have a rendering of higher resolution (e.g. of their SVG), that
+  one is scaled instead. Returns (surface, rects)."""
+  images = {}
+  for name, path in sources.items():
+    img = pygame.image.load(path)
+    if scale != 1. or name in renderings:
+      size = (int(round(img.get_width()*scale)),
+              int(round(img.get_height()*scale)))
+      if name in renderings:
+        img = pygame.image.load(renderings[name])
+      if img.get_size() != size:
+        img = scaleImage(img, size)
+    images[name] = img
+  width = max([int(ATLAS_WIDTH*scale)] +
+              [img.get_width() + 2*ATLAS_PADDING for img in images.values()])
+  rects, height = packRectangles(dict((name, img.get_size())
+                                      for name, img in images.items()), width)
+  surface = pygame.Surface((width, max(1, height)), pygame.SRCALPHA, 32)
+  surface.fill((0, 0, 0, 0))
+  for name, img in images.items():
+    surface.blit(img, rects[name][:2])
+  return surface, rects
+
+
+def loadAtlas(sources, cacheDir, scale=1., renderings={}):
+  """Load the cached atlas of the source images ({name: path}) at a UI scale,
+  (re)building it if it is outdated. renderings ({name: path}) are used in
+  place of the scaled source images."""
+  imagePath = os.path.join(cacheDir, 'atlas@%gx.png' % scale)
+  indexPath = os.path.join(cacheDir, 'atlas@%gx.json' % scale)
+  stamps = {'sources': sourceStamps(sources),
+            'renderings': sourceStamps(renderings)}
+  try:
+    with open(indexPath) as f:
+      index = json.load(f)
+    if index.get('version') == INDEX_VERSION and index['stamps'] == stamps:
+      surface = pygame.image.load(imagePath)
+      return TextureAtlas(surface.convert_alpha(), index['rects'])
+  except (IOError, OSError, ValueError, KeyError, pygame.error):
+    pass
+  surface, rects = buildAtlas(sources, scale, renderings)
+  try:
+    if not os.path.isdir(cacheDir):
+      os.makedirs(cacheDir)
+    pygame.image.save(surface, imagePath)
+    with open(indexPath, 'w') as f:
+      json.dump({'version': INDEX_VERSION, 'stamps': stamps, 'rects': rects},
+                f, indent=1, sort_keys=True)
+  except (IOError, OSError, pygame.error):
+    # A read-only installation simply does without the cache
+    pass
+  return TextureAtlas(surface.convert_alpha(), rects)
@@ -0,0 +1,252 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Aircraft traffic along Paths.
+
+A MoverEngine moves any number of aircraft ("movers") along the PathPieces of
+a level. All mover state lives in NumPy arrays (struct of arrays): path,
+piece, distance along the piece, speed and direction of travel. step()
+advances every mover at once and hands those that ran off a piece over to the
+piece joined at that end (see PathNetwork.PathGraph); positions() returns all
+world positions in one array, orientations() their frames (see
+PathPieceGeometry.frames()).
+
+To make the bulk lookups a single numpy.interp call, the arc length tables
+of all pieces are laid end to end on one global distance axis, each piece
+followed by a small gap so that interpolation never blends two pieces.
+
+conflictPairs() finds all pairs of aircraft closer than a separation
+distance: a uniform 3D grid of separation-sized cells (a spatial hash, built
+anew from the position array every tick) limits the candidate pairs to
+neighbouring cells, whose distances are then checked in one vectorized pass.
+
+Like PathGeometry this module does not use pygame; it needs NumPy.
+"""
+
+import numpy as np
+
+from PathGeometry import orthonormalFrames
+from PathNetwork import PathGraph
+
+# Space between two pieces on the global distance axis
+PIECE_GAP = 1.
+# A mover may pass at most this many pieces within one step
+MAX_HANDOFFS = 8
+
+# Neighbouring grid cells searched for partners of a point, as (dx, dy)
+# columns of three cells dz = -1, 0, 1 (consecutive cell keys). Together with
+# the cell above the point's own, these are the 13 neighbours
+# lexicographically after it, so every pair of cells is visited once.
+NEIGHBOUR_COLUMNS = [(0, 1), (1, -1), (1, 0), (1, 1)]
+
+#_______________________________________________________________________
+
+
+class MoverEngine(object):
+  """@class MoverEngine
+  Movers on a fixed set of PathPieces. Call compileNetwork() again after
+  pieces were edited (the movers keep their piece index and distance).
+  """
+  def __init__(self, pieces, graph=None):
+    self.path      = np.zeros(0, np.int32)
+    self.piece     = np.zeros(0, np.int32)
+    self.distance  = np.zeros(0)
+    self.speed     = np.zeros(0)
+    self.direction = np.zeros(0, np.int8)
+    # Movers that reached an open end stop there
+    self.active    = np.zeros(0, bool)
+    self.compileNetwork(pieces, graph)
+
+  def __len__(self):
+    return len(self.piece)
+
+  def compileNetwork(self, pieces, graph=None):
+    """Build the lookup tables for the pieces. graph gives the joins between
+    them; without one, a PathGraph of just these pieces is made."""
+    if graph is None:
+      graph = PathGraph()
+      graph.setPieces(pieces)
+    self.pieces = list(pieces)
+    self.pieceIndex = dict((p, i) for i, p in enumerate(self.pieces))
+    n = len(self.pieces)
+
+    self.offsets = np.zeros(n)
+    self.lengths = np.zeros(n)
+    knots, samples, frames = [], [], []
+    offset = 0.
+    for i, p in enumerate(self.pieces):
+      table, points = p.sampleArrays()
+      tangents, normals, banks = p.frames()
+      self.offsets[i] = offset
+      self.lengths[i] = table[-1]
+      knots.append(table + offset)
+      samples.append(points + (p.center.x, p.center.y, p.center.z))
+      frames.append(np.column_stack((tangents, normals, banks)))
+      offset += table[-1] + PIECE_GAP
+    self.knots = np.concatenate(knots) if knots else np.zeros(0)
+    samples = np.concatenate(samples) if samples else np.zeros((0, 3))
+    self.sampleX = np.ascontiguousarray(samples[:, 0])
+    self.sampleY = np.ascontiguousarray(samples[:, 1])
+    self.sampleZ = np.ascontiguousarray(samples[:, 2])
+    # Tangent, normal and bank angle at each sample, one column each
+    frames = np.concatenate(frames) if frames else np.zeros((0, 7))
+    self.frameColumns = [np.ascontiguousarray(frames[:, k]) for k in range(7)]
+
+    # Successor of every piece end: the piece and the end at which a mover
+    # leaving through it enters (-1: open end)
+    self.nextPiece = np.full((n, 2), -1, np.int32)
+    self.nextEnd = np.zeros((n, 2), np.int8)
+    for i, p in enumerate(self.pieces):
+      for end in (0, 1):
+        joined = sorted((self.pieceIndex[q], e)
+                        for q, e in graph.joinedEnds((p, end))
+                        if q in self.pieceIndex)
+        if joined:
+          self.nextPiece[i, end], self.nextEnd[i, end] = joined[0]
+    self.pathOfPiece = np.array([graph.circuitNumber(p) for p in self.pieces],
+                                np.int32)
+    self.path = self.pathOfPiece[self.piece]
+
+  def addMovers(self, pieces, distances=0., speeds=1., directions=1):
+    """Add movers on the given pieces (objects or indices). Distances are
+    arc lengths from the pieces' first samples, directions +1 (towards the
+    last sample) or -1. Returns the indices of the new movers."""
+    if not isinstance(pieces, (list, tuple, np.ndarray)):
+      pieces = [pieces]
+    pieces = np.array([self.pieceIndex.get(p, p) for p in pieces], np.int32)
+    count = len(pieces)
+    first = len(self)
+    self.piece     = np.concatenate((self.piece, pieces))
+    self.path      = np.concatenate((self.path, self.pathOfPiece[pieces]))
+    self.distance  = np.concatenate((self.distance,
+                                     np.broadcast_to(distances, count)))
+    self.speed     = np.concatenate((self.speed,
+                                     np.broadcast_to(speeds, count)))
+    self.direction = np.concatenate((self.direction,
+                                     np.broadcast_to(directions, count)
+                                       .astype(np.int8)))
+    self.active    = np.concatenate((self.active, np.ones(count, bool)))
+    return np.arange(first, first+count)
+
+  def removeMovers(self, which):
+    """Remove movers given by indices or a boolean mask"""
+    keep = np.ones(len(self), bool)
+    keep[which] = False
+    for name in ('path', 'piece', 'distance', 'speed', 'direction', 'active'):
+      setattr(self, name, getattr(self, name)[keep])
+
+  def step(self, dt):
+    """Advance all movers by dt time units"""
+    active = self.active
+    self.distance += np.where(active, self.direction*self.speed*dt, 0.)
+    for handoff in range(MAX_HANDOFFS):
+      length = self.lengths[self.piece]
+      over = self.distance > length
+      leaving = over | (self.distance < 0.)
+      leaving &= active
+      if not leaving.any():
+        return
+      idx = np.nonzero(leaving)[0]
+      end = over[idx].astype(np.int32)
+      excess = np.where(end == 1, self.distance[idx]-length[idx],
+                                  -self.distance[idx])
+      nextPiece = self.nextPiece[self.piece[idx], end]
+      enterAtStart = self.nextEnd[self.piece[idx], end] == 0
+
+      # Open ends: stop there
+      dead = nextPiece < 0
+      if dead.any():
+        d = idx[dead]
+        self.distance[d] = np.where(end[dead] == 1, length[d], 0.)
+        active[d] = False
+
+      live = ~dead
+      j = idx[live]
+      nextPiece = nextPiece[live]
+      enterAtStart = enterAtStart[live]
+      self.piece[j] = nextPiece
+      self.path[j] = self.pathOfPiece[nextPiece]
+      self.distance[j] = np.where(enterAtStart, excess[live],
+                                  self.lengths[nextPiece]-excess[live])
+      self.direction[j] = np.where(enterAtStart, 1, -1)
+    # Movers still overshooting after MAX_HANDOFFS wait at the end
+    np.clip(self.distance, 0., self.lengths[self.piece], out=self.distance)
+
+  def positions(self):
+    """World positions of all movers (N x 3 array)"""
+    g = self.offsets[self.piece] + self.distance
+    result = np.empty((len(g), 3))
+    result[:, 0] = np.interp(g, self.knots, self.sampleX)
+    result[:, 1] = np.interp(g, self.knots, self.sampleY)
+    result[:, 2] = np.interp(g, self.knots, self.sampleZ)
+    return result
+
+  def orientations(self):
+    """Directions of flight (N x 3), normals (N x 3) and bank angles (N)
+    of all movers; movers flying a piece backwards bank the other way"""
+    g = self.offsets[self.piece] + self.distance
+    columns = [np.interp(g, self.knots, c) for c in self.frameColumns]
+    tangents, normals = orthonormalFrames(np.column_stack(columns[0:3]),
+                                          np.column_stack(columns[3:6]))
+    tangents *= self.direction[:, np.newaxis]
+    return tangents, normals, columns[6]*self.direction
+
+  def conflicts(self, separation, positions=None):
+    """Pairs of active movers closer than separation, see conflictPairs().
+    Pass this tick's positions() if they are at hand already."""
+    if positions is None:
+      positions = self.positions()
+    return conflictPairs(positions, separation, self.active)
+
+
+def conflictPairs(positions, separation, mask=None):
+  """Index pairs (i, j), i < j, of all points (N x 3 array) closer than
+  separation, as an M x 2 array. If mask is given, only points where it
+  is True are considered."""
+  positions = np.asarray(positions, dtype=float)
+  ids = np.arange(len(positions)) if mask is None else np.nonzero(mask)[0]
+  points = positions[ids]
+  n = len(points)
+  if n < 2:
+    return np.zeros((0, 2), np.intp)
+
+  # Broad phase: spatial hash with cells of the size of the separation.
+  # Cells are numbered row by row and the points sorted by cell, so that the
+  # points of a run of cells are one slice of the sorted points.
+  cells = np.floor(points/separation).astype(np.int64)
+  cells -= cells.min(axis=0) - 1
+  span = cells.max(axis=0) + 2
+  keys = (cells[:, 0]*span[1] + cells[:, 1])*span[2] + cells[:, 2]
+  order = np.argsort(keys)
+  keys = keys[order]
+  points = points[order]
+  ids = ids[order]
+
+  # The point's own cell (points after it only) and the cell above, then
+  # the neighbour columns
+  ranges = [(np.arange(1, n+1), np.searchsorted(keys, keys+1, 'right'))]
+  for dx, dy in NEIGHBOUR_COLUMNS:
+    column = keys + (dx*span[1] + dy)*span[2]
+    ranges.append((np.searchsorted(keys, column-1, 'left'),
+                   np.searchsorted(keys, column+1, 'right')))
+  first, second = [], []
+  for lo, hi in ranges:
+    counts = hi - lo
+    total = counts.sum()
+    if total == 0:
+      continue
+    # Expand to one entry per candidate pair
+    first.append(np.repeat(np.arange(n), counts))
+    starts = np.cumsum(counts) - counts
+    second.append(np.repeat(lo - starts, counts) + np.arange(total))
+  if not first:
+    return np.zeros((0, 2), np.intp)
+  i = np.concatenate(first)
+  j = np.concatenate(second)
+
+  # Narrow phase
+  d = points[i] - points[j]
+  close = (d*d).sum(axis=1) < separation*separation
+  pairs = np.column_stack((ids[i[close]], ids[j[close]]))
+  pairs.sort(axis=1)
+  return pairs
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Micro-benchmarks for Point3D.
+
+Times the operators and the fused operations against the operator
+expressions they replace (axpy: p += a*q, lerp: p + (q-p)*t, project: the
+editor's projection of c - camera), plus construction, pickling and the
+memory taken by one point. Reported are the best times per operation of
+several runs.
+
+Usage: python benchmarks/point3d.py [LOOPS]
+"""
+
+import os, sys, pickle, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PathGeometry import Point3D
+
+REPEAT = 5
+
+SETUP = '''
+from PathGeometry import Point3D
+p, q = Point3D(1., 2., 3.), Point3D(4., 5., 6.)
+eye = Point3D(10., 20., 30.)
+xAxis, yAxis, scale = (.7, .7, 0.), (-.35, .35, .87), 2.
+'''
+
+# (name, statement); a fused operation follows the expression it replaces
+CASES = [
+  ('Point3D(x, y, z)',    'Point3D(1., 2., 3.)'),
+  ('Point3D.copy(p)',     'Point3D.copy(p)'),
+  ('p + q',               'p + q'),
+  ('p - q',               'p - q'),
+  ('p * 2.',              'p * 2.'),
+  ('p / 2',               'p / 2'),
+  ('p += q',              'p += q'),
+  ('p.norm()',            'p.norm()'),
+  ('p += .5*q',           'p += .5*q'),
+  ('p.axpy(.5, q)',       'p.axpy(.5, q)'),
+  ('p + (q-p)*.3',        'p + (q-p)*.3'),
+  ('p.lerp(q, .3)',       'p.lerp(q, .3)'),
+  ('projection by ops',   '''c = Point3D.copy(p) - eye
+r = [(c.x*xAxis[0] + c.y*xAxis[1] + c.z*xAxis[2])*scale + 400,
+     (c.x*yAxis[0] + c.y*yAxis[1] + c.z*yAxis[2])*scale + 300]'''),
+  ('p.project(...)',      'p.project(eye, xAxis, yAxis, scale, (400, 300))'),
+  ('pickle round trip',   'pickle.loads(pickle.dumps(p, 2))'),
+]
+
+
+def main():
+  loops = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+  for name, statement in CASES:
+    times = timeit.repeat(statement, 'import pickle' + SETUP,
+                          repeat=REPEAT, number=loops)
+    print('%-20s %8.1f ns' % (name, 1e9*min(times)/loops))
+  p = Point3D(1., 2., 3.)
+  size = sys.getsizeof(p) + (sys.getsizeof(p.__dict__)
+                             if hasattr(p, '__dict__') else 0)
+  print('%-20s %8d bytes' % ('one Point3D', size))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Start-up benchmark for the Level Editor and the geometry module.
+
+Every measurement runs in a fresh interpreter, so module import costs are
+included. Reported are the best and median wall clock times of several runs,
+whether pygame/gtk got imported, and how many images were loaded.
+
+Usage: python benchmarks/startup.py [RUNS]
+"""
+
+import json, os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each snippet prints a JSON dictionary with at least the key "seconds"
+SNIPPETS = [
+  ('import PathGeometry', '''
+import sys, time
+t = time.time()
+import PathGeometry
+seconds = time.time()-t
+'''),
+  ('import LevelEditor', '''
+import sys, time
+t = time.time()
+import LevelEditor
+seconds = time.time()-t
+'''),
+  ('editor start-up (no main loop)', '''
+import sys, time
+t = time.time()
+import pygame
+loads = [0]
+_load = pygame.image.load
+def countingLoad(*args):
+  loads[0] += 1
+  return _load(*args)
+pygame.image.load = countingLoad
+import LevelEditor
+pygame.init()
+pygame.display.set_mode(LevelEditor.WINDOW_SIZE)
+LevelEditor.render_background()
+LevelEditor.makeGUIButtons()
+LevelEditor.prerenderMarkers()
+for o in LevelEditor.objectsList:
+  o.draw(pygame.display.get_surface())
+seconds = time.time()-t
+extra['images loaded'] = loads[0]
+'''),
+]
+
+FOOTER = '''
+extra['pygame'] = 'pygame' in sys.modules
+extra['gtk'] = 'gtk' in sys.modules
+extra['seconds'] = seconds
+print(json.dumps(extra))
+'''
+
+
+def measure(snippet):
+  """Run a snippet in a fresh interpreter and return its result dictionary"""
+  code = 'import json\nextra = {}\n' + snippet + FOOTER
+  env = dict(os.environ, SDL_VIDEODRIVER='dummy')
+  output = subprocess.check_output([sys.executable, '-c', code],
+                                   cwd=ROOT, env=env)
+  return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+  runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+  for title, snippet in SNIPPETS:
+    results = [measure(snippet) for i in range(runs)]
+    times = sorted([r['seconds'] for r in results])
+    info = ', '.join(['%s: %s' % (k, v) for k, v in sorted(results[0].items())
+                                       if k != 'seconds'])
+    print('%-32s best %7.1f ms  median %7.1f ms  (%s)' %
+          (title, 1000.*times[0], 1000.*times[len(times)//2], info))
+
+
+if __name__ == '__main__':
+  main()
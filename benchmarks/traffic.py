@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Tick benchmark for the aircraft traffic engine.
+
+Movers are spread over a closed circuit of BezierArcs and
+Straights; every tick advances all of them (Traffic.MoverEngine.step) and
+fetches their world positions (positions()). Separately, the separation
+conflict check (Traffic.conflictPairs) is timed on movers spread over a
+20 x 20 x 3 km airspace. Reported are the best and median times per tick;
+a 30 Hz game has 33 ms per tick.
+
+Usage: python benchmarks/traffic.py [MOVERS...]
+"""
+
+import os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PathGeometry import Point3D, StraightGeometry, BezierArcGeometry
+from Traffic import MoverEngine, conflictPairs
+
+TICKS = 100
+DT = 1./30.
+SEPARATION = 50.
+
+
+def makeCircuit(corners=32, radius=2000.):
+  """A closed polygon of alternating Straights and BezierArcs"""
+  pieces = []
+  for i in range(corners):
+    a = 2.*np.pi*i/corners
+    b = 2.*np.pi*(i+1)/corners
+    p = Point3D(radius*np.cos(a), radius*np.sin(a), 100.*(i % 2))
+    q = Point3D(radius*np.cos(b), radius*np.sin(b), 100.*((i+1) % 2))
+    half = (q-p)/2.
+    if i % 2:
+      piece = StraightGeometry(Point3D()-half, half)
+    else:
+      bulge = Point3D(-half.y, half.x, 0.)*.5
+      piece = BezierArcGeometry(Point3D()-half, half, bulge, bulge)
+    piece.moveTo((p+q)/2.)
+    pieces.append(piece)
+  return pieces
+
+
+def measure(function, ticks=TICKS):
+  times = []
+  for i in range(ticks):
+    t = time.time()
+    function()
+    times.append(time.time()-t)
+  return sorted(times)
+
+
+def report(title, count, times):
+  print('%-10s %6d movers  best %6.2f ms  median %6.2f ms per tick' %
+        (title, count, 1000.*times[0], 1000.*times[len(times)//2]))
+
+
+def main():
+  counts = [int(a) for a in sys.argv[1:]] or [1000, 2000, 5000, 10000]
+  pieces = makeCircuit()
+  t = time.time()
+  engine = MoverEngine(pieces)
+  print('compiled %d pieces in %.1f ms' % (len(pieces), 1000.*(time.time()-t)))
+  rng = np.random.RandomState(0)
+  for count in counts:
+    engine.removeMovers(slice(None))
+    pieceIds = rng.randint(len(pieces), size=count)
+    engine.addMovers(pieceIds,
+                     rng.rand(count)*engine.lengths[pieceIds],
+                     rng.uniform(100., 300., count),
+                     rng.choice([-1, 1], count))
+    def tick():
+      engine.step(DT)
+      engine.positions()
+    report('traffic', count, measure(tick))
+  for count in counts:
+    positions = rng.rand(count, 3)*(20000., 20000., 3000.)
+    report('conflicts', count,
+           measure(lambda: conflictPairs(positions, SEPARATION)))
+
+
+if __name__ == '__main__':
+  main()